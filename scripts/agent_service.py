@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Resident agent service with a pool of pre-initialized FinRobot agents.
+
+Every runner script pays for importing autogen, registering API keys,
+parsing OAI_CONFIG_LIST and constructing agents before any work starts.
+This service does that once: it keeps pre-built AnnualReportAnalyzer,
+TradeStrategist, RAGAgent and FinGPTForecaster instances in per-type pools
+and answers jobs over a local HTTP (or Unix-socket) API. Each job checks
+an agent out of its pool, resets its conversation state, runs the query on
+a worker thread and returns the agent to the pool. Jobs only take a worker
+thread once an agent of their type is free, so a burst for one agent type
+queues behind that type's pool instead of occupying every worker.
+
+Usage:
+    python agent_service.py serve --port 8766 --pool-size 2
+    python agent_service.py ask trade_strategist "Develop a trading strategy for AAPL" --symbol AAPL
+
+API:
+    POST /v1/jobs     {"agent": "trade_strategist", "query": "...", "symbol": "AAPL", "wait": true, "timeout": 600}
+                      (202 with the job state if it is not done within timeout seconds)
+    GET  /v1/jobs/ID  status and response of a submitted job
+    GET  /v1/jobs/ID/events
+                      Server-sent events: the job's LLM tokens as they are generated
+                      (from the moment of connection), then the job record
+    GET  /health      pool sizes and job counts
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from datetime import datetime, timedelta
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+from token_stream import get_stream, tagged
+
+# Add parent directory to path to import finrobot modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+logger = logging.getLogger(__name__)
+
+# Agent type -> (module under finrobot.agents, class name, agent name)
+AGENT_TYPES = {
+    "annual_report_analyzer": ("annual_report_analyzer", "AnnualReportAnalyzer", "Annual_Report_Analyzer"),
+    "trade_strategist": ("trade_strategist", "TradeStrategist", "Trade_Strategist"),
+    "rag_agent": ("rag_agent", "RAGAgent", "Financial_RAG_Agent"),
+    "fingpt_forecaster": ("fingpt_forecaster", "FinGPTForecaster", "FinGPT_Forecaster"),
+}
+
+# Finished jobs kept for GET /v1/jobs/ID
+MAX_FINISHED_JOBS = 1000
+
+
+def import_agent(module_name, class_name):
+    """Import a FinRobot agent class from the installed package or the FinRobot checkout."""
+    try:
+        module = __import__(f"finrobot.agents.{module_name}", fromlist=[class_name])
+    except ImportError:
+        module = __import__(f"FinRobot.finrobot.agents.{module_name}", fromlist=[class_name])
+    return getattr(module, class_name)
+
+
+def load_llm_config():
+    """Register API keys and build the llm_config the runner scripts use."""
+    import autogen
+    from FinRobot.finrobot.utils import register_keys_from_json
+
+    register_keys_from_json(os.path.join(parent_dir, "FinRobot", "config_api_keys"))
+    return {
+        "config_list": autogen.config_list_from_json(
+            "OAI_CONFIG_LIST",
+            file_location=os.path.join(parent_dir, "FinRobot"),
+            filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
+        ),
+        "timeout": 120,
+        "temperature": 0,
+    }
+
+
+def reset_agent(agent):
+    """Clear the conversation state of a FinRobot agent and its inner autogen agents."""
+    for inner in (agent, getattr(agent, "assistant", None), getattr(agent, "user_proxy", None)):
+        if inner is not None and hasattr(inner, "reset"):
+            inner.reset()
+
+
+class AgentPool:
+    """Fixed-size pools of pre-built agents, one queue per agent type."""
+
+    def __init__(self, llm_config, pool_size=1, agent_types=None):
+        self.pools = {}
+        self.sizes = {}
+        for agent_type in agent_types or AGENT_TYPES:
+            module_name, class_name, agent_name = AGENT_TYPES[agent_type]
+            try:
+                agent_class = import_agent(module_name, class_name)
+            except ImportError as e:
+                logger.warning(f"{class_name} not available, not pooling it: {e}")
+                continue
+
+            pool = queue.Queue()
+            started = time.time()
+            for _ in range(pool_size):
+                pool.put(self._build(agent_type, agent_class, agent_name, llm_config))
+            self.pools[agent_type] = pool
+            self.sizes[agent_type] = pool_size
+            logger.info(f"Built {pool_size} {class_name} instance(s) in {time.time() - started:.2f}s")
+
+    @staticmethod
+    def _build(agent_type, agent_class, agent_name, llm_config):
+        agent = agent_class(agent_name, llm_config, human_input_mode="NEVER")
+        if agent_type == "trade_strategist":
+            from tool_registry import build_trade_tools
+            assistant = getattr(agent, "assistant", agent)
+            build_trade_tools().register_with_agents(assistant, agent.user_proxy)
+        elif agent_type == "rag_agent":
+            from tool_registry import build_rag_tools
+            assistant = getattr(agent, "assistant", agent)
+            build_rag_tools().register_with_agents(assistant, agent.user_proxy)
+        return agent
+
+    def checkout(self, agent_type, timeout=None):
+        if agent_type not in self.pools:
+            raise KeyError(f"Unknown or unavailable agent type '{agent_type}'. Available: {', '.join(self.pools)}")
+        agent = self.pools[agent_type].get(timeout=timeout)
+        reset_agent(agent)
+        return agent
+
+    def checkin(self, agent_type, agent):
+        reset_agent(agent)
+        self.pools[agent_type].put(agent)
+
+    def stats(self):
+        return {
+            agent_type: {"size": self.sizes[agent_type], "idle": pool.qsize()}
+            for agent_type, pool in self.pools.items()
+        }
+
+
+class AgentService:
+    """Runs jobs on pooled agents with a bounded worker pool."""
+
+    def __init__(self, pool, max_workers=4):
+        self.pool = pool
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-job")
+        self.jobs = {}
+        self._finished = []
+        # Agents of each type not yet promised to a job, and the jobs waiting for one
+        self._free = dict(pool.sizes)
+        self._waiting = {agent_type: deque() for agent_type in pool.pools}
+        self._lock = threading.Lock()
+
+    def submit(self, agent_type, query, symbol=None):
+        """Queue a job and return its id."""
+        if agent_type not in self.pool.pools:
+            raise KeyError(f"Unknown or unavailable agent type '{agent_type}'. Available: {', '.join(self.pool.pools)}")
+        job_id = uuid.uuid4().hex
+        job = {"id": job_id, "agent": agent_type, "status": "queued", "submitted": time.time(), "future": Future()}
+        with self._lock:
+            self.jobs[job_id] = job
+            start = self._free[agent_type] > 0
+            if start:
+                self._free[agent_type] -= 1
+            else:
+                self._waiting[agent_type].append((job, query, symbol))
+        if start:
+            self.executor.submit(self._run, job, query, symbol)
+        return job_id
+
+    def _release(self, agent_type):
+        """Hand the agent a finished job used to the next waiting job of its type."""
+        with self._lock:
+            waiting = self._waiting[agent_type]
+            next_job = waiting.popleft() if waiting else None
+            if next_job is None:
+                self._free[agent_type] += 1
+        if next_job is not None:
+            self.executor.submit(self._run, *next_job)
+
+    def _run(self, job, query, symbol):
+        try:
+            if symbol:
+                from prefetch import prefetch_symbol
+                current_date = datetime.now().strftime("%Y-%m-%d")
+                one_year_ago = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d")
+                one_month_ago = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+                prefetch_symbol(symbol, one_year_ago, current_date, news_start_date=one_month_ago)
+
+            # An agent of this type was reserved in submit(), so this does not wait;
+            # queue time covers both a free agent and a free worker
+            agent = self.pool.checkout(job["agent"])
+            job["started"] = time.time()
+            job["status"] = "running"
+            try:
+                with tagged(job["id"]):
+                    response = agent.chat(query)
+            finally:
+                self.pool.checkin(job["agent"], agent)
+            job["response"] = response if isinstance(response, str) else str(response)
+            job["status"] = "done"
+        except Exception as e:
+            logger.error(f"Job {job['id']} ({job['agent']}) failed: {e}")
+            job["error"] = str(e)
+            job["status"] = "failed"
+        finally:
+            job["finished"] = time.time()
+            job.setdefault("started", job["finished"])
+            with self._lock:
+                self._finished.append(job["id"])
+                while len(self._finished) > MAX_FINISHED_JOBS:
+                    self.jobs.pop(self._finished.pop(0), None)
+            job["future"].set_result(None)
+            self._release(job["agent"])
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        result = {k: v for k, v in job.items() if k != "future"}
+        if "started" in job:
+            result["queue_seconds"] = round(job["started"] - job["submitted"], 3)
+        if "finished" in job:
+            result["run_seconds"] = round(job["finished"] - job["started"], 3)
+        return result
+
+    def wait(self, job_id, timeout=None):
+        """Return the job record once it finishes; raises TimeoutError after timeout seconds."""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job["future"].result(timeout=timeout)
+        return self.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            statuses = [job["status"] for job in self.jobs.values()]
+            waiting = {agent_type: len(jobs) for agent_type, jobs in self._waiting.items() if jobs}
+        return {"pools": self.pool.stats(), "jobs": {s: statuses.count(s) for s in set(statuses)}, "waiting": waiting}
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            # address_string() fails for Unix-socket clients, so log without it
+            logger.debug(format % args)
+
+        def _send_json(self, status, payload):
+            data = json.dumps(payload, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_events(self, job_id):
+            """Stream the job's token events as server-sent events until it finishes."""
+            stream = get_stream()
+            if service.get(job_id) is None:
+                self._send_json(404, {"error": "Unknown job"})
+                return
+            if stream is None:
+                self._send_json(404, {"error": "Streaming is off (FINROBOT_STREAM)"})
+                return
+            events = queue.Queue()
+            callback = stream.subscribe(lambda event: events.put(event) if event.get("tag") == job_id else None)
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                while True:
+                    try:
+                        event = events.get(timeout=0.5)
+                    except queue.Empty:
+                        if service.get(job_id)["status"] in ("done", "failed"):
+                            break
+                        continue
+                    self.wfile.write(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(f"event: job\ndata: {json.dumps(service.get(job_id), default=str)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                logger.debug(f"Event stream client for job {job_id} disconnected")
+            finally:
+                stream.unsubscribe(callback)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/health":
+                self._send_json(200, service.stats())
+            elif self.path.startswith("/v1/jobs/") and self.path.rstrip("/").endswith("/events"):
+                self._send_events(self.path.rstrip("/").split("/")[-2])
+            elif self.path.startswith("/v1/jobs/"):
+                job = service.get(self.path.rsplit("/", 1)[-1])
+                self._send_json(200 if job else 404, job or {"error": "Unknown job"})
+            else:
+                self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/v1/jobs":
+                self._send_json(404, {"error": f"Unknown path {self.path}"})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                job_id = service.submit(body["agent"], body["query"], body.get("symbol"))
+            except (KeyError, ValueError) as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            if body.get("wait", True):
+                try:
+                    self._send_json(200, service.wait(job_id, timeout=body.get("timeout")))
+                except TimeoutError:
+                    # Still queued or running: the client polls GET /v1/jobs/ID
+                    self._send_json(202, service.get(job_id))
+            else:
+                self._send_json(202, service.get(job_id))
+
+    return Handler
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(host="127.0.0.1", port=8766, unix_socket=None, pool_size=1, max_workers=4, agent_types=None):
+    """Build the agent pools once and serve jobs until interrupted."""
+    import autogen  # noqa: F401  (imported once here rather than per request)
+    from runtime import install_runtime
+
+    started = time.time()
+    llm_config = load_llm_config()
+    # Tokens go to GET /v1/jobs/ID/events subscribers, not the server's console
+    install_runtime(console=False)
+    service = AgentService(AgentPool(llm_config, pool_size, agent_types), max_workers)
+    print(f"Agent pools ready in {time.time() - started:.2f}s: {service.pool.stats()}")
+
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        httpd = ThreadingUnixHTTPServer(unix_socket, make_handler(service))
+        print(f"Agent service listening on unix socket {unix_socket}")
+    else:
+        httpd = ThreadingHTTPServer((host, port), make_handler(service))
+        httpd.daemon_threads = True
+        print(f"Agent service listening on http://{host}:{port}")
+
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping agent service")
+    finally:
+        httpd.server_close()
+        service.executor.shutdown(wait=False)
+
+
+class _UnixHTTPConnection(HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def ask(agent_type, query, symbol=None, url="http://127.0.0.1:8766", unix_socket=None, timeout=None):
+    """
+    Submit a job to a running service and wait for the result.
+
+    Returns:
+    dict: Job record with status, response and timings
+    """
+    body = json.dumps({"agent": agent_type, "query": query, "symbol": symbol, "wait": True}).encode("utf-8")
+    if unix_socket:
+        connection = _UnixHTTPConnection(unix_socket, timeout=timeout)
+        connection.request("POST", "/v1/jobs", body, {"Content-Type": "application/json"})
+        return json.loads(connection.getresponse().read())
+    request = urllib.request.Request(f"{url}/v1/jobs", data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident FinRobot agent service")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Start the service")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8766)
+    serve_parser.add_argument("--socket", help="Listen on this Unix socket instead of TCP")
+    serve_parser.add_argument("--pool-size", type=int, default=1, help="Instances per agent type")
+    serve_parser.add_argument("--workers", type=int, default=4, help="Concurrent jobs")
+    serve_parser.add_argument("--agents", nargs="*", choices=sorted(AGENT_TYPES), help="Agent types to pool (default: all)")
+
+    ask_parser = subparsers.add_parser("ask", help="Send a query to a running service")
+    ask_parser.add_argument("agent", choices=sorted(AGENT_TYPES))
+    ask_parser.add_argument("query")
+    ask_parser.add_argument("--symbol", help="Prefetch data for this symbol before the agent runs")
+    ask_parser.add_argument("--url", default="http://127.0.0.1:8766")
+    ask_parser.add_argument("--socket", help="Connect through this Unix socket")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if args.command == "serve":
+        serve(args.host, args.port, args.socket, args.pool_size, args.workers, args.agents)
+        return
+
+    result = ask(args.agent, args.query, args.symbol, args.url, args.socket)
+    if result.get("status") == "done":
+        print(result["response"])
+        print(f"\n(queued {result.get('queue_seconds', 0):.2f}s, ran {result.get('run_seconds', 0):.2f}s)")
+    elif result.get("status") in ("queued", "running"):
+        print(f"Job {result['id']} is still {result['status']}; poll GET /v1/jobs/{result['id']}")
+    else:
+        print(f"Job {result.get('status')}: {result.get('error')}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
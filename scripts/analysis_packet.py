@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Deterministic per-symbol "analysis packet" for the first agent message.
+
+The Trade Strategist and FinGPT Forecaster normally spend several turns
+asking for price data, then indicators, then the company profile. This
+module computes everything they usually ask for in one pass over the price
+history (latest price and volume, SMA/EMA/RSI/MACD/Bollinger values,
+support and resistance levels, horizon returns, key fundamentals) and
+serializes it as a compact block that is placed in the first message, so
+most sessions need a single LLM turn.
+
+Usage:
+    from analysis_packet import packet_prompt
+    analysis_packet = packet_prompt("AAPL", one_year_ago, current_date)
+    query = f"{analysis_packet}\\n{query}"
+"""
+
+import json
+import logging
+
+import numpy as np
+
+from context_compaction import format_date, format_number, truncate_to_tokens
+from data_cache import cached_company_profile, cached_source_call, cached_stock_data, import_data_source
+from technical_indicators import atr, bollinger_bands, ema, macd, rsi, sma
+
+logger = logging.getLogger(__name__)
+
+# Trading-day lookbacks for the horizon returns
+HORIZONS = {"1w": 5, "1m": 21, "3m": 63, "6m": 126, "1y": 252}
+
+# Finnhub basic-financials metrics included in the packet, with short labels
+FUNDAMENTAL_METRICS = {
+    "marketCapitalization": "mcap_musd",
+    "peTTM": "pe_ttm",
+    "pbAnnual": "pb",
+    "epsTTM": "eps_ttm",
+    "revenueGrowthTTMYoy": "rev_growth_yoy_pct",
+    "netProfitMarginTTM": "net_margin_pct",
+    "roeTTM": "roe_pct",
+    "currentRatioAnnual": "current_ratio",
+    "totalDebt/totalEquityAnnual": "debt_to_equity",
+    "dividendYieldIndicatedAnnual": "div_yield_pct",
+    "beta": "beta",
+}
+
+PROFILE_TOKEN_BUDGET = 80
+
+
+def _last(series):
+    series = series.dropna()
+    return series.iloc[-1] if len(series) else np.nan
+
+
+def compute_price_metrics(stock_data):
+    """
+    Compute the technical section of the packet from an OHLCV DataFrame.
+
+    Parameters:
+    stock_data (DataFrame): Date-indexed frame with Close (and ideally
+        High, Low, Volume) columns
+
+    Returns:
+    dict: Ordered map of group name to {label: value}
+    """
+    close = stock_data["Close"].astype(float)
+    high = stock_data["High"].astype(float) if "High" in stock_data else close
+    low = stock_data["Low"].astype(float) if "Low" in stock_data else close
+    volume = stock_data["Volume"].astype(float) if "Volume" in stock_data else None
+
+    ema12 = ema(close, 12)
+    ema26 = ema(close, 26)
+    macd_values = macd(close)
+    rsi14 = rsi(close, 14)
+    bb = bollinger_bands(close)
+
+    last_close = close.iloc[-1]
+    price = {
+        "close": last_close,
+        "chg1d_pct": (close.iloc[-1] / close.iloc[-2] - 1) * 100 if len(close) > 1 else np.nan,
+    }
+    if volume is not None:
+        price["volume"] = volume.iloc[-1]
+        price["avgvol20"] = volume.tail(20).mean()
+
+    trend = {
+        "sma20": _last(bb["mid"]),
+        "sma50": _last(sma(close, 50)),
+        "sma200": _last(sma(close, 200)),
+        "ema12": ema12.iloc[-1],
+        "ema26": ema26.iloc[-1],
+    }
+    momentum = {
+        "rsi14": _last(rsi14),
+        "macd": macd_values["macd"].iloc[-1],
+        "macd_signal": macd_values["signal"].iloc[-1],
+        "macd_hist": macd_values["hist"].iloc[-1],
+    }
+    upper, lower = _last(bb["upper"]), _last(bb["lower"])
+    bands = {
+        "bb_upper": upper,
+        "bb_mid": _last(bb["mid"]),
+        "bb_lower": lower,
+        "pct_b": (last_close - lower) / (upper - lower) if upper != lower else np.nan,
+    }
+
+    pivot = (high.iloc[-1] + low.iloc[-1] + last_close) / 3
+    levels = {
+        "support20": low.tail(20).min(),
+        "resistance20": high.tail(20).max(),
+        "support60": low.tail(60).min(),
+        "resistance60": high.tail(60).max(),
+        "pivot": pivot,
+        "r1": 2 * pivot - low.iloc[-1],
+        "s1": 2 * pivot - high.iloc[-1],
+    }
+
+    returns = {
+        f"ret_{label}_pct": (last_close / close.iloc[-1 - days] - 1) * 100
+        for label, days in HORIZONS.items()
+        if len(close) > days
+    }
+    log_returns = np.log(close).diff()
+    risk = {
+        "vol20_ann_pct": log_returns.tail(20).std() * np.sqrt(252) * 100,
+        "atr14": _last(atr(high, low, close)),
+        "hi52w": high.tail(252).max(),
+        "lo52w": low.tail(252).min(),
+    }
+
+    return {
+        "price": price,
+        "trend": trend,
+        "momentum": momentum,
+        "bands": bands,
+        "levels": levels,
+        "returns": returns,
+        "risk": risk,
+    }
+
+
+def extract_fundamentals(basic_financials):
+    """
+    Pick the packet's fundamentals from a Finnhub basic-financials payload.
+
+    Parameters:
+    basic_financials (str or dict): JSON string or dict of metrics (either
+        the metric dict itself or {"metric": {...}})
+
+    Returns:
+    dict: {label: value} for the metrics that are present
+    """
+    if not basic_financials:
+        return {}
+    if isinstance(basic_financials, str):
+        try:
+            basic_financials = json.loads(basic_financials)
+        except json.JSONDecodeError:
+            return {}
+    metrics = basic_financials.get("metric", basic_financials)
+    return {
+        label: metrics[key]
+        for key, label in FUNDAMENTAL_METRICS.items()
+        if metrics.get(key) is not None
+    }
+
+
+def build_analysis_packet(symbol, stock_data, profile=None, basic_financials=None):
+    """
+    Build the packet for symbol.
+
+    Parameters:
+    symbol (str): Stock ticker symbol
+    stock_data (DataFrame): OHLCV price history (a year gives all horizons)
+    profile (str): Company profile text (optional)
+    basic_financials (str or dict): Finnhub basic financials (optional)
+
+    Returns:
+    dict: Packet with symbol, as_of date, metric groups and profile
+    """
+    stock_data = stock_data.dropna(subset=["Close"])
+    if len(stock_data) == 0:
+        raise ValueError(f"No price data available for {symbol}")
+
+    packet = {
+        "symbol": symbol.upper(),
+        "as_of": format_date(stock_data.index[-1]),
+        "bars": len(stock_data),
+        "groups": compute_price_metrics(stock_data),
+    }
+    fundamentals = extract_fundamentals(basic_financials)
+    if fundamentals:
+        packet["groups"]["fundamentals"] = fundamentals
+    if profile:
+        packet["profile"] = truncate_to_tokens(" ".join(str(profile).split()), PROFILE_TOKEN_BUDGET)
+    return packet
+
+
+def format_packet(packet):
+    """Serialize a packet as a compact, token-efficient text block."""
+    lines = [f"=== ANALYSIS PACKET {packet['symbol']} as of {packet['as_of']} ({packet['bars']} daily bars) ==="]
+    for group, values in packet["groups"].items():
+        fields = " ".join(
+            f"{label}={format_number(value)}"
+            for label, value in values.items()
+            if value is not None and value == value
+        )
+        if fields:
+            lines.append(f"{group}: {fields}")
+    if packet.get("profile"):
+        lines.append(f"profile: {packet['profile']}")
+    lines.append("=== END PACKET ===")
+    return "\n".join(lines)
+
+
+def load_analysis_packet(symbol, start_date, end_date):
+    """
+    Fetch the inputs through the shared data cache and return the packet text.
+
+    Missing fundamentals or profile data only shrink the packet; an empty
+    string is returned if no price data could be loaded, so callers can
+    always prepend the result to their query.
+    """
+    try:
+        stock_data = cached_stock_data(symbol, start_date, end_date)
+    except Exception as e:
+        logger.warning(f"Could not build analysis packet for {symbol}: {e}")
+        return ""
+
+    profile = None
+    basic_financials = None
+    try:
+        profile = cached_company_profile(symbol)
+    except Exception as e:
+        logger.warning(f"Company profile unavailable for {symbol}: {e}")
+    try:
+        FinnHubUtils = import_data_source("finnhub_utils", "FinnHubUtils")
+        basic_financials = cached_source_call(FinnHubUtils, "get_basic_financials", symbol)
+    except Exception as e:
+        logger.warning(f"Basic financials unavailable for {symbol}: {e}")
+
+    try:
+        return format_packet(build_analysis_packet(symbol, stock_data, profile, basic_financials))
+    except (KeyError, ValueError) as e:
+        logger.warning(f"Could not build analysis packet for {symbol}: {e}")
+        return ""
+
+
+def packet_prompt(symbol, start_date, end_date):
+    """
+    Return the packet plus a usage note for the first message, or "".
+
+    The note tells the agent to answer from the packet and only call tools
+    for data that is missing from it.
+    """
+    packet_text = load_analysis_packet(symbol, start_date, end_date)
+    if not packet_text:
+        return ""
+    return (
+        f"{packet_text}\n"
+        f"The analysis packet above already contains the latest price, technical indicators, "
+        f"support/resistance levels, returns and key fundamentals for {symbol.upper()}. "
+        f"Use these values directly and only call tools for data that is not in the packet.\n"
+    )
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Atomic file writes shared by the caches and stores under scripts/.
+
+atomic_write() writes through a temp file created with mkstemp in the
+target's directory and renames it over the target with os.replace, so
+readers never see a partial file and concurrent writers (threads or
+processes sharing the directory) never share a temp file. The last
+complete write wins; a failed write leaves the target untouched.
+
+Usage:
+    with atomic_write(path, "w") as f:
+        json.dump(state, f)
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, mode="wb"):
+    """
+    Open a temp file next to path and move it over path when the block ends.
+
+    Parameters:
+    path (str): File to write
+    mode (str): "w" for text (UTF-8) or "wb" for bytes
+
+    Returns:
+    file: The open temp file (a context manager)
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Local extractive summarizers for FinRobot nested chats.
+
+autogen's "reflection_with_llm" summary method spends one extra LLM call on
+every nested conversation. The functions in this module can be passed as the
+``summary_method`` of any nested chat instead: they select text from the
+conversation itself and never call a model.
+
+Usage:
+    executor.register_nested_chats(
+        [{
+            "sender": executor,
+            "recipient": annual_report_analyzer,
+            "message": ...,
+            "summary_method": extractive_summary,
+            "summary_args": {"max_tokens": 600, "mode": "auto"},
+        }],
+        trigger=...,
+    )
+"""
+
+import re
+
+from context_compaction import count_tokens, truncate_to_tokens
+
+DEFAULT_MAX_TOKENS = 600
+
+# Phrases agents use to signal the end of a conversation; they carry no content
+TERMINATION_PHRASES = ("TERMINATE", "ANALYSIS COMPLETE")
+
+# Words that usually mark the sentences an investment strategist cares about
+KEY_TERMS = (
+    "revenue", "income", "margin", "eps", "earnings", "cash flow", "debt",
+    "growth", "risk", "guidance", "outlook", "recommend", "buy", "sell", "hold",
+    "target", "stop-loss", "entry", "exit", "support", "resistance",
+    "rsi", "macd", "sma", "ema", "bollinger", "volatility",
+)
+
+_HEADING_RE = re.compile(r"^\s*(#{1,6}\s+|\*\*[^*]+\*\*\s*:?\s*$)")
+_NUMBER_RE = re.compile(r"[$€£]?\d[\d,]*(\.\d+)?\s*(%|[bmk]n?\b|billion|million)?", re.IGNORECASE)
+
+
+def strip_termination(text):
+    """Remove termination phrases that agents append to their final message."""
+    for phrase in TERMINATION_PHRASES:
+        text = text.replace(phrase, "")
+    return text.strip()
+
+
+def split_sections(text):
+    """
+    Split a message into sections.
+
+    A section starts at a markdown heading (or a bold "**Title:**" line) and
+    otherwise blocks are separated by blank lines.
+    """
+    sections = []
+    current = []
+    for line in text.splitlines():
+        if _HEADING_RE.match(line) and current:
+            sections.append("\n".join(current).strip())
+            current = []
+        if not line.strip():
+            if current:
+                sections.append("\n".join(current).strip())
+                current = []
+            continue
+        current.append(line)
+    if current:
+        sections.append("\n".join(current).strip())
+    return [section for section in sections if section]
+
+
+def score_section(section, position, total):
+    """
+    Score a section by how much concrete, decision-relevant content it holds.
+
+    Numbers and financial key terms count most; later sections get a small
+    bonus because conclusions and recommendations usually come last.
+    """
+    lowered = section.lower()
+    numbers = len(_NUMBER_RE.findall(section))
+    terms = sum(lowered.count(term) for term in KEY_TERMS)
+    heading_bonus = 1.0 if _HEADING_RE.match(section.splitlines()[0]) else 0.0
+    recency_bonus = position / max(total - 1, 1)
+    # Normalize by length so long boilerplate does not win on volume alone
+    density = (2.0 * numbers + 1.5 * terms) / max(count_tokens(section), 1) ** 0.5
+    return density + heading_bonus + recency_bonus
+
+
+def select_key_sections(texts, max_tokens):
+    """
+    Pick the highest scoring sections from texts that fit into max_tokens.
+
+    Parameters:
+    texts (list): Message contents in conversation order
+    max_tokens (int): Token budget for the summary
+
+    Returns:
+    str: Selected sections, in their original order
+    """
+    sections = [section for text in texts for section in split_sections(text)]
+    if not sections:
+        return ""
+
+    ranked = sorted(
+        range(len(sections)),
+        key=lambda i: score_section(sections[i], i, len(sections)),
+        reverse=True,
+    )
+
+    chosen = []
+    used = 0
+    for index in ranked:
+        cost = count_tokens(sections[index])
+        if used + cost > max_tokens:
+            continue
+        chosen.append(index)
+        used += cost
+
+    # Everything was too large on its own; fall back to the best section, cut down
+    if not chosen:
+        return truncate_to_tokens(sections[ranked[0]], max_tokens)
+
+    return "\n\n".join(sections[i] for i in sorted(chosen))
+
+
+def _recipient_messages(sender, recipient):
+    """Return the non-empty text messages the recipient sent in this chat."""
+    messages = sender.chat_messages_for_summary(recipient)
+    contents = []
+    for message in messages:
+        content = message.get("content")
+        if not isinstance(content, str) or not content.strip():
+            continue
+        name = message.get("name")
+        if name is not None and name != recipient.name:
+            continue
+        content = strip_termination(content)
+        if content:
+            contents.append(content)
+    return contents
+
+
+def extractive_summary(sender, recipient, summary_args=None):
+    """
+    autogen ``summary_method`` that summarizes a chat without an LLM call.
+
+    Parameters:
+    sender (ConversableAgent): Agent that initiated the chat
+    recipient (ConversableAgent): Agent whose replies are summarized
+    summary_args (dict): Optional settings
+        - max_tokens (int): Token cap for the summary (default: 600)
+        - mode (str): "last" returns the final reply, "sections" scores and
+          selects key sections across all replies, "auto" (default) returns
+          the final reply when it fits the cap and selects sections otherwise
+
+    Returns:
+    str: The summary
+    """
+    summary_args = summary_args or {}
+    max_tokens = summary_args.get("max_tokens", DEFAULT_MAX_TOKENS)
+    mode = summary_args.get("mode", "auto")
+
+    contents = _recipient_messages(sender, recipient)
+    if not contents:
+        return ""
+
+    last = contents[-1]
+    if mode == "last":
+        return truncate_to_tokens(last, max_tokens)
+    if mode == "auto" and count_tokens(last) <= max_tokens:
+        return last
+    if mode == "auto":
+        # The final reply is usually the full write-up; select from it first
+        return select_key_sections([last], max_tokens)
+    return select_key_sections(contents, max_tokens)
+
+
+def last_reply_summary(sender, recipient, summary_args=None):
+    """``summary_method`` that returns the recipient's final reply, capped."""
+    summary_args = dict(summary_args or {}, mode="last")
+    return extractive_summary(sender, recipient, summary_args)
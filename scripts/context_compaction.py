@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Token-budgeted context compaction for cross-agent handoffs.
+
+Handoff prompts (for example the annual report analysis pasted into the
+Trade Strategist query) and tool responses (raw DataFrame dumps) are the
+largest messages in a FinRobot conversation, and they are re-sent on every
+turn. This module counts tokens with tiktoken and condenses such messages
+into compact key-value summaries and statistics under a per-message budget.
+"""
+
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+DEFAULT_MODEL = "gpt-4o"
+
+# Per-message token budgets used by the runner scripts
+HANDOFF_TOKEN_BUDGET = 800
+TOOL_RESPONSE_TOKEN_BUDGET = 400
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+_HEADING_RE = re.compile(r"^\s*#{1,6}\s+(.*?)\s*$")
+_KEY_VALUE_RE = re.compile(r"^\s*(?:[-*+]\s+|\d+\.\s+)?\*\*(.+?):?\*\*:?\s*(.*)$")
+_BULLET_RE = re.compile(r"^\s*(?:[-*+]|\d+\.)\s+(.*)$")
+_NUMBER_RE = re.compile(r"\d")
+
+
+def _get_encoding(model):
+    """Return (and memoize) the tiktoken encoding for a model, or None."""
+    if model in _encodings:
+        return _encodings[model]
+
+    # Concurrent first calls (parallel tool calls, server threads) would all
+    # attempt the download otherwise
+    with _encodings_lock:
+        if model in _encodings:
+            return _encodings[model]
+
+        encoding = None
+        if tiktoken is not None:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                # tiktoken downloads its BPE files on first use; offline machines fall back
+                logger.warning(f"tiktoken encoding unavailable for {model}, estimating tokens: {e}")
+        else:
+            logger.warning("tiktoken is not installed, estimating tokens from text length")
+
+        _encodings[model] = encoding
+        return encoding
+
+
+def count_tokens(text, model=DEFAULT_MODEL):
+    """
+    Count the tokens in text for the given model.
+
+    Falls back to an estimate of four characters per token when tiktoken or
+    its encoding files are not available.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens, model=DEFAULT_MODEL):
+    """Cut text to at most max_tokens, preferring a sentence or line boundary."""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+
+    encoding = _get_encoding(model)
+    if encoding is None:
+        cut = text[:max_tokens * 4]
+    else:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+    boundary = max(cut.rfind("\n"), cut.rfind(". "))
+    if boundary > len(cut) // 2:
+        cut = cut[:boundary + 1]
+    return cut.rstrip() + " ..."
+
+
+def _shorten(value, max_words):
+    """
+    Keep the first sentence of value (or the first one with numbers), cut to
+    the max_words window that holds the most numbers.
+    """
+    sentences = re.split(r"(?<=[.!?])\s+", value.strip())
+    sentence = next((s for s in sentences if _NUMBER_RE.search(s)), sentences[0])
+    words = sentence.split()
+    if len(words) <= max_words:
+        return sentence
+
+    numeric = [1 if _NUMBER_RE.search(word) else 0 for word in words]
+    best_start = max(
+        range(len(words) - max_words + 1),
+        key=lambda start: (sum(numeric[start:start + max_words]), -start),
+    )
+    window = " ".join(words[best_start:best_start + max_words])
+    prefix = "... " if best_start else ""
+    return f"{prefix}{window} ..."
+
+
+def extract_key_values(text):
+    """
+    Parse a markdown analysis into (section, key, value) entries.
+
+    Headings become sections, "**Key:** value" lines become key-value pairs
+    and plain bullets become values without a key.
+    """
+    entries = []
+    section = ""
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        heading = _HEADING_RE.match(line)
+        if heading:
+            section = heading.group(1).strip("#* ").strip()
+            continue
+        key_value = _KEY_VALUE_RE.match(line)
+        if key_value:
+            entries.append((section, key_value.group(1).strip(), key_value.group(2).strip()))
+            continue
+        bullet = _BULLET_RE.match(line)
+        if bullet:
+            entries.append((section, "", bullet.group(1).strip()))
+    return entries
+
+
+def _render_entries(entries, max_words):
+    lines = []
+    current_section = None
+    for section, key, value in entries:
+        if section != current_section:
+            if section:
+                lines.append(f"[{section}]")
+            current_section = section
+        value = _shorten(value, max_words) if value else ""
+        lines.append(f"{key}: {value}" if key else f"- {value}")
+    return "\n".join(lines)
+
+
+def condense_analysis(text, max_tokens=HANDOFF_TOKEN_BUDGET, model=DEFAULT_MODEL):
+    """
+    Condense an agent's analysis into a structured key-value summary.
+
+    Text that already fits the budget is returned unchanged. Otherwise the
+    markdown structure is converted to "[Section]" / "Key: value" lines with
+    progressively shorter values until the budget is met.
+
+    Parameters:
+    text (str): Analysis text handed from one agent to another
+    max_tokens (int): Token budget for the condensed text
+    model (str): Model whose tokenizer is used for counting
+
+    Returns:
+    str: Condensed text within max_tokens
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return text
+
+    entries = extract_key_values(text)
+    if not entries:
+        # Unstructured prose: keep the most informative sections instead
+        from chat_summary import select_key_sections
+        return select_key_sections([text], max_tokens)
+
+    for max_words in (40, 25, 15, 8):
+        condensed = _render_entries(entries, max_words)
+        if count_tokens(condensed, model) <= max_tokens:
+            return condensed
+
+    # Still too long: drop entries without figures, earliest first, keeping
+    # the closing sections (outlook, recommendations) as long as possible
+    droppable = sorted(
+        range(len(entries)),
+        key=lambda i: (bool(_NUMBER_RE.search(entries[i][2])), i),
+    )
+    kept = set(range(len(entries)))
+    for index in droppable:
+        if len(kept) == 1:
+            break
+        kept.discard(index)
+        condensed = _render_entries([entries[i] for i in sorted(kept)], max_words)
+        if count_tokens(condensed, model) <= max_tokens:
+            return condensed
+    return truncate_to_tokens(condensed, max_tokens, model)
+
+
+def format_number(value):
+    """Format a number compactly for prompts."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return str(value)
+    if value != value:
+        return "nan"
+    if abs(value) >= 1e9:
+        return f"{value / 1e9:.2f}B"
+    if abs(value) >= 1e6:
+        return f"{value / 1e6:.2f}M"
+    if abs(value) >= 1e4:
+        return f"{value:,.0f}"
+    return f"{value:.2f}"
+
+
+def format_date(value):
+    """Format a timestamp as YYYY-MM-DD."""
+    return value.strftime("%Y-%m-%d") if hasattr(value, "strftime") else str(value)
+
+
+def summarize_frame(df, price_column="Close"):
+    """
+    Describe a price or indicator DataFrame in compact key=value lines.
+
+    Parameters:
+    df (DataFrame): Date-indexed frame (e.g. from YFinanceUtils.get_stock_data)
+    price_column (str): Column treated as the price series
+
+    Returns:
+    list: Summary lines
+    """
+    if df is None or len(df) == 0:
+        return ["rows=0"]
+
+    lines = [f"rows={len(df)} from={format_date(df.index[0])} to={format_date(df.index[-1])}"]
+
+    if price_column in df.columns:
+        prices = df[price_column].dropna()
+        if len(prices):
+            change = (prices.iloc[-1] / prices.iloc[0] - 1) * 100 if prices.iloc[0] else float("nan")
+            lines.append(
+                f"{price_column}: first={format_number(prices.iloc[0])} last={format_number(prices.iloc[-1])} "
+                f"change={change:.2f}% min={format_number(prices.min())}@{format_date(prices.idxmin())} "
+                f"max={format_number(prices.max())}@{format_date(prices.idxmax())} mean={format_number(prices.mean())}"
+            )
+    if "Volume" in df.columns:
+        volume = df["Volume"].dropna()
+        if len(volume):
+            lines.append(f"Volume: last={format_number(volume.iloc[-1])} mean={format_number(volume.mean())} max={format_number(volume.max())}")
+
+    # Remaining numeric columns (indicators) are reported by their latest value
+    skip = {price_column, "Volume", "Open", "High", "Low", "Adj Close", "Dividends", "Stock Splits"}
+    latest = []
+    for column in df.columns:
+        if column in skip:
+            continue
+        series = df[column].dropna()
+        if len(series) and getattr(series.dtype, "kind", "O") in "fiu":
+            latest.append(f"{column}={format_number(series.iloc[-1])}")
+    if latest:
+        lines.append("Latest: " + " ".join(latest))
+    return lines
+
+
+def compact_frame(df, max_tokens=TOOL_RESPONSE_TOKEN_BUDGET, tail_rows=5, model=DEFAULT_MODEL):
+    """
+    Compress tabular tool output into statistics plus the most recent rows.
+
+    The statistics always come first; recent rows (rounded, CSV formatted)
+    are appended only while the result stays within max_tokens.
+
+    Parameters:
+    df (DataFrame): Tool output to compress
+    max_tokens (int): Token budget for the compressed text
+    tail_rows (int): Maximum number of recent rows to include
+    model (str): Model whose tokenizer is used for counting
+
+    Returns:
+    str: Compact text representation of df
+    """
+    summary = "\n".join(summarize_frame(df))
+    if df is None or len(df) == 0:
+        return summary
+
+    for rows in range(min(tail_rows, len(df)), 0, -1):
+        recent = df.tail(rows).round(2)
+        recent.index = [format_date(i) for i in recent.index]
+        candidate = f"{summary}\nRecent rows:\n{recent.to_csv()}".rstrip()
+        if count_tokens(candidate, model) <= max_tokens:
+            return candidate
+    return truncate_to_tokens(summary, max_tokens, model)
+
+
+def compact_message(content, max_tokens=HANDOFF_TOKEN_BUDGET, model=DEFAULT_MODEL):
+    """Enforce a per-message token budget on a string or DataFrame payload."""
+    if hasattr(content, "to_csv"):
+        return compact_frame(content, max_tokens, model=model)
+    return condense_analysis(str(content), max_tokens, model)
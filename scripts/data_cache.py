@@ -0,0 +1,445 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Process-wide cache for FinRobot data-source calls.
+
+Entries are keyed by (function, symbol, normalized start date, normalized
+end date) and evicted least-recently-used. Date-indexed DataFrame results
+also answer narrower queries: a request whose range lies inside a cached
+range is served by slicing the cached frame. An optional disk tier (enabled
+with FINROBOT_CACHE_DIR or disk_dir=...) keeps results across runs: ranges
+that ended before today are kept for good, ranges reaching today are not
+written (the day's data is still changing), and undated results such as
+company profiles expire after DISK_TTL_SECONDS.
+
+Usage:
+    from data_cache import cached_stock_data
+    stock_data = cached_stock_data("AAPL", "2025-01-01", "2025-03-01")
+"""
+
+import copy
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+
+from atomic_file import atomic_write
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 256
+
+# Seconds a disk entry without a finished date range stays valid, per method
+DISK_TTL_SECONDS = {
+    "get_company_profile": 7 * 86400,
+    "get_basic_financials": 86400,
+}
+DEFAULT_DISK_TTL_SECONDS = 86400
+
+
+def import_data_source(module_name, class_name):
+    """
+    Import a FinRobot data source class.
+
+    The scripts run either with the finrobot package installed or from a
+    checkout next to the FinRobot clone, so both import paths are tried.
+    """
+    try:
+        module = __import__(f"finrobot.data_source.{module_name}", fromlist=[class_name])
+    except ImportError:
+        module = __import__(f"FinRobot.finrobot.data_source.{module_name}", fromlist=[class_name])
+    return getattr(module, class_name)
+
+
+def normalize_date(value):
+    """Normalize a date given as str, date or datetime to "YYYY-MM-DD"."""
+    if value is None:
+        return None
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%Y-%m-%d")
+    value = str(value).strip()
+    for fmt in ("%Y-%m-%d", "%Y%m%d", "%Y/%m/%d", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return value
+
+
+def _is_frame(value):
+    return hasattr(value, "index") and hasattr(value, "copy") and hasattr(value, "columns")
+
+
+def _copy(value):
+    # Callers may modify what they get back; never hand out the cached object itself
+    if _is_frame(value):
+        return value.copy()
+    if isinstance(value, (dict, list)):
+        return copy.deepcopy(value)
+    return value
+
+
+def _today():
+    return date.today().strftime("%Y-%m-%d")
+
+
+def _slice_frame(df, start, end):
+    """Rows of df in [start, end), matching yfinance's exclusive end date."""
+    import pandas as pd
+
+    tz = getattr(df.index, "tz", None)
+    start_ts = pd.Timestamp(start, tz=tz) if tz is not None else pd.Timestamp(start)
+    end_ts = pd.Timestamp(end, tz=tz) if tz is not None else pd.Timestamp(end)
+    if df.index.is_monotonic_increasing:
+        return df.iloc[df.index.searchsorted(start_ts):df.index.searchsorted(end_ts)].copy()
+    return df[(df.index >= start_ts) & (df.index < end_ts)].copy()
+
+
+class MarketDataCache:
+    """
+    LRU cache for data-source results with range slicing and an optional disk tier.
+
+    Parameters:
+    max_entries (int): Maximum number of results kept in memory
+    disk_dir (str): Directory for the disk tier (default: no disk tier)
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        # (func, symbol) -> {(start, end), ...} for ranged DataFrame entries
+        self._ranges = {}
+        self._in_flight = {}
+        self._lock = threading.RLock()
+        self.stats = {"hits": 0, "slice_hits": 0, "disk_hits": 0, "misses": 0}
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_index = self._load_disk_index()
+        else:
+            self._disk_index = {}
+
+    @staticmethod
+    def make_key(func_name, symbol, start=None, end=None, extra=None):
+        """Build the cache key for a call."""
+        symbol = symbol.upper() if isinstance(symbol, str) else symbol
+        return (func_name, symbol, normalize_date(start), normalize_date(end), extra)
+
+    # In-memory tier
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            func_name, symbol, start, end, extra = key
+            if start and end and extra is None and _is_frame(value):
+                self._ranges.setdefault((func_name, symbol), set()).add((start, end))
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._ranges.get((old_key[0], old_key[1]), set()).discard((old_key[2], old_key[3]))
+
+    def _lookup(self, key):
+        """Return (found, value) from memory, slicing a covering range if needed."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return True, _copy(self._entries[key])
+
+            func_name, symbol, start, end, extra = key
+            if not (start and end) or extra is not None:
+                return False, None
+            for cached_start, cached_end in self._ranges.get((func_name, symbol), ()):
+                if cached_start <= start and end <= cached_end:
+                    covering_key = (func_name, symbol, cached_start, cached_end, None)
+                    self._entries.move_to_end(covering_key)
+                    self.stats["slice_hits"] += 1
+                    return True, _slice_frame(self._entries[covering_key], start, end)
+        return False, None
+
+    # Disk tier
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.pkl")
+
+    def _load_disk_index(self):
+        path = os.path.join(self.disk_dir, "index.json")
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_disk_index(self):
+        path = os.path.join(self.disk_dir, "index.json")
+        with atomic_write(path, "w") as f:
+            json.dump(self._disk_index, f)
+
+    @staticmethod
+    def _disk_ttl(key):
+        """Seconds a disk entry for key stays valid (None: for good)."""
+        func_name, symbol, start, end, extra = key
+        if end and end < _today():
+            # A range that ended before today no longer changes
+            return None
+        return DISK_TTL_SECONDS.get(func_name, DEFAULT_DISK_TTL_SECONDS)
+
+    @staticmethod
+    def _disk_cacheable(key):
+        """Ranges reaching today (or later) hold a partial day and are not written to disk."""
+        end = key[3]
+        return not (end and end >= _today())
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return False, None
+
+        candidates = [key]
+        func_name, symbol, start, end, extra = key
+        if start and end and extra is None:
+            for cached_start, cached_end in self._disk_index.get(f"{func_name}|{symbol}", []):
+                if cached_start <= start and end <= cached_end:
+                    candidates.append((func_name, symbol, cached_start, cached_end, None))
+
+        for candidate in candidates:
+            path = self._disk_path(candidate)
+            try:
+                ttl = self._disk_ttl(candidate)
+                if ttl is not None and time.time() - os.path.getmtime(path) > ttl:
+                    continue
+                with open(path, "rb") as f:
+                    value = pickle.load(f)
+            except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+                continue
+            self._remember(candidate, value)
+            with self._lock:
+                self.stats["disk_hits"] += 1
+            if candidate != key:
+                return True, _slice_frame(value, start, end)
+            return True, _copy(value)
+        return False, None
+
+    def _disk_put(self, key, value):
+        if not self.disk_dir or not self._disk_cacheable(key):
+            return
+        try:
+            with atomic_write(self._disk_path(key)) as f:
+                pickle.dump(value, f)
+        except (pickle.PicklingError, TypeError, AttributeError, OSError) as e:
+            logger.warning(f"Could not write {key[0]} result for {key[1]} to disk cache: {e}")
+            return
+        func_name, symbol, start, end, extra = key
+        if start and end and extra is None and _is_frame(value):
+            with self._lock:
+                ranges = self._disk_index.setdefault(f"{func_name}|{symbol}", [])
+                if [start, end] not in ranges:
+                    ranges.append([start, end])
+                    self._save_disk_index()
+
+    # Public API
+
+    def get(self, key):
+        """Return (found, value) for key from memory or disk."""
+        found, value = self._lookup(key)
+        if found:
+            return found, value
+        return self._disk_get(key)
+
+    def put(self, key, value):
+        """Store value under key in memory and, if enabled, on disk."""
+        self._remember(key, value)
+        self._disk_put(key, value)
+
+    def cached_call(self, key, fetch):
+        """
+        Return the cached value for key, calling fetch() on a miss.
+
+        Concurrent callers of the same key (or of a range inside one being
+        fetched) wait for that fetch instead of issuing their own request.
+        """
+        found, value = self.get(key)
+        if found:
+            return value
+
+        with self._lock:
+            event = self._in_flight.get(key) or self._covering_in_flight(key)
+            owner = event is None
+            if owner:
+                event = self._in_flight[key] = threading.Event()
+
+        if not owner:
+            event.wait()
+            found, value = self.get(key)
+            if found:
+                return value
+            # The owner's fetch failed; try ourselves
+            return self.cached_call(key, fetch)
+
+        try:
+            with self._lock:
+                self.stats["misses"] += 1
+            value = fetch()
+            self.put(key, value)
+            return _copy(value)
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            event.set()
+
+    def _covering_in_flight(self, key):
+        """Return the event of an in-flight fetch whose range covers key, if any."""
+        func_name, symbol, start, end, extra = key
+        if not (start and end) or extra is not None:
+            return None
+        for (other_func, other_symbol, other_start, other_end, other_extra), event in self._in_flight.items():
+            if (other_func, other_symbol, other_extra) == (func_name, symbol, None) \
+                    and other_start <= start and end <= other_end:
+                return event
+        return None
+
+    def clear(self):
+        """Drop all in-memory entries (the disk tier is kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._ranges.clear()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide cache, creating it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = MarketDataCache(disk_dir=os.environ.get("FINROBOT_CACHE_DIR"))
+        return _default_cache
+
+
+# Data-source methods the agents call most; install_cache_hooks() routes them through the cache
+CACHED_METHODS = [
+    ("yfinance_utils", "YFinanceUtils", "get_stock_data"),
+    ("finnhub_utils", "FinnHubUtils", "get_company_profile"),
+    ("finnhub_utils", "FinnHubUtils", "get_company_news"),
+    ("finnhub_utils", "FinnHubUtils", "get_basic_financials"),
+]
+
+# Arguments that make a call non-cacheable (side effects)
+_UNCACHED_ARGUMENTS = ("save_path",)
+
+_originals = {}
+# Methods served by a local store instead of the data source; these bypass the cache
+_overrides = {}
+_hooks_lock = threading.Lock()
+
+
+def _original_method(cls, method_name):
+    """Return the unpatched function behind cls.method_name."""
+    return _overrides.get((cls, method_name)) or _originals.get((cls, method_name)) or getattr(cls, method_name)
+
+
+def call_key(func, method_name, args, kwargs):
+    """
+    Build the cache key for a data-source call, or None if it must not be cached.
+
+    The first parameter is the symbol; start_date/end_date (when present) form
+    the date range and every other argument becomes part of the key.
+    """
+    try:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+    except (TypeError, ValueError):
+        return None
+    bound.apply_defaults()
+    arguments = dict(bound.arguments)
+    if any(arguments.get(name) is not None for name in _UNCACHED_ARGUMENTS):
+        return None
+    for name in _UNCACHED_ARGUMENTS:
+        arguments.pop(name, None)
+
+    symbol = arguments.pop(next(iter(bound.signature.parameters)), None)
+    start = arguments.pop("start_date", None)
+    end = arguments.pop("end_date", None)
+    extra = tuple(sorted((name, repr(value)) for name, value in arguments.items())) or None
+    return MarketDataCache.make_key(method_name, symbol, start, end, extra)
+
+
+def cached_source_call(cls, method_name, *args, cache=None, **kwargs):
+    """Call cls.method_name(*args, **kwargs) through the cache."""
+    if (cls, method_name) in _overrides:
+        return _overrides[(cls, method_name)](*args, **kwargs)
+    cache = cache or get_cache()
+    func = _original_method(cls, method_name)
+    key = call_key(func, method_name, args, kwargs)
+    if key is None:
+        return func(*args, **kwargs)
+    return cache.cached_call(key, lambda: func(*args, **kwargs))
+
+
+def install_cache_hooks(cache=None):
+    """
+    Route the FinRobot data-source methods in CACHED_METHODS through the cache.
+
+    FinRobot's toolkits call these classes directly, so patching them makes
+    every agent tool consult the cache first (and see prefetched results).
+    Call this before constructing agents; it is safe to call repeatedly.
+    """
+    with _hooks_lock:
+        for module_name, class_name, method_name in CACHED_METHODS:
+            try:
+                cls = import_data_source(module_name, class_name)
+            except (ImportError, AttributeError) as e:
+                logger.warning(f"Cannot cache {class_name}.{method_name}: {e}")
+                continue
+            if (cls, method_name) in _originals or (cls, method_name) in _overrides:
+                continue
+
+            original = getattr(cls, method_name)
+
+            def cached_method(*args, _cls=cls, _name=method_name, **kwargs):
+                return cached_source_call(_cls, _name, *args, cache=cache, **kwargs)
+
+            functools.update_wrapper(cached_method, original)
+            _originals[(cls, method_name)] = original
+            setattr(cls, method_name, staticmethod(cached_method))
+
+
+def override_source_method(module_name, class_name, method_name, func):
+    """
+    Serve a data-source method from func (e.g. a persistent local store).
+
+    The override replaces the method on the class and takes the place of the
+    in-memory cache for it, whether or not install_cache_hooks() ran first.
+
+    Returns:
+    callable: The original data-source function, for func to call on misses
+    """
+    cls = import_data_source(module_name, class_name)
+    with _hooks_lock:
+        original = _originals.get((cls, method_name)) or getattr(cls, method_name)
+        _originals[(cls, method_name)] = original
+        _overrides[(cls, method_name)] = func
+        setattr(cls, method_name, staticmethod(func))
+    return original
+
+
+def cached_stock_data(symbol, start_date, end_date, cache=None):
+    """YFinanceUtils.get_stock_data through the process-wide cache."""
+    YFinanceUtils = import_data_source("yfinance_utils", "YFinanceUtils")
+    return cached_source_call(YFinanceUtils, "get_stock_data", symbol, start_date, end_date, cache=cache)
+
+
+def cached_company_profile(symbol, cache=None):
+    """FinnHubUtils.get_company_profile through the process-wide cache."""
+    FinnHubUtils = import_data_source("finnhub_utils", "FinnHubUtils")
+    return cached_source_call(FinnHubUtils, "get_company_profile", symbol, cache=cache)
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Incremental chunking and embedding of documents into the vector index.
+
+Documents (10-K sections, news items) are split into stable,
+content-defined chunks and each chunk is hashed. A chunk whose hash was
+already ingested for the same document (symbol, source, doc id and date)
+is skipped; one that was ingested under other metadata, such as the same
+paragraph in last year's 10-K, gets a row of its own with the new metadata
+but reuses the stored vector. Only genuinely new text is embedded, in
+batches, and appended to the index without a rebuild, so refreshing a 10-K
+or a news batch costs the changed paragraphs only.
+
+The news store indexes the stories it stores (ingest_news), and the annual
+report runner indexes the 10-K it loads from the filing store
+(ingest_stored_filing), so the RAG agent's search_documents sees both.
+
+Usage:
+    python document_ingest.py filing aapl-20240928.htm AAPL 2024-11-01
+    python document_ingest.py store AAPL
+    python document_ingest.py news AAPL 2025-05-01 2025-06-01
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from filing_mapreduce import chunk_text
+from filing_sections import SECTION_TITLES, get_sections, load_index
+from vector_index import get_index
+
+logger = logging.getLogger(__name__)
+
+# Retrieval chunks are smaller than the map-reduce ones so hits stay focused
+CHUNK_TOKENS = 400
+MIN_CHUNK_TOKENS = 120
+EMBED_BATCH_SIZE = 256
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def chunk_hash(text):
+    """Hash of a chunk with whitespace normalized, so reflowed text is not re-embedded."""
+    return hashlib.sha256(_WHITESPACE_RE.sub(" ", text).strip().lower().encode("utf-8")).hexdigest()
+
+
+class OpenAIEmbedder:
+    """
+    Embedder backed by the OpenAI embeddings API, for use in place of the hashing embedder.
+
+    Each embed() call is one request, so pass batches.
+    """
+
+    def __init__(self, model="text-embedding-3-small", dim=512, api_key=None):
+        from openai import OpenAI
+
+        self.name = f"openai:{model}"
+        self.model = model
+        self.dim = dim
+        self.client = OpenAI(api_key=api_key or os.environ.get("OPENAI_API_KEY"))
+
+    def embed(self, texts):
+        response = self.client.embeddings.create(model=self.model, input=list(texts), dimensions=self.dim)
+        vectors = np.array([item.embedding for item in response.data], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+class IngestPipeline:
+    """Chunk, deduplicate by content hash, batch-embed and append to a VectorIndex."""
+
+    def __init__(self, index=None, batch_size=EMBED_BATCH_SIZE, max_tokens=CHUNK_TOKENS, min_tokens=MIN_CHUNK_TOKENS):
+        self.index = index or get_index()
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _db(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.index.directory, "ingested.db"), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks (hash TEXT NOT NULL, symbol TEXT NOT NULL, source TEXT NOT NULL, "
+                "doc_id TEXT NOT NULL, date TEXT NOT NULL, row_id INTEGER NOT NULL, "
+                "PRIMARY KEY (hash, symbol, source, doc_id, date))"
+            )
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _document_key(metadata):
+        return metadata["symbol"], metadata["source"], metadata.get("doc_id") or "", metadata.get("date") or ""
+
+    def _known(self, hashes):
+        """Return {hash: [(symbol, source, doc_id, date, row_id), ...]} for already ingested hashes."""
+        known = {}
+        conn = self._db()
+        unique = list(set(hashes))
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            rows = conn.execute(
+                f"SELECT hash, symbol, source, doc_id, date, row_id FROM chunks WHERE hash IN ({', '.join('?' * len(batch))})",
+                batch,
+            )
+            for digest, symbol, source, doc_id, date, row_id in rows:
+                known.setdefault(digest, []).append((symbol, source, doc_id, date, row_id))
+        return known
+
+    def chunk_document(self, document):
+        """Return [(hash, text, metadata)] for one document dict."""
+        metadata = {
+            "symbol": (document.get("symbol") or "").upper(),
+            "date": document.get("date"),
+            "source": document.get("source") or "",
+            "doc_id": document.get("doc_id"),
+        }
+        chunks = []
+        for text in chunk_text(document["text"], self.max_tokens, self.min_tokens):
+            chunks.append((chunk_hash(text), text, metadata))
+        return chunks
+
+    def ingest(self, documents):
+        """
+        Ingest documents, embedding only chunks that were not seen before.
+
+        Parameters:
+        documents (iterable): Dicts with text and optional symbol, date
+            (YYYY-MM-DD), source and doc_id
+
+        Returns:
+        dict: documents, chunks, embedded, reused (vector copied from
+        another document), skipped and seconds
+        """
+        started = time.time()
+        stats = {"documents": 0, "chunks": 0, "embedded": 0, "reused": 0, "skipped": 0}
+        # Writers are serialized (across processes, by the index's file lock) so
+        # two batches cannot both embed and append the same new chunk
+        with self._lock, self.index.write_lock():
+            pending = []
+            for document in documents:
+                stats["documents"] += 1
+                pending.extend(self.chunk_document(document))
+                if len(pending) >= self.batch_size * 4:
+                    self._flush(pending, stats)
+                    pending = []
+            self._flush(pending, stats)
+        stats["seconds"] = time.time() - started
+        logger.info(
+            f"Ingested {stats['documents']} documents: {stats['chunks']} chunks, {stats['embedded']} embedded, "
+            f"{stats['reused']} reused, {stats['skipped']} unchanged in {stats['seconds']:.1f}s"
+        )
+        return stats
+
+    def _flush(self, chunks, stats):
+        if not chunks:
+            return
+        stats["chunks"] += len(chunks)
+        known = self._known([digest for digest, _, _ in chunks])
+        to_embed, to_copy, seen = [], [], set()
+        for digest, text, metadata in chunks:
+            key = (digest,) + self._document_key(metadata)
+            entries = known.get(digest, [])
+            if key in seen or any(entry[:4] == key[1:] for entry in entries):
+                stats["skipped"] += 1
+                continue
+            seen.add(key)
+            if entries:
+                to_copy.append((digest, text, metadata, entries[0][4]))
+            else:
+                to_embed.append((digest, text, metadata))
+
+        if to_copy:
+            self.index.refresh()
+            vectors = np.asarray(self.index.vectors[[row_id for _, _, _, row_id in to_copy]])
+            self._append(vectors, [(digest, text, metadata) for digest, text, metadata, _ in to_copy])
+            stats["reused"] += len(to_copy)
+
+        # Identical new chunks within the batch are embedded once
+        for start in range(0, len(to_embed), self.batch_size):
+            batch = to_embed[start:start + self.batch_size]
+            unique_texts = {}
+            for digest, text, _ in batch:
+                unique_texts.setdefault(digest, text)
+            digests = list(unique_texts)
+            embedded = self.index.embedder.embed([unique_texts[digest] for digest in digests])
+            position = {digest: i for i, digest in enumerate(digests)}
+            vectors = embedded[[position[digest] for digest, _, _ in batch]]
+            self._append(vectors, batch)
+            stats["embedded"] += len(digests)
+
+    def _append(self, vectors, chunks):
+        row_ids = self.index.add_vectors(vectors, [text for _, text, _ in chunks], [metadata for _, _, metadata in chunks])
+        conn = self._db()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO chunks (hash, symbol, source, doc_id, date, row_id) VALUES (?, ?, ?, ?, ?, ?)",
+                [(digest,) + self._document_key(metadata) + (row_id,) for (digest, _, metadata), row_id in zip(chunks, row_ids)],
+            )
+
+
+def filing_documents(path, symbol, date=None, items=None, doc_id=None):
+    """
+    Turn the sections of a 10-K into ingestable documents, one per item.
+
+    Parameters:
+    path (str): Path of the filing
+    symbol (str): Ticker
+    date (str): Filing date (YYYY-MM-DD)
+    items (list): Items to include (default: all located items)
+    doc_id (str): Document id prefix (default: the file name)
+    """
+    items = items or list(load_index(path)["sections"])
+    doc_id = doc_id or os.path.basename(path)
+    documents = []
+    for item, text in get_sections(path, items).items():
+        title = SECTION_TITLES.get(item, "")
+        documents.append({
+            "text": f"Item {item}. {title}\n\n{text}" if title else text,
+            "symbol": symbol, "date": date, "source": "filing", "doc_id": f"{doc_id}#{item}",
+        })
+    return documents
+
+
+def ingest_filing(path, symbol, date=None, pipeline=None):
+    return (pipeline or IngestPipeline()).ingest(filing_documents(path, symbol, date))
+
+
+def ingest_stored_filing(symbol, form="10-K", pipeline=None):
+    """Ingest the latest filing of form from the filing store (downloading it only if needed)."""
+    from filing_store import FilingStore
+
+    store = FilingStore()
+    filing = store.latest_filing(symbol, form)
+    if filing is None:
+        raise LookupError(f"No {form} found for {symbol}")
+    documents = filing_documents(store.filing_path(filing), symbol, filing["filing_date"], doc_id=filing["accession"])
+    return (pipeline or IngestPipeline()).ingest(documents)
+
+
+def news_documents(rows):
+    """
+    Turn news store rows into ingestable documents, one per story.
+
+    Parameters:
+    rows (list): Rows from NewsStore.query (already deduplicated)
+    """
+    documents = []
+    for row in rows:
+        text = "\n\n".join(part for part in (row.get("headline"), row.get("summary")) if part)
+        if not text:
+            continue
+        documents.append({
+            "text": text,
+            "symbol": row["symbol"],
+            "date": datetime.fromtimestamp(row["published"]).strftime("%Y-%m-%d"),
+            "source": "news",
+            "doc_id": row.get("url") or f"news-{row['id']}",
+        })
+    return documents
+
+
+def ingest_news(symbol, start_date, end_date, store=None, pipeline=None):
+    """Ingest the stories the news store holds for symbol in [start_date, end_date] (nothing is fetched)."""
+    from news_store import get_store
+
+    rows = (store or get_store()).query(symbol, start_date, end_date)
+    return (pipeline or IngestPipeline()).ingest(news_documents(rows))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) >= 4 and sys.argv[1] == "filing":
+        result = ingest_filing(sys.argv[2], sys.argv[3], sys.argv[4] if len(sys.argv) > 4 else None)
+    elif len(sys.argv) >= 3 and sys.argv[1] == "store":
+        result = ingest_stored_filing(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else "10-K")
+    elif len(sys.argv) >= 5 and sys.argv[1] == "news":
+        result = ingest_news(sys.argv[2], sys.argv[3], sys.argv[4])
+    else:
+        print("Usage: python document_ingest.py filing <path> <SYMBOL> [YYYY-MM-DD]")
+        print("       python document_ingest.py store <SYMBOL> [FORM]")
+        print("       python document_ingest.py news <SYMBOL> <START> <END>")
+        sys.exit(1)
+    print(result)
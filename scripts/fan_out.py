@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Fan-out/fan-in orchestration of independent specialist agents.
+
+The RAG agent, Trade Strategist, Annual Report Analyzer and FinGPT
+Forecaster need different data for the same symbol and do not depend on
+one another, so they are started together on separate threads, each with
+its own timeout. Whatever has finished when the deadlines pass is condensed
+and merged into one structured report by a single aggregation call, so the
+end-to-end time is roughly that of the slowest agent rather than the sum.
+
+An agent that times out keeps running on its daemon thread and is simply
+left out of the report; it never blocks the merge or the process exit.
+
+Usage:
+    pool = AgentPool(llm_config)
+    results = fan_out(pool, specialist_tasks("AAPL"))
+    report = merge_reports("AAPL", results, llm_config)
+"""
+
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from context_compaction import condense_analysis, HANDOFF_TOKEN_BUDGET
+from filing_mapreduce import make_completion
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 300
+
+SPECIALIST_QUERIES = {
+    "annual_report_analyzer": (
+        "Analyze the latest annual report and 10-K for {symbol}: key financial metrics and their trends, "
+        "the main risk factors (Item 1A), management's discussion (Item 7) and growth opportunities. "
+        "Use data from {one_year_ago} to {current_date}."
+    ),
+    "trade_strategist": (
+        "Develop a trading strategy for {symbol} from technical indicators (SMA, EMA, RSI, MACD, Bollinger Bands) "
+        "using price data from {one_month_ago} to {current_date}: stance, entry and exit levels, stop loss and timeframe."
+    ),
+    "rag_agent": (
+        "Summarize the company profile, the most important news between {one_month_ago} and {current_date} "
+        "and the key financial metrics of {symbol}."
+    ),
+    "fingpt_forecaster": (
+        "Forecast the stock price movement of {symbol} over the next week based on the news and price data "
+        "between {one_month_ago} and {current_date}, with the main positive and negative drivers."
+    ),
+}
+
+REPORT_SECTIONS = [
+    "Overview",
+    "Fundamentals",
+    "Technical Outlook",
+    "News and Sentiment",
+    "Forecast",
+    "Risks",
+    "Where the Specialists Disagree",
+    "Recommendation",
+]
+
+MERGE_PROMPT = """You are given the independent analyses of {symbol} written by several specialist agents on {current_date}.
+Merge them into one report with exactly these markdown sections: {sections}.
+Attribute figures and opinions to the specialist that produced them, keep numbers exact, and do not invent data.
+The Recommendation section must state Buy, Hold or Sell, a target price range and a timeframe.
+{missing}
+{analyses}"""
+
+
+def specialist_tasks(symbol, agent_types=None, timeout=DEFAULT_TIMEOUT, current_date=None):
+    """
+    Build the default (agent_type, query, timeout) tasks for one symbol.
+
+    Parameters:
+    symbol (str): Stock ticker
+    agent_types (list): Subset of SPECIALIST_QUERIES keys (default: all)
+    timeout (float or dict): Seconds per agent, or agent_type -> seconds
+    current_date (str): YYYY-MM-DD (default: today)
+    """
+    today = datetime.strptime(current_date, "%Y-%m-%d") if current_date else datetime.now()
+    dates = {
+        "symbol": symbol,
+        "current_date": today.strftime("%Y-%m-%d"),
+        "one_year_ago": (today - timedelta(days=365)).strftime("%Y-%m-%d"),
+        "one_month_ago": (today - timedelta(days=30)).strftime("%Y-%m-%d"),
+    }
+    tasks = []
+    for agent_type in agent_types or SPECIALIST_QUERIES:
+        seconds = timeout.get(agent_type, DEFAULT_TIMEOUT) if isinstance(timeout, dict) else timeout
+        tasks.append((agent_type, SPECIALIST_QUERIES[agent_type].format(**dates), seconds))
+    return tasks
+
+
+def agent_output(agent, response):
+    """The agent's final answer: chat()'s return value, or its last assistant message."""
+    if isinstance(response, str) and response.strip():
+        return response
+    summary = getattr(response, "summary", None)
+    if isinstance(summary, str) and summary.strip():
+        return summary
+    user_proxy = getattr(agent, "user_proxy", None)
+    assistant = getattr(agent, "assistant", agent)
+    history = getattr(user_proxy, "chat_messages", {}).get(assistant, []) if user_proxy is not None else []
+    for message in reversed(history):
+        content = (message.get("content") or "").replace("TERMINATE", "").strip()
+        if message.get("role") == "user" and content:
+            # Messages from the assistant are stored with role "user" in the proxy's history
+            return content
+    return "" if response is None else str(response)
+
+
+def fan_out(pool, tasks):
+    """
+    Run independent agent tasks concurrently and collect what finishes in time.
+
+    Parameters:
+    pool (AgentPool): Pool to check agents out of (see agent_service)
+    tasks (list): (agent_type, query, timeout_seconds) tuples
+
+    Returns:
+    dict: agent_type -> {status ("done", "failed", "timeout" or
+    "unavailable"), output, error, seconds}
+    """
+    results = {}
+    finished = queue.Queue()
+    started = time.time()
+
+    def run(agent_type, query):
+        task_started = time.time()
+        try:
+            agent = pool.checkout(agent_type)
+            try:
+                output = agent_output(agent, agent.chat(query))
+            finally:
+                pool.checkin(agent_type, agent)
+            finished.put((agent_type, {"status": "done", "output": output, "seconds": time.time() - task_started}))
+        except Exception as e:
+            logger.error(f"{agent_type} failed: {e}")
+            finished.put((agent_type, {"status": "failed", "error": str(e), "seconds": time.time() - task_started}))
+
+    deadlines = {}
+    for agent_type, query, timeout in tasks:
+        if agent_type not in pool.pools:
+            results[agent_type] = {"status": "unavailable", "error": f"{agent_type} is not pooled", "seconds": 0.0}
+            continue
+        deadlines[agent_type] = started + timeout
+        threading.Thread(target=run, args=(agent_type, query), name=f"fan-out-{agent_type}", daemon=True).start()
+
+    while True:
+        pending = {agent_type: deadline for agent_type, deadline in deadlines.items() if agent_type not in results}
+        if not pending:
+            break
+        remaining = min(pending.values()) - time.time()
+        try:
+            agent_type, result = finished.get(timeout=max(0.0, remaining))
+        except queue.Empty:
+            now = time.time()
+            for agent_type, deadline in pending.items():
+                if deadline <= now:
+                    logger.warning(f"{agent_type} did not finish within {deadline - started:.0f}s, leaving it out")
+                    results[agent_type] = {"status": "timeout", "error": "timed out", "seconds": now - started}
+            continue
+        # A result arriving after its own deadline was already recorded as a timeout
+        results.setdefault(agent_type, result)
+
+    logger.info(
+        f"Fan-out of {len(tasks)} agents finished in {time.time() - started:.1f}s: "
+        + ", ".join(f"{agent_type}={result['status']}" for agent_type, result in results.items())
+    )
+    return results
+
+
+def merge_reports(symbol, results, llm_config=None, complete=None, max_tokens_per_agent=HANDOFF_TOKEN_BUDGET,
+                  current_date=None):
+    """
+    Merge the specialists' outputs into one structured report with one LLM call.
+
+    Each output is condensed to max_tokens_per_agent first. If the
+    aggregation call fails, the condensed outputs are returned under
+    per-agent headings instead. Pass the current_date given to
+    specialist_tasks, so the aggregator dates the report like the
+    specialists did.
+
+    Returns:
+    str: Markdown report
+    """
+    analyses = {
+        agent_type: condense_analysis(result["output"], max_tokens_per_agent)
+        for agent_type, result in results.items()
+        if result["status"] == "done" and result.get("output")
+    }
+    if not analyses:
+        return f"No specialist analysis of {symbol} completed."
+    missing = [agent_type for agent_type in results if agent_type not in analyses]
+    blocks = "\n\n".join(f"### {agent_type}\n{text}" for agent_type, text in analyses.items())
+    prompt = MERGE_PROMPT.format(
+        symbol=symbol,
+        current_date=current_date or datetime.now().strftime("%Y-%m-%d"),
+        sections=", ".join(REPORT_SECTIONS),
+        missing=f"These specialists did not finish and must not be quoted: {', '.join(missing)}.\n" if missing else "",
+        analyses=blocks,
+    )
+    try:
+        complete = complete or make_completion(llm_config)
+        return complete([{"role": "user", "content": prompt}])
+    except Exception as e:
+        logger.error(f"Aggregation call failed, returning the condensed analyses: {e}")
+        return f"# {symbol} specialist analyses\n\n{blocks}"
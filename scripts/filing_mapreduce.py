@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Map-reduce LLM analysis of long 10-K filings.
+
+Items 1A (Risk Factors), 7 (MD&A) and 8 (Financial Statements) are split
+into token-bounded chunks; every chunk gets its own short extraction call
+(map), run concurrently under a requests-per-minute limit, and the
+extracted notes are merged by one final call (reduce). Wall time therefore
+follows the slowest chunk instead of the length of the filing.
+
+Chunk boundaries are content-defined (they fall on paragraphs whose hash
+marks a cut point), so editing one paragraph changes only the chunk that
+contains it. Map results are cached on disk by chunk content, and an
+amended or re-downloaded filing only pays for the chunks that changed.
+
+Usage:
+    python filing_mapreduce.py aapl-20240928.htm AAPL
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from atomic_file import atomic_write
+from context_compaction import count_tokens, truncate_to_tokens
+from filing_sections import SECTION_TITLES, get_sections
+
+logger = logging.getLogger(__name__)
+
+MAP_ITEMS = ("1A", "7", "8")
+CHUNK_TOKENS = 2000
+# Chunks never end before this many tokens unless the section does
+MIN_CHUNK_TOKENS = 600
+# One paragraph in CUT_MODULUS (by hash) ends a chunk once MIN_CHUNK_TOKENS is reached
+CUT_MODULUS = 4
+MAP_WORKERS = 8
+REQUESTS_PER_MINUTE = 120
+REDUCE_TOKEN_BUDGET = 12000
+# Bump when the prompts change so stale cached notes are not reused
+PROMPT_VERSION = 1
+
+MAP_PROMPTS = {
+    "1A": "List the concrete risks in this excerpt of the Risk Factors section. For each give one line: the risk, what drives it, and any quantified exposure.",
+    "7": "Extract from this excerpt of Management's Discussion and Analysis: revenue and margin drivers, segment trends, liquidity and capital allocation, guidance and management's stated concerns. Keep every figure with its period.",
+    "8": "Extract the key figures from this excerpt of the financial statements and notes (revenue, income, cash flow, debt, share counts, segment data, unusual items) with their periods. Skip boilerplate.",
+}
+
+MAP_SYSTEM = "You extract facts from SEC filings. Answer with terse bullet points only. Say 'Nothing material.' if the excerpt has no relevant content."
+
+REDUCE_PROMPT = """Below are notes extracted chunk by chunk from the latest 10-K{company}.
+Merge them into one analysis with these parts:
+1. Key financial metrics (with periods and year-over-year changes)
+2. Principal risks, most material first
+3. Management's view: drivers, outlook and capital allocation
+4. Growth opportunities and red flags
+Remove duplicates and keep all figures exact.
+
+{notes}"""
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+
+
+class RateLimiter:
+    """Thread-safe limiter spacing calls to at most rate_per_minute."""
+
+    def __init__(self, rate_per_minute=REQUESTS_PER_MINUTE):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _split_long(paragraph, max_tokens):
+    """Split a paragraph longer than max_tokens at sentence (or line) boundaries."""
+    pieces = re.split(r"(?<=[.;])\s+|\n", paragraph)
+    parts, current = [], ""
+    for piece in pieces:
+        candidate = f"{current} {piece}".strip()
+        if current and count_tokens(candidate) > max_tokens:
+            parts.append(current)
+            current = piece
+        else:
+            current = candidate
+    if current:
+        parts.append(truncate_to_tokens(current, max_tokens) if count_tokens(current) > max_tokens else current)
+    return parts
+
+
+def _is_cut_point(paragraph):
+    digest = hashlib.md5(paragraph.encode("utf-8")).digest()
+    return digest[0] % CUT_MODULUS == 0
+
+
+def chunk_text(text, max_tokens=CHUNK_TOKENS, min_tokens=MIN_CHUNK_TOKENS):
+    """
+    Split text into chunks of at most max_tokens along paragraph boundaries.
+
+    A chunk ends after a paragraph whose hash marks a cut point (once it
+    holds min_tokens) or when the next paragraph would overflow it, so the
+    boundaries depend on local content rather than on everything before.
+
+    Returns:
+    list: Chunk strings
+    """
+    chunks, current, current_tokens = [], [], 0
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        tokens = count_tokens(paragraph)
+        parts = [paragraph] if tokens <= max_tokens else _split_long(paragraph, max_tokens)
+        for part in parts:
+            part_tokens = tokens if len(parts) == 1 else count_tokens(part)
+            if current and current_tokens + part_tokens > max_tokens:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(part)
+            current_tokens += part_tokens
+            if current_tokens >= min_tokens and _is_cut_point(part):
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+class ChunkCache:
+    """Disk cache of map results keyed by prompt version, model, item and chunk text."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(os.environ.get("FINROBOT_CACHE_DIR", "."), "mapreduce_cache")
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, model, item, chunk):
+        payload = f"{PROMPT_VERSION}\0{model}\0{item}\0{chunk}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)["notes"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key, notes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_write(path, "w") as f:
+            json.dump({"notes": notes}, f)
+
+
+def make_completion(llm_config):
+    """
+    Return complete(messages) -> str backed by autogen's OpenAIWrapper.
+
+    Parameters:
+    llm_config (dict): The llm_config used for the agents
+    """
+    import autogen
+
+    client_config = {k: v for k, v in llm_config.items() if k not in ("functions", "tools")}
+    client = autogen.OpenAIWrapper(**client_config)
+
+    def complete(messages):
+        response = client.create(messages=messages)
+        return client.extract_text_or_completion_object(response)[0] or ""
+
+    return complete
+
+
+def _model_name(llm_config):
+    config_list = (llm_config or {}).get("config_list") or [{}]
+    return config_list[0].get("model", "")
+
+
+def _call_with_retry(complete, messages, limiter, attempts=3):
+    for attempt in range(attempts):
+        limiter.wait()
+        try:
+            return complete(messages)
+        except Exception as e:
+            if attempt == attempts - 1:
+                raise
+            delay = 2 ** attempt * 5
+            logger.warning(f"LLM call failed ({e}), retrying in {delay}s")
+            time.sleep(delay)
+
+
+def map_chunks(chunks, complete, model="", cache=None, workers=MAP_WORKERS, rate_per_minute=REQUESTS_PER_MINUTE):
+    """
+    Run the extraction prompt on every (item, chunk) concurrently.
+
+    Parameters:
+    chunks (list): (item, chunk_text) pairs
+    complete (callable): complete(messages) -> str
+    model (str): Model name, part of the cache key
+    cache (ChunkCache): Cache of earlier map results (None disables caching)
+    workers (int): Concurrent LLM calls
+    rate_per_minute (int): Maximum LLM calls started per minute
+
+    Returns:
+    tuple: (list of notes in chunk order, number of cache hits)
+    """
+    limiter = RateLimiter(rate_per_minute)
+    notes = [None] * len(chunks)
+    todo = []
+    for i, (item, chunk) in enumerate(chunks):
+        cached = cache.get(cache.key(model, item, chunk)) if cache else None
+        if cached is not None:
+            notes[i] = cached
+        else:
+            todo.append(i)
+
+    def run(i):
+        item, chunk = chunks[i]
+        messages = [
+            {"role": "system", "content": MAP_SYSTEM},
+            {"role": "user", "content": f"{MAP_PROMPTS.get(item, MAP_PROMPTS['7'])}\n\n---\n{chunk}"},
+        ]
+        result = _call_with_retry(complete, messages, limiter).strip()
+        if cache:
+            cache.put(cache.key(model, item, chunk), result)
+        return i, result
+
+    if todo:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(todo))), thread_name_prefix="filing-map") as pool:
+            for i, result in pool.map(run, todo):
+                notes[i] = result
+    return notes, len(chunks) - len(todo)
+
+
+def _render_notes(chunks, notes):
+    blocks, last_item = [], None
+    for (item, _), note in zip(chunks, notes):
+        if not note or note.lower().startswith("nothing material"):
+            continue
+        if item != last_item:
+            blocks.append(f"## Item {item}: {SECTION_TITLES.get(item, '')}")
+            last_item = item
+        blocks.append(note)
+    return "\n\n".join(blocks)
+
+
+def analyze_filing(path, llm_config=None, symbol=None, items=MAP_ITEMS, complete=None, cache=None,
+                   workers=MAP_WORKERS, rate_per_minute=REQUESTS_PER_MINUTE):
+    """
+    Analyze a 10-K with concurrent chunk extraction and one merging call.
+
+    Parameters:
+    path (str): Path of the filing (.htm/.html/.txt)
+    llm_config (dict): llm_config for the LLM calls (ignored when complete is given)
+    symbol (str): Ticker, used in the reduce prompt
+    items (tuple): 10-K items to analyze
+    complete (callable): complete(messages) -> str; default built from llm_config
+    cache (ChunkCache): Map-result cache (default: FINROBOT_CACHE_DIR/mapreduce_cache)
+    workers (int): Concurrent map calls
+    rate_per_minute (int): Maximum LLM calls started per minute
+
+    Returns:
+    dict: analysis (str), chunks (int), cached_chunks (int), seconds (float)
+    """
+    started = time.time()
+    complete = complete or make_completion(llm_config)
+    cache = cache if cache is not None else ChunkCache()
+    sections = get_sections(path, items)
+    if not sections:
+        raise ValueError(f"None of items {', '.join(items)} were found in {path}")
+
+    chunks = [(item, chunk) for item, text in sections.items() for chunk in chunk_text(text)]
+    logger.info(f"Mapping {len(chunks)} chunks of {path} ({', '.join(sections)})")
+    notes, cached = map_chunks(chunks, complete, _model_name(llm_config), cache, workers, rate_per_minute)
+
+    merged = truncate_to_tokens(_render_notes(chunks, notes), REDUCE_TOKEN_BUDGET)
+    prompt = REDUCE_PROMPT.format(company=f" of {symbol}" if symbol else "", notes=merged)
+    analysis = _call_with_retry(complete, [{"role": "user", "content": prompt}], RateLimiter(rate_per_minute))
+    seconds = time.time() - started
+    logger.info(f"Analyzed {path}: {len(chunks)} chunks ({cached} cached) in {seconds:.1f}s")
+    return {"analysis": analysis, "chunks": len(chunks), "cached_chunks": cached, "seconds": seconds}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python filing_mapreduce.py <10-K path> [SYMBOL]")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    from agent_service import load_llm_config
+
+    result = analyze_filing(sys.argv[1], load_llm_config(), symbol=sys.argv[2] if len(sys.argv) > 2 else None)
+    print(result["analysis"])
+    print(f"\n{result['chunks']} chunks ({result['cached_chunks']} cached) in {result['seconds']:.1f}s")
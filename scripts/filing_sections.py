@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Streaming 10-K section extraction with a cached byte-offset index.
+
+A 10-K is scanned once in fixed-size chunks (never loaded whole) to find
+the "Item 1A", "Item 7", ... headings; the byte range of each item is
+stored in a small JSON index next to the filing. Later requests for a
+section seek straight to its byte range and convert only those bytes from
+HTML to text, so re-analyzing a filing reads just the sections asked for.
+
+Works on EDGAR HTML and plain-text filings.
+
+Usage:
+    from filing_sections import get_section
+    risk_factors = get_section("aapl-20240928.htm", "1A")
+"""
+
+import html
+import json
+import logging
+import os
+import re
+
+from atomic_file import atomic_write
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20
+# Bytes re-scanned across chunk boundaries; longer than any heading with its inline tags
+CHUNK_OVERLAP = 4096
+INDEX_VERSION = 1
+
+# Per-section token budget when sections are pasted into a prompt
+SECTION_TOKEN_BUDGET = 3000
+
+# 10-K items in filing order
+ITEMS = ["1", "1A", "1B", "1C", "2", "3", "4", "5", "6", "7", "7A", "8", "9", "9A", "9B", "9C", "10", "11", "12", "13", "14", "15", "16"]
+
+SECTION_TITLES = {
+    "1": "Business",
+    "1A": "Risk Factors",
+    "1B": "Unresolved Staff Comments",
+    "1C": "Cybersecurity",
+    "2": "Properties",
+    "3": "Legal Proceedings",
+    "7": "Management's Discussion and Analysis",
+    "7A": "Quantitative and Qualitative Disclosures About Market Risk",
+    "8": "Financial Statements and Supplementary Data",
+}
+
+# Filler allowed between the words of a heading: whitespace, non-breaking
+# space entities and inline tags such as <span> or <b>
+_FILL = rb"(?:\s|&#160;|&nbsp;|&#xa0;|&#xA0;|<[^>]{0,400}>)"
+# A heading starts a line or follows a tag and reads "Item 1A." / "ITEM 7 -" /
+# "Item 7:" / "Item 1A Risk Factors"
+_HEADING_RE = re.compile(
+    rb"[\n>]" + _FILL + rb"*(item" + _FILL + rb"+(1[0-6]|[1-9])([abc])?)"
+    rb"(?:" + _FILL + rb"*(?:[.:\-]|\xe2\x80\x94|&#8212;|&#151;|&mdash;)|" + _FILL + rb"+(?-i:(?=[A-Z])))",
+    re.IGNORECASE,
+)
+
+_SCRIPT_RE = re.compile(r"<(script|style)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_BLOCK_TAG_RE = re.compile(r"<\s*/?\s*(p|div|br|tr|li|h[1-6]|table|section)\b[^>]*>", re.IGNORECASE)
+_TAG_RE = re.compile(r"<[^>]*>")
+_SPACES_RE = re.compile(r"[ \t\r\f\v ]+")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n+")
+
+
+def scan_headings(path, chunk_size=CHUNK_SIZE):
+    """
+    Stream the file and return (item, byte_offset) for every heading candidate.
+
+    Candidates include table-of-contents entries; select_sections() picks
+    the real section starts.
+    """
+    candidates = {}
+    with open(path, "rb") as f:
+        offset = 0
+        # The leading newline lets a heading at the very start of the file match
+        carry = b"\n"
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            data = carry + chunk
+            base = offset - len(carry)
+            for match in _HEADING_RE.finditer(data):
+                item = (match.group(2) + (match.group(3) or b"")).decode("ascii").upper()
+                start = match.start(1)
+                if item in ITEMS:
+                    candidates[base + start] = item
+            offset += len(chunk)
+            carry = data[-CHUNK_OVERLAP:]
+    return sorted((item, position) for position, item in candidates.items())
+
+
+def select_sections(candidates, file_size):
+    """
+    Choose one start offset per item and derive each item's byte range.
+
+    Table-of-contents entries are followed almost immediately by the next
+    heading, so for every item the candidate with the longest span to the
+    next candidate is taken as the real heading.
+
+    Returns:
+    dict: item -> [start, end] byte offsets
+    """
+    positions = sorted(position for _, position in candidates)
+    item_at = {position: item for item, position in candidates}
+    best = {}
+    for i, position in enumerate(positions):
+        span = (positions[i + 1] if i + 1 < len(positions) else file_size) - position
+        item = item_at[position]
+        if item not in best or span > best[item][1]:
+            best[item] = (position, span)
+
+    starts = sorted((position, item) for item, (position, _) in best.items())
+    sections = {}
+    for i, (position, item) in enumerate(starts):
+        end = starts[i + 1][0] if i + 1 < len(starts) else file_size
+        sections[item] = [position, end]
+    return sections
+
+
+def _index_path(path, index_dir=None):
+    if index_dir:
+        return os.path.join(index_dir, os.path.basename(path) + ".sections.json")
+    return path + ".sections.json"
+
+
+def build_index(path, index_dir=None):
+    """Scan the filing and write its section index; returns the index dict."""
+    stat = os.stat(path)
+    candidates = scan_headings(path)
+    index = {
+        "version": INDEX_VERSION,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sections": select_sections(candidates, stat.st_size),
+    }
+    index_path = _index_path(path, index_dir)
+    try:
+        with atomic_write(index_path, "w") as f:
+            json.dump(index, f)
+    except OSError as e:
+        logger.warning(f"Could not save section index for {path}: {e}")
+    logger.info(f"Indexed {len(index['sections'])} sections in {path}")
+    return index
+
+
+def load_index(path, index_dir=None):
+    """Return the section index for path, rebuilding it if missing or stale."""
+    index_path = _index_path(path, index_dir)
+    stat = os.stat(path)
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION and index["size"] == stat.st_size and index["mtime"] == stat.st_mtime:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    return build_index(path, index_dir)
+
+
+def html_to_text(raw):
+    """Convert an HTML (or plain-text) fragment to readable text."""
+    text = raw.decode("utf-8", errors="replace") if isinstance(raw, bytes) else raw
+    text = _SCRIPT_RE.sub(" ", text)
+    text = _BLOCK_TAG_RE.sub("\n", text)
+    text = _TAG_RE.sub("", text)
+    text = html.unescape(text)
+    text = _SPACES_RE.sub(" ", text)
+    text = _BLANK_LINES_RE.sub("\n\n", text)
+    return "\n".join(line.strip() for line in text.splitlines()).strip()
+
+
+def read_section_bytes(path, item, index_dir=None):
+    """Return the raw bytes of one item, reading only its byte range."""
+    item = str(item).upper().replace("ITEM", "").strip()
+    sections = load_index(path, index_dir)["sections"]
+    if item not in sections:
+        raise KeyError(f"Item {item} not found in {path}; available: {', '.join(sections)}")
+    start, end = sections[item]
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def get_section(path, item, index_dir=None):
+    """
+    Return the text of one 10-K item (e.g. "1A" or "7").
+
+    Parameters:
+    path (str): Path of the filing (.htm/.html/.txt)
+    item (str): Item number, with or without the "Item" prefix
+    index_dir (str): Where to keep the index (default: next to the filing)
+
+    Returns:
+    str: Section text
+    """
+    return html_to_text(read_section_bytes(path, item, index_dir))
+
+
+def get_sections(path, items=("1A", "7"), index_dir=None):
+    """Return {item: text} for the requested items that exist in the filing."""
+    sections = load_index(path, index_dir)["sections"]
+    return {item: get_section(path, item, index_dir) for item in items if item in sections}
+
+
+def section_prompt(path, items=("1A", "7"), max_tokens_per_section=SECTION_TOKEN_BUDGET):
+    """
+    Return the requested sections as a prompt block, each cut to a token budget.
+
+    Returns "" when none of the items could be located, so callers can
+    always include the result.
+    """
+    from context_compaction import truncate_to_tokens
+
+    try:
+        sections = get_sections(path, items)
+    except OSError as e:
+        logger.warning(f"Could not read filing {path}: {e}")
+        return ""
+    if not sections:
+        return ""
+    blocks = [
+        f"=== 10-K Item {item}: {SECTION_TITLES.get(item, '')} ===\n{truncate_to_tokens(text, max_tokens_per_section)}"
+        for item, text in sections.items()
+    ]
+    return "\n\n".join(blocks) + "\n"
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Local SEC filing store keyed by CIK, form type and accession number.
+
+Filings are kept as gzip-compressed originals named by their SHA-256
+content hash, so a document that is stored under several accessions (or
+downloaded twice) takes the space of one. A SQLite index holds the
+metadata (symbol, CIK, form, accession, filing date, primary document) for
+fast "latest 10-K for AAPL" lookups. When the newest stored filing is
+recent enough, the lookup does not touch the network at all; otherwise the
+EDGAR submissions feed is consulted and only a new filing is downloaded.
+
+Disk usage is capped (FINROBOT_FILING_STORE_MAX_MB, default 2048) by
+evicting the least recently used documents together with the plain-text
+working copies that filing_sections reads from.
+
+Usage:
+    store = FilingStore()
+    path = store.latest_filing_path("AAPL", "10-K")
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta
+
+from atomic_file import atomic_write
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_DIR = os.path.join(os.environ.get("FINROBOT_CACHE_DIR", "."), "filing_store")
+DEFAULT_MAX_MB = 2048
+
+# A stored filing younger than this is assumed to be the latest of its form
+FORM_MAX_AGE_DAYS = {"10-K": 370, "10-Q": 100, "20-F": 370}
+
+SEC_TICKERS_URL = "https://www.sec.gov/files/company_tickers.json"
+SEC_SUBMISSIONS_URL = "https://data.sec.gov/submissions/CIK{cik:010d}.json"
+SEC_ARCHIVE_URL = "https://www.sec.gov/Archives/edgar/data/{cik}/{accession}/{document}"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS filings (
+    cik INTEGER NOT NULL,
+    form TEXT NOT NULL,
+    accession TEXT NOT NULL,
+    symbol TEXT,
+    filing_date TEXT,
+    report_date TEXT,
+    primary_document TEXT,
+    content_hash TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (cik, form, accession)
+);
+CREATE INDEX IF NOT EXISTS filings_symbol ON filings (symbol, form, filing_date);
+CREATE TABLE IF NOT EXISTS blobs (
+    content_hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    compressed_size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ciks (
+    symbol TEXT PRIMARY KEY,
+    cik INTEGER NOT NULL
+);
+"""
+
+
+def _sec_user_agent():
+    # SEC requires a descriptive User-Agent with a contact address
+    return os.environ.get("SEC_USER_AGENT", "FinRobot research finrobot@example.com")
+
+
+def _http_get(url):
+    request = urllib.request.Request(url, headers={"User-Agent": _sec_user_agent(), "Accept-Encoding": "identity"})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return response.read()
+
+
+class FilingStore:
+    """Compressed, content-addressed filing storage with a metadata index."""
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or os.environ.get("FINROBOT_FILING_STORE", DEFAULT_STORE_DIR)
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("FINROBOT_FILING_STORE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(self.directory, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(self.directory, "work"), exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(self.directory, "index.db"), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+
+    # -- blobs -----------------------------------------------------------
+
+    def _blob_path(self, content_hash):
+        return os.path.join(self.directory, "blobs", content_hash[:2], f"{content_hash}.gz")
+
+    def _work_path(self, content_hash, document):
+        extension = os.path.splitext(document or "")[1] or ".htm"
+        return os.path.join(self.directory, "work", f"{content_hash}{extension}")
+
+    def _put_blob(self, content):
+        """Store content once per hash; returns the hash."""
+        content_hash = hashlib.sha256(content).hexdigest()
+        path = self._blob_path(content_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with atomic_write(path) as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as f:
+                f.write(content)
+        self._conn.execute(
+            "INSERT OR IGNORE INTO blobs (content_hash, size, compressed_size) VALUES (?, ?, ?)",
+            (content_hash, len(content), os.path.getsize(path)),
+        )
+        return content_hash
+
+    # -- metadata --------------------------------------------------------
+
+    def add_filing(self, content, cik, form, accession, symbol=None, filing_date=None, report_date=None, primary_document=None):
+        """
+        Store a filing document and its metadata.
+
+        Returns:
+        str: Content hash of the stored document
+        """
+        with self._lock:
+            content_hash = self._put_blob(content)
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO filings (cik, form, accession, symbol, filing_date, report_date, "
+                "primary_document, content_hash, stored_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (int(cik), form, accession, symbol.upper() if symbol else None, filing_date, report_date,
+                 primary_document, content_hash, now, now),
+            )
+            self._enforce_limit(keep=content_hash)
+        return content_hash
+
+    def has_filing(self, cik, form, accession):
+        row = self._conn.execute(
+            "SELECT 1 FROM filings WHERE cik = ? AND form = ? AND accession = ?", (int(cik), form, accession)
+        ).fetchone()
+        return row is not None
+
+    def latest(self, symbol, form="10-K"):
+        """Return the metadata of the newest stored filing for symbol, or None."""
+        row = self._conn.execute(
+            "SELECT * FROM filings WHERE symbol = ? AND form = ? ORDER BY filing_date DESC LIMIT 1",
+            (symbol.upper(), form),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def filing_path(self, filing):
+        """
+        Return a plain-text working copy of a stored filing for section reads.
+
+        The copy is decompressed once and reused; filing_sections keeps its
+        byte-offset index next to it.
+        """
+        with self._lock:
+            content_hash = filing["content_hash"]
+            path = self._work_path(content_hash, filing.get("primary_document"))
+            if not os.path.exists(path):
+                with gzip.open(self._blob_path(content_hash), "rb") as src, atomic_write(path) as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+            self._conn.execute(
+                "UPDATE filings SET last_access = ? WHERE content_hash = ?", (time.time(), content_hash)
+            )
+            self._enforce_limit(keep=content_hash)
+        return path
+
+    def read(self, filing):
+        with gzip.open(self._blob_path(filing["content_hash"]), "rb") as f:
+            return f.read()
+
+    # -- eviction --------------------------------------------------------
+
+    def disk_usage(self):
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            if root == self.directory:
+                continue
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        return total
+
+    def _enforce_limit(self, keep=None):
+        """Evict least recently used documents until the store fits max_bytes."""
+        usage = self.disk_usage()
+        if usage <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT content_hash, MAX(last_access) AS last_access FROM filings GROUP BY content_hash ORDER BY last_access"
+        ).fetchall()
+        for row in rows:
+            if usage <= self.max_bytes:
+                break
+            content_hash = row["content_hash"]
+            if content_hash == keep:
+                continue
+            freed = 0
+            for path in [self._blob_path(content_hash)] + self._work_files(content_hash):
+                if os.path.exists(path):
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+            self._conn.execute("DELETE FROM filings WHERE content_hash = ?", (content_hash,))
+            self._conn.execute("DELETE FROM blobs WHERE content_hash = ?", (content_hash,))
+            usage -= freed
+            logger.info(f"Evicted filing {content_hash[:12]} ({freed} bytes)")
+
+    def _work_files(self, content_hash):
+        work_dir = os.path.join(self.directory, "work")
+        return [os.path.join(work_dir, name) for name in os.listdir(work_dir) if name.startswith(content_hash)]
+
+    # -- EDGAR -----------------------------------------------------------
+
+    def cik_for(self, symbol):
+        """Resolve a ticker to its CIK, caching the SEC ticker map in the index."""
+        symbol = symbol.upper()
+        row = self._conn.execute("SELECT cik FROM ciks WHERE symbol = ?", (symbol,)).fetchone()
+        if row:
+            return row["cik"]
+        tickers = json.loads(_http_get(SEC_TICKERS_URL))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO ciks (symbol, cik) VALUES (?, ?)",
+                [(entry["ticker"].upper(), int(entry["cik_str"])) for entry in tickers.values()],
+            )
+        row = self._conn.execute("SELECT cik FROM ciks WHERE symbol = ?", (symbol,)).fetchone()
+        if row is None:
+            raise KeyError(f"No CIK found for {symbol}")
+        return row["cik"]
+
+    def fetch_latest(self, symbol, form="10-K"):
+        """
+        Check EDGAR for the newest filing of form and download it if it is not stored.
+
+        Returns:
+        dict: Metadata of the newest filing, or None if EDGAR lists none
+        """
+        cik = self.cik_for(symbol)
+        recent = json.loads(_http_get(SEC_SUBMISSIONS_URL.format(cik=cik)))["filings"]["recent"]
+        for i, filing_form in enumerate(recent["form"]):
+            if filing_form != form:
+                continue
+            accession = recent["accessionNumber"][i]
+            if not self.has_filing(cik, form, accession):
+                document = recent["primaryDocument"][i]
+                url = SEC_ARCHIVE_URL.format(cik=cik, accession=accession.replace("-", ""), document=document)
+                logger.info(f"Downloading {form} {accession} for {symbol}")
+                self.add_filing(
+                    _http_get(url), cik, form, accession, symbol,
+                    filing_date=recent["filingDate"][i],
+                    report_date=recent["reportDate"][i],
+                    primary_document=document,
+                )
+            return self.latest(symbol, form)
+        return None
+
+    def latest_filing(self, symbol, form="10-K", max_age_days=None):
+        """
+        Return metadata of the latest filing, using the network only when needed.
+
+        A stored filing filed within max_age_days (default per form, e.g.
+        370 days for a 10-K) is returned without contacting EDGAR.
+        """
+        max_age_days = max_age_days if max_age_days is not None else FORM_MAX_AGE_DAYS.get(form, 370)
+        stored = self.latest(symbol, form)
+        if stored and stored["filing_date"]:
+            cutoff = (datetime.now() - timedelta(days=max_age_days)).strftime("%Y-%m-%d")
+            if stored["filing_date"] >= cutoff:
+                return stored
+        try:
+            return self.fetch_latest(symbol, form) or stored
+        except Exception as e:
+            if stored:
+                logger.warning(f"EDGAR lookup for {symbol} failed, using stored {form} from {stored['filing_date']}: {e}")
+                return stored
+            raise
+
+    def latest_filing_path(self, symbol, form="10-K"):
+        """Return the working-copy path of the latest filing, or None."""
+        filing = self.latest_filing(symbol, form)
+        return self.filing_path(filing) if filing else None
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Conversation-history pruning for FinRobot agents.
+
+autogen sends an agent's whole conversation with every LLM call, so with
+max_turns=10 nested chats and tool calls returning whole price tables,
+each turn is longer and more expensive than the one before. A HistoryPolicy
+rewrites the messages each reply is generated from (the stored history is
+left untouched):
+
+- the system message and the first (task) message are always kept;
+- the last `window` messages are kept verbatim (never splitting a tool call
+  from its tool responses);
+- everything between them is folded into one rolling summary message that
+  is extended incrementally as messages leave the window. The summary is
+  extractive (chat_summary.select_key_sections) unless a summarize callable
+  is given;
+- tool outputs that have already been answered by the model are cut to a
+  short digest (context_compaction.compact_message), even inside the window.
+
+Prompt tokens per turn are therefore bounded by the task, the summary
+budget and the window, whatever the length of the conversation.
+
+install_history_policy() attaches a policy to every LLM agent created
+afterwards; FINROBOT_HISTORY_WINDOW sets the window, and "off" disables it.
+"""
+
+import functools
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from chat_summary import select_key_sections
+from context_compaction import compact_message, count_tokens
+
+logger = logging.getLogger(__name__)
+
+WINDOW_MESSAGES = 6
+PINNED_MESSAGES = 1
+SUMMARY_TOKEN_BUDGET = 400
+CONSUMED_TOOL_OUTPUT_TOKENS = 150
+# Upper bound for the window; older window messages move into the summary beyond it
+MAX_WINDOW_TOKENS = 6000
+MAX_CACHED_SUMMARIES = 256
+
+
+def _text(message):
+    content = message.get("content")
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content if isinstance(content, str) else ""
+
+
+def _fingerprint(messages):
+    digest = hashlib.sha1()
+    for message in messages:
+        digest.update(f"{message.get('role')}\0{_text(message)}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _is_tool_response(message):
+    return message.get("role") in ("tool", "function") or bool(message.get("tool_responses"))
+
+
+def describe(message, tool_output_tokens=CONSUMED_TOOL_OUTPUT_TOKENS):
+    """One message as a line of text for the summary."""
+    speaker = message.get("name") or message.get("role", "")
+    calls = message.get("tool_calls") or ([{"function": message["function_call"]}] if message.get("function_call") else [])
+    parts = []
+    if _text(message).strip():
+        text = _text(message)
+        if _is_tool_response(message):
+            text = compact_message(text, tool_output_tokens)
+        parts.append(text.strip())
+    for call in calls:
+        function = call.get("function") or {}
+        parts.append(f"called {function.get('name', '')}({function.get('arguments', '')})")
+    return f"{speaker}: " + "\n".join(parts) if parts else ""
+
+
+class HistoryPolicy:
+    """Sliding window plus rolling summary over the messages sent to the model."""
+
+    def __init__(self, window=WINDOW_MESSAGES, pinned=PINNED_MESSAGES, summary_tokens=SUMMARY_TOKEN_BUDGET,
+                 tool_output_tokens=CONSUMED_TOOL_OUTPUT_TOKENS, max_window_tokens=MAX_WINDOW_TOKENS, summarize=None):
+        self.window = window
+        self.pinned = pinned
+        self.summary_tokens = summary_tokens
+        self.tool_output_tokens = tool_output_tokens
+        self.max_window_tokens = max_window_tokens
+        self.summarize = summarize or (lambda texts, max_tokens: select_key_sections(texts, max_tokens))
+        self._summaries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _compact_consumed(self, messages):
+        """Copies of messages with tool outputs that were answered afterwards cut to a digest."""
+        answered = False
+        result = []
+        for message in reversed(messages):
+            if answered and _is_tool_response(message) and count_tokens(_text(message)) > self.tool_output_tokens:
+                message = dict(message, content=compact_message(_text(message), self.tool_output_tokens))
+                if message.get("tool_responses"):
+                    message["tool_responses"] = [
+                        dict(response, content=compact_message(str(response.get("content", "")), self.tool_output_tokens))
+                        for response in message["tool_responses"]
+                    ]
+            elif message.get("role") == "assistant":
+                answered = True
+            result.append(message)
+        return result[::-1]
+
+    def _window_start(self, messages):
+        start = max(self.pinned, len(messages) - self.window)
+        # Shrink an oversized window, but keep at least the last message
+        while start < len(messages) - 1 and sum(count_tokens(_text(m)) for m in messages[start:]) > self.max_window_tokens:
+            start += 1
+            while start < len(messages) - 1 and _is_tool_response(messages[start]):
+                start += 1
+        # Never send a tool response without the assistant message that requested it,
+        # even if that takes the window over max_window_tokens
+        while start > self.pinned and _is_tool_response(messages[start]):
+            start -= 1
+        return start
+
+    def _summary(self, pinned, dropped):
+        """Rolling summary of dropped, extended from the cached summary of a prefix of it."""
+        key = _fingerprint(pinned)
+        with self._lock:
+            cached = self._summaries.get(key)
+            if cached is not None:
+                self._summaries.move_to_end(key)
+        count, prefix_fingerprint, summary = cached if cached else (0, None, "")
+        if count > len(dropped) or (count and _fingerprint(dropped[:count]) != prefix_fingerprint):
+            # Another conversation with the same task, or a rewritten history: start over
+            count, summary = 0, ""
+        if count == len(dropped):
+            return summary
+        new_texts = [text for text in (describe(m, self.tool_output_tokens) for m in dropped[count:]) if text]
+        summary = self.summarize(([summary] if summary else []) + new_texts, self.summary_tokens)
+        with self._lock:
+            self._summaries[key] = (len(dropped), _fingerprint(dropped), summary)
+            while len(self._summaries) > MAX_CACHED_SUMMARIES:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def apply(self, messages):
+        """
+        The messages to generate the next reply from.
+
+        Parameters:
+        messages (list): The agent's conversation (not modified)
+
+        Returns:
+        list: Pinned messages, a summary of the middle, and the recent window
+        """
+        if not messages:
+            return messages
+        messages = self._compact_consumed(messages)
+        start = self._window_start(messages)
+        if start <= self.pinned:
+            return messages
+        pinned, dropped, window = messages[:self.pinned], messages[self.pinned:start], messages[start:]
+        summary = self._summary(pinned, dropped)
+        summary_message = {
+            "role": "system",
+            "content": f"Summary of {len(dropped)} earlier messages of this conversation:\n{summary}",
+        }
+        return pinned + [summary_message] + window
+
+    def add_to_agent(self, agent):
+        """Apply the policy before every reply of agent (autogen 0.2 hook)."""
+        agent.register_hook("process_all_messages_before_reply", self.apply)
+        return agent
+
+
+_policy = None
+
+
+def get_history_policy():
+    """Return the installed policy, or None when pruning is off."""
+    return _policy
+
+
+def _patch_autogen(policy):
+    from autogen import ConversableAgent
+
+    if not hasattr(ConversableAgent, "process_all_messages_before_reply"):
+        raise ImportError("this autogen version has no process_all_messages_before_reply hook")
+
+    original_init = ConversableAgent.__init__
+
+    @functools.wraps(original_init)
+    def __init__(self, *args, **kwargs):
+        original_init(self, *args, **kwargs)
+        # Only agents that call a model have a prompt to prune
+        if self.llm_config:
+            policy.add_to_agent(self)
+
+    ConversableAgent.__init__ = __init__
+
+
+def install_history_policy(policy=None):
+    """
+    Attach a HistoryPolicy to every LLM agent created from now on.
+
+    Must run before agents are created. Reads FINROBOT_HISTORY_WINDOW (the
+    number of recent messages kept verbatim, or "off").
+
+    Returns:
+    HistoryPolicy: The installed policy, or None when pruning is off
+    """
+    global _policy
+    if _policy is not None:
+        return _policy
+    setting = os.environ.get("FINROBOT_HISTORY_WINDOW", "")
+    if setting.lower() in ("off", "0", "false"):
+        return None
+    policy = policy or HistoryPolicy(window=int(setting) if setting else WINDOW_MESSAGES)
+    try:
+        _patch_autogen(policy)
+    except ImportError as e:
+        logger.warning(f"autogen not available, history pruning is off: {e}")
+        return None
+    _policy = policy
+    return policy
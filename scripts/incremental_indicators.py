@@ -0,0 +1,461 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Stateful technical indicators that update in O(1) per new bar.
+
+technical_indicators.py recomputes everything from the full history. The
+classes here keep only what the next value depends on (last EMA values,
+Wilder average gain/loss, rolling sums of the Bollinger window, previous
+close) and can snapshot that state to a dict. IndicatorStateStore persists
+one snapshot per symbol as JSON, so a later run only feeds the bars that
+arrived since the last one. Values match technical_indicators for the
+same history. Today's (still changing) bar is never saved, and state that
+ends before a gap in the fetched data is rebuilt rather than resumed.
+
+Usage:
+    from incremental_indicators import update_indicators
+    indicators = update_indicators("AAPL", stock_data)
+    print(indicators.values())
+"""
+
+import json
+import logging
+import math
+import os
+from collections import deque
+
+import pandas as pd
+
+from atomic_file import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the state layout or the indicator parameters change; older
+# snapshots are then rebuilt from history instead of being resumed
+STATE_VERSION = 1
+
+# Bollinger rolling sums are recomputed from the window this often to stop
+# floating-point drift from accumulating over long runs
+BOLLINGER_RESYNC_INTERVAL = 1000
+
+# Business days that may be missing between the stored last bar and the first
+# new bar (a market holiday); a longer gap means bars were skipped
+MAX_MISSING_BUSINESS_DAYS = 1
+
+
+class IncrementalEMA:
+    """EMA seeded with the first value, like pandas ewm(adjust=False)."""
+
+    def __init__(self, span=None, alpha=None, value=None, count=0):
+        if alpha is None:
+            if span is None:
+                raise ValueError("Either span or alpha is required")
+            alpha = 2.0 / (span + 1)
+        self.alpha = alpha
+        self.value = value
+        self.count = count
+
+    def update(self, x):
+        if x is None or math.isnan(x):
+            return self.value
+        if self.value is None:
+            self.value = float(x)
+        else:
+            self.value = self.alpha * x + (1.0 - self.alpha) * self.value
+        self.count += 1
+        return self.value
+
+    def to_state(self):
+        return {"alpha": self.alpha, "value": self.value, "count": self.count}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(**state)
+
+
+class IncrementalRSI:
+    """Wilder's RSI from smoothed average gain and loss."""
+
+    def __init__(self, period=14, prev_close=None, avg_gain=None, avg_loss=None):
+        self.period = period
+        self.prev_close = prev_close
+        self.avg_gain = IncrementalEMA.from_state(avg_gain) if avg_gain else IncrementalEMA(alpha=1.0 / period)
+        self.avg_loss = IncrementalEMA.from_state(avg_loss) if avg_loss else IncrementalEMA(alpha=1.0 / period)
+
+    @property
+    def value(self):
+        gain, loss = self.avg_gain.value, self.avg_loss.value
+        # A flat window (no gains or losses) has no RSI, as in technical_indicators.rsi
+        if gain is None or loss is None or gain == loss == 0:
+            return None
+        if loss == 0:
+            return 100.0
+        return 100.0 - 100.0 / (1.0 + gain / loss)
+
+    def update(self, close):
+        if self.prev_close is not None:
+            delta = close - self.prev_close
+            self.avg_gain.update(max(delta, 0.0))
+            self.avg_loss.update(max(-delta, 0.0))
+        self.prev_close = float(close)
+        return self.value
+
+    def to_state(self):
+        return {
+            "period": self.period,
+            "prev_close": self.prev_close,
+            "avg_gain": self.avg_gain.to_state(),
+            "avg_loss": self.avg_loss.to_state(),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(**state)
+
+
+class IncrementalMACD:
+    """MACD line, signal line and histogram from three running EMAs."""
+
+    def __init__(self, fast=12, slow=26, signal=9, fast_ema=None, slow_ema=None, signal_ema=None):
+        self.fast, self.slow, self.signal = fast, slow, signal
+        self.fast_ema = IncrementalEMA.from_state(fast_ema) if fast_ema else IncrementalEMA(span=fast)
+        self.slow_ema = IncrementalEMA.from_state(slow_ema) if slow_ema else IncrementalEMA(span=slow)
+        self.signal_ema = IncrementalEMA.from_state(signal_ema) if signal_ema else IncrementalEMA(span=signal)
+
+    @property
+    def value(self):
+        if self.signal_ema.value is None:
+            return None
+        macd_line = self.fast_ema.value - self.slow_ema.value
+        return {"macd": macd_line, "signal": self.signal_ema.value, "hist": macd_line - self.signal_ema.value}
+
+    def update(self, close):
+        self.fast_ema.update(close)
+        self.slow_ema.update(close)
+        self.signal_ema.update(self.fast_ema.value - self.slow_ema.value)
+        return self.value
+
+    def to_state(self):
+        return {
+            "fast": self.fast,
+            "slow": self.slow,
+            "signal": self.signal,
+            "fast_ema": self.fast_ema.to_state(),
+            "slow_ema": self.slow_ema.to_state(),
+            "signal_ema": self.signal_ema.to_state(),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(**state)
+
+
+class IncrementalBollinger:
+    """Bollinger Bands from rolling sums over the last window closes."""
+
+    def __init__(self, window=20, num_std=2.0, values=None, updates_since_resync=0):
+        self.window = window
+        self.num_std = num_std
+        self.values = deque(values or [], maxlen=window)
+        self.updates_since_resync = updates_since_resync
+        self._resync()
+
+    def _resync(self):
+        self.total = math.fsum(self.values)
+        self.total_sq = math.fsum(v * v for v in self.values)
+        self.updates_since_resync = 0
+
+    @property
+    def value(self):
+        if len(self.values) < self.window:
+            return None
+        n = self.window
+        mid = self.total / n
+        variance = max((self.total_sq - n * mid * mid) / (n - 1), 0.0)
+        std = math.sqrt(variance)
+        upper = mid + self.num_std * std
+        lower = mid - self.num_std * std
+        last = self.values[-1]
+        return {
+            "upper": upper,
+            "mid": mid,
+            "lower": lower,
+            "pct_b": (last - lower) / (upper - lower) if upper != lower else None,
+        }
+
+    def update(self, close):
+        close = float(close)
+        if len(self.values) == self.window:
+            dropped = self.values[0]
+            self.total -= dropped
+            self.total_sq -= dropped * dropped
+        self.values.append(close)
+        self.total += close
+        self.total_sq += close * close
+        self.updates_since_resync += 1
+        if self.updates_since_resync >= BOLLINGER_RESYNC_INTERVAL:
+            self._resync()
+        return self.value
+
+    def to_state(self):
+        return {
+            "window": self.window,
+            "num_std": self.num_std,
+            "values": list(self.values),
+            "updates_since_resync": self.updates_since_resync,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(**state)
+
+
+class IncrementalATR:
+    """Average True Range with Wilder's smoothing."""
+
+    def __init__(self, period=14, prev_close=None, average=None):
+        self.period = period
+        self.prev_close = prev_close
+        self.average = IncrementalEMA.from_state(average) if average else IncrementalEMA(alpha=1.0 / period)
+
+    @property
+    def value(self):
+        return self.average.value
+
+    def update(self, high, low, close):
+        true_range = high - low
+        if self.prev_close is not None:
+            true_range = max(true_range, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.prev_close = float(close)
+        return self.average.update(true_range)
+
+    def to_state(self):
+        return {"period": self.period, "prev_close": self.prev_close, "average": self.average.to_state()}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(**state)
+
+
+class SymbolIndicators:
+    """The indicator set for one symbol plus the timestamp of the last bar fed."""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.last_timestamp = state.get("last_timestamp")
+        self.bars = state.get("bars", 0)
+        self.ema12 = IncrementalEMA.from_state(state["ema12"]) if "ema12" in state else IncrementalEMA(span=12)
+        self.ema26 = IncrementalEMA.from_state(state["ema26"]) if "ema26" in state else IncrementalEMA(span=26)
+        self.rsi = IncrementalRSI.from_state(state["rsi"]) if "rsi" in state else IncrementalRSI(14)
+        self.macd = IncrementalMACD.from_state(state["macd"]) if "macd" in state else IncrementalMACD()
+        self.bollinger = (
+            IncrementalBollinger.from_state(state["bollinger"]) if "bollinger" in state else IncrementalBollinger()
+        )
+        self.atr = IncrementalATR.from_state(state["atr"]) if "atr" in state else IncrementalATR(14)
+
+    def update_bar(self, timestamp, close, high=None, low=None):
+        """Feed one bar; high and low default to close when missing."""
+        close = float(close)
+        high = close if high is None or math.isnan(high) else float(high)
+        low = close if low is None or math.isnan(low) else float(low)
+        self.ema12.update(close)
+        self.ema26.update(close)
+        self.rsi.update(close)
+        self.macd.update(close)
+        self.bollinger.update(close)
+        self.atr.update(high, low, close)
+        self.last_timestamp = pd.Timestamp(timestamp).isoformat()
+        self.bars += 1
+
+    def _last_timestamp_like(self, index):
+        """The stored last timestamp in the time zone of index."""
+        last = pd.Timestamp(self.last_timestamp)
+        if index.tz is not None and last.tz is None:
+            return last.tz_localize(index.tz)
+        if index.tz is None and last.tz is not None:
+            return last.tz_convert(None)
+        return last
+
+    def resumes(self, stock_data):
+        """
+        Whether stock_data continues the bars fed so far without a gap.
+
+        It must overlap the last bar seen or start at most one trading day
+        (plus MAX_MISSING_BUSINESS_DAYS holidays) after it.
+        """
+        stock_data = stock_data.dropna(subset=["Close"])
+        if self.last_timestamp is None or stock_data.empty:
+            return True
+        last = self._last_timestamp_like(stock_data.index)
+        first = stock_data.index[0]
+        if first <= last:
+            return True
+        missing = len(pd.bdate_range(last.normalize() + pd.Timedelta(days=1), first.normalize() - pd.Timedelta(days=1)))
+        return missing <= MAX_MISSING_BUSINESS_DAYS
+
+    def is_ahead_of(self, stock_data):
+        """Whether the bars fed so far go past the last bar of stock_data (an older window)."""
+        stock_data = stock_data.dropna(subset=["Close"])
+        if self.last_timestamp is None or stock_data.empty:
+            return False
+        return self._last_timestamp_like(stock_data.index) > stock_data.index[-1]
+
+    def update_frame(self, stock_data):
+        """
+        Feed the bars of stock_data that are newer than the last one seen.
+
+        Parameters:
+        stock_data (DataFrame): Date-indexed frame with Close (and optionally High, Low)
+
+        Returns:
+        int: Number of bars processed
+        """
+        stock_data = stock_data.dropna(subset=["Close"])
+        if self.last_timestamp is not None:
+            stock_data = stock_data[stock_data.index > self._last_timestamp_like(stock_data.index)]
+
+        closes = stock_data["Close"].astype(float).tolist()
+        highs = stock_data["High"].astype(float).tolist() if "High" in stock_data else [None] * len(closes)
+        lows = stock_data["Low"].astype(float).tolist() if "Low" in stock_data else [None] * len(closes)
+        for timestamp, close, high, low in zip(stock_data.index, closes, highs, lows):
+            self.update_bar(timestamp, close, high, low)
+        return len(closes)
+
+    def values(self):
+        """Latest indicator values, named like technical_indicators.indicator_frame columns."""
+        values = {
+            "EMA_12": self.ema12.value,
+            "EMA_26": self.ema26.value,
+            "RSI_14": self.rsi.value,
+            "ATR_14": self.atr.value,
+        }
+        macd = self.macd.value or {}
+        values.update({"MACD": macd.get("macd"), "MACD_Signal": macd.get("signal"), "MACD_Hist": macd.get("hist")})
+        bands = self.bollinger.value or {}
+        values.update({"BB_Upper": bands.get("upper"), "BB_Middle": bands.get("mid"), "BB_Lower": bands.get("lower")})
+        return values
+
+    def to_state(self):
+        return {
+            "version": STATE_VERSION,
+            "last_timestamp": self.last_timestamp,
+            "bars": self.bars,
+            "ema12": self.ema12.to_state(),
+            "ema26": self.ema26.to_state(),
+            "rsi": self.rsi.to_state(),
+            "macd": self.macd.to_state(),
+            "bollinger": self.bollinger.to_state(),
+            "atr": self.atr.to_state(),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state)
+
+    def copy(self):
+        return SymbolIndicators.from_state(self.to_state())
+
+
+def split_partial_bar(stock_data, now=None):
+    """
+    Split stock_data into completed bars and the bars dated today.
+
+    Today's bar is still changing during the session, so it must not be
+    committed to the stored state.
+
+    Returns:
+    tuple: (completed bars, today's bars)
+    """
+    index = stock_data.index
+    now = pd.Timestamp(now) if now is not None else pd.Timestamp.now(tz=index.tz)
+    if index.tz is not None:
+        now = now.tz_localize(index.tz) if now.tz is None else now.tz_convert(index.tz)
+    elif now.tz is not None:
+        now = now.tz_localize(None)
+    today = now.normalize()
+    dated_today = index >= today
+    return stock_data[~dated_today], stock_data[dated_today]
+
+
+def default_state_dir():
+    """FINROBOT_INDICATOR_STATE_DIR, else indicator_state under FINROBOT_CACHE_DIR, else ./indicator_state."""
+    if os.environ.get("FINROBOT_INDICATOR_STATE_DIR"):
+        return os.environ["FINROBOT_INDICATOR_STATE_DIR"]
+    return os.path.join(os.environ.get("FINROBOT_CACHE_DIR", "."), "indicator_state")
+
+
+class IndicatorStateStore:
+    """One JSON snapshot per symbol in a directory."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or default_state_dir()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, symbol):
+        return os.path.join(self.directory, f"{symbol.upper()}.json")
+
+    def load(self, symbol):
+        """Return the stored SymbolIndicators for symbol, or None."""
+        path = self._path(symbol)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Discarding unreadable indicator state for {symbol}: {e}")
+            return None
+        if state.get("version") != STATE_VERSION:
+            logger.info(f"Indicator state for {symbol} has an old layout, rebuilding")
+            return None
+        return SymbolIndicators.from_state(state)
+
+    def save(self, symbol, indicators):
+        path = self._path(symbol)
+        with atomic_write(path, "w") as f:
+            json.dump(indicators.to_state(), f)
+
+
+def update_indicators(symbol, stock_data, store=None):
+    """
+    Resume symbol's stored indicator state with the new bars in stock_data.
+
+    The first call processes the whole history; later calls only the bars
+    after the stored last timestamp. If stock_data starts after a gap (the
+    state is older than the data fetched), the state is rebuilt from
+    stock_data instead of resumed. If the state is newer than stock_data (a
+    historical window), the indicators are computed from stock_data alone
+    and the store is left as it is, so no later bar leaks into the result.
+    Only completed bars are saved: today's bar is applied to the returned
+    indicators but fed again on the next run.
+
+    Parameters:
+    symbol (str): Stock ticker symbol
+    stock_data (DataFrame): OHLCV history covering at least the new bars
+    store (IndicatorStateStore): Where state is kept (default: default_state_dir())
+
+    Returns:
+    SymbolIndicators: Updated indicators
+    """
+    store = store or IndicatorStateStore()
+    completed, partial = split_partial_bar(stock_data)
+    indicators = store.load(symbol)
+    if indicators is not None and indicators.is_ahead_of(stock_data):
+        logger.info(f"Indicator state for {symbol} ends at {indicators.last_timestamp}, after the requested data; computing it apart")
+        indicators = SymbolIndicators()
+        indicators.update_frame(stock_data)
+        return indicators
+    if indicators is not None and not indicators.resumes(completed if len(completed) else partial):
+        logger.info(f"Indicator state for {symbol} ends at {indicators.last_timestamp}, before a gap in the data; rebuilding")
+        indicators = None
+    indicators = indicators or SymbolIndicators()
+    processed = indicators.update_frame(completed)
+    if processed:
+        store.save(symbol, indicators)
+    logger.info(f"Updated indicators for {symbol} with {processed} new bar(s) ({indicators.bars} total)")
+    if len(partial):
+        # Today's bar is provisional: apply it to a copy, never to the saved state
+        indicators = indicators.copy()
+        indicators.update_frame(partial)
+    return indicators
@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Durable SQLite job queue with per-stage checkpoints for multi-stage analyses.
+
+A job is a named pipeline (for example annual report analysis followed by
+a trade recommendation) plus JSON parameters. Each stage's output is
+checkpointed as soon as the stage finishes; when a stage raises, the job
+is re-queued with exponential backoff and the next attempt resumes after
+the last completed stage, so an expensive annual-report analysis is never
+redone because the strategist step timed out. Workers claim jobs with a
+short lease that a heartbeat renews while a stage runs, so several threads
+or processes can pull from the same database and a crashed worker's job
+becomes claimable again soon after it dies. A worker restarted on the same
+host reclaims the jobs of dead processes there at once, without waiting
+for their leases to expire.
+
+Usage:
+    queue = JobQueue("finrobot_jobs.db")
+    queue.enqueue("investment_recommendation", {"symbol": "AAPL"}, job_id="AAPL:2025-06-01")
+    run_workers(queue, {"investment_recommendation": pipeline}, num_workers=4)
+"""
+
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = "finrobot_jobs.db"
+MAX_ATTEMPTS = 3
+BACKOFF_SECONDS = 30
+# Leases are renewed every LEASE_SECONDS / HEARTBEATS_PER_LEASE while a job runs
+LEASE_SECONDS = 120
+HEARTBEATS_PER_LEASE = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    pipeline TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    next_run_at REAL NOT NULL,
+    lease_until REAL,
+    worker TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, next_run_at);
+CREATE TABLE IF NOT EXISTS stages (
+    job_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    output TEXT NOT NULL,
+    seconds REAL,
+    finished REAL NOT NULL,
+    PRIMARY KEY (job_id, stage)
+);
+"""
+
+
+class Pipeline:
+    """
+    Ordered stages of a job.
+
+    Each stage is (name, func); func(params, outputs) receives the job
+    parameters and the outputs of the completed stages by name and returns
+    a JSON-serializable output.
+    """
+
+    def __init__(self, name, stages):
+        self.name = name
+        self.stages = list(stages)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        # Exists but belongs to someone else (or cannot be checked): assume alive
+        return True
+    return True
+
+
+def worker_name(index):
+    """Worker id: host, process id and thread index."""
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+class JobQueue:
+    """SQLite-backed queue; safe to share between threads and processes."""
+
+    def __init__(self, db_path=None, backoff_seconds=BACKOFF_SECONDS, lease_seconds=LEASE_SECONDS):
+        self.db_path = db_path or os.environ.get("FINROBOT_JOB_DB", DEFAULT_DB_PATH)
+        self.backoff_seconds = backoff_seconds
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        # One connection per thread; WAL lets readers proceed while a worker writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, pipeline, params, job_id=None, max_attempts=MAX_ATTEMPTS):
+        """
+        Add a job unless one with the same id exists.
+
+        Parameters:
+        pipeline (str): Pipeline name
+        params (dict): JSON-serializable job parameters
+        job_id (str): Stable id (e.g. symbol and date) so re-running a batch
+            does not duplicate finished or pending work
+        max_attempts (int): Attempts before the job is marked failed
+
+        Returns:
+        str: The job id
+        """
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT OR IGNORE INTO jobs (id, pipeline, params, status, max_attempts, next_run_at, created, updated) "
+            "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+            (job_id, pipeline, json.dumps(params), max_attempts, now, now, now),
+        )
+        return job_id
+
+    def retry(self, job_id):
+        """Re-queue a failed job; completed stages are kept."""
+        self._connect().execute(
+            "UPDATE jobs SET status = 'queued', attempts = 0, next_run_at = ?, error = NULL, updated = ? "
+            "WHERE id = ? AND status = 'failed'",
+            (time.time(), time.time(), job_id),
+        )
+
+    def _orphaned(self, conn):
+        """Ids of running jobs leased by processes on this host that no longer exist."""
+        host = socket.gethostname()
+        rows = conn.execute("SELECT id, worker FROM jobs WHERE status = 'running' AND worker LIKE ?", (f"{host}:%",))
+        orphaned = []
+        for row in rows:
+            try:
+                pid = int(row["worker"].split(":")[1])
+            except (IndexError, ValueError):
+                continue
+            if pid != os.getpid() and not _pid_alive(pid):
+                orphaned.append(row["id"])
+        return orphaned
+
+    def claim(self, worker, pipelines=None):
+        """
+        Claim the next runnable job for worker.
+
+        Queued jobs whose backoff has elapsed, running jobs whose lease has
+        expired, and running jobs of dead processes on this host (their
+        worker crashed) are all runnable.
+
+        Returns:
+        dict: Job row with decoded params, or None
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            orphaned = self._orphaned(conn)
+            query = (
+                "SELECT * FROM jobs WHERE ((status = 'queued' AND next_run_at <= ?) "
+                "OR (status = 'running' AND lease_until < ?)"
+            )
+            args = [now, now]
+            if orphaned:
+                query += f" OR id IN ({', '.join('?' * len(orphaned))})"
+                args.extend(orphaned)
+            query += ")"
+            if pipelines:
+                query += f" AND pipeline IN ({', '.join('?' * len(pipelines))})"
+                args.extend(pipelines)
+            row = conn.execute(query + " ORDER BY next_run_at LIMIT 1", args).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1, updated = ? "
+                "WHERE id = ?",
+                (worker, now + self.lease_seconds, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["attempts"] += 1
+        job["worker"] = worker
+        return job
+
+    def renew(self, job_id, worker):
+        """
+        Extend worker's lease on a running job.
+
+        Returns:
+        bool: False if the job is no longer leased to worker
+        """
+        now = time.time()
+        cursor = self._connect().execute(
+            "UPDATE jobs SET lease_until = ?, updated = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (now + self.lease_seconds, now, job_id, worker),
+        )
+        return cursor.rowcount > 0
+
+    def stage_outputs(self, job_id):
+        """Return {stage: output} for the job's completed stages."""
+        rows = self._connect().execute("SELECT stage, output FROM stages WHERE job_id = ?", (job_id,))
+        return {row["stage"]: json.loads(row["output"]) for row in rows}
+
+    def checkpoint(self, job_id, stage, output, seconds=None):
+        """Store a stage's output and extend the job's lease."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO stages (job_id, stage, output, seconds, finished) VALUES (?, ?, ?, ?, ?)",
+            (job_id, stage, json.dumps(output), seconds, now),
+        )
+        conn.execute("UPDATE jobs SET lease_until = ?, updated = ? WHERE id = ?", (now + self.lease_seconds, now, job_id))
+
+    def complete(self, job_id):
+        self._connect().execute(
+            "UPDATE jobs SET status = 'done', lease_until = NULL, error = NULL, updated = ? WHERE id = ?",
+            (time.time(), job_id),
+        )
+
+    def fail(self, job_id, error):
+        """
+        Record a failed attempt: re-queue with backoff, or mark the job failed
+        once its attempts are used up.
+
+        Returns:
+        str: The job's new status ("queued" or "failed")
+        """
+        conn = self._connect()
+        row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        now = time.time()
+        if row["attempts"] >= row["max_attempts"]:
+            status, next_run_at = "failed", now
+        else:
+            # Exponential backoff with jitter so retries of rate-limited calls spread out
+            delay = self.backoff_seconds * 2 ** (row["attempts"] - 1)
+            status, next_run_at = "queued", now + delay * random.uniform(0.8, 1.2)
+        conn.execute(
+            "UPDATE jobs SET status = ?, next_run_at = ?, lease_until = NULL, error = ?, updated = ? WHERE id = ?",
+            (status, next_run_at, str(error), now, job_id),
+        )
+        return status
+
+    def get(self, job_id):
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["stages"] = self.stage_outputs(job_id)
+        return job
+
+    def counts(self):
+        rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")
+        return {row["status"]: row["n"] for row in rows}
+
+    def pending(self, pipelines=None):
+        """Number of jobs that are queued or running."""
+        query = "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+        args = []
+        if pipelines:
+            query += f" AND pipeline IN ({', '.join('?' * len(pipelines))})"
+            args.extend(pipelines)
+        return self._connect().execute(query, args).fetchone()[0]
+
+
+class LeaseHeartbeat:
+    """Renews a claimed job's lease from a background thread while its stages run."""
+
+    def __init__(self, queue, job):
+        self.queue = queue
+        self.job = job
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{job['id']}", daemon=True)
+
+    def _run(self):
+        interval = self.queue.lease_seconds / HEARTBEATS_PER_LEASE
+        while not self._stop.wait(interval):
+            try:
+                if not self.queue.renew(self.job["id"], self.job["worker"]):
+                    logger.warning(f"Job {self.job['id']}: lease lost to another worker")
+                    return
+            except sqlite3.Error as e:
+                logger.warning(f"Job {self.job['id']}: could not renew lease: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_job(queue, pipeline, job):
+    """
+    Run a claimed job's remaining stages, checkpointing each one.
+
+    Returns:
+    bool: True when all stages completed
+    """
+    if job.get("worker"):
+        with LeaseHeartbeat(queue, job):
+            return _run_stages(queue, pipeline, job)
+    return _run_stages(queue, pipeline, job)
+
+
+def _run_stages(queue, pipeline, job):
+    outputs = queue.stage_outputs(job["id"])
+    for stage_name, func in pipeline.stages:
+        if stage_name in outputs:
+            logger.info(f"Job {job['id']}: stage {stage_name} already done, reusing checkpoint")
+            continue
+        started = time.time()
+        try:
+            output = func(job["params"], outputs)
+        except Exception as e:
+            status = queue.fail(job["id"], f"{stage_name}: {e}")
+            logger.error(f"Job {job['id']}: stage {stage_name} failed (attempt {job['attempts']}, now {status}): {e}")
+            return False
+        outputs[stage_name] = output
+        queue.checkpoint(job["id"], stage_name, output, time.time() - started)
+        logger.info(f"Job {job['id']}: stage {stage_name} done in {time.time() - started:.1f}s")
+    queue.complete(job["id"])
+    return True
+
+
+def run_workers(queue, pipelines, num_workers=1, stop_when_idle=True, poll_interval=1.0):
+    """
+    Run worker threads that claim and execute jobs until the queue is idle.
+
+    Parameters:
+    queue (JobQueue): Queue to pull from
+    pipelines (dict): Pipeline name -> Pipeline
+    num_workers (int): Concurrent workers in this process
+    stop_when_idle (bool): Return once no job is queued or running;
+        otherwise poll forever
+    poll_interval (float): Seconds between polls when nothing is runnable
+    """
+    names = list(pipelines)
+
+    def work(index):
+        worker = worker_name(index)
+        while True:
+            job = queue.claim(worker, names)
+            if job is None:
+                if stop_when_idle and queue.pending(names) == 0:
+                    return
+                time.sleep(poll_interval)
+                continue
+            try:
+                run_job(queue, pipelines[job["pipeline"]], job)
+            except Exception as e:
+                # Failures outside a stage body (e.g. a checkpoint that cannot be
+                # serialized) must not kill the worker or leave the job running
+                logger.exception(f"Job {job['id']}: worker error: {e}")
+                try:
+                    queue.fail(job["id"], f"worker error: {e}")
+                except sqlite3.Error as db_error:
+                    logger.error(f"Job {job['id']}: could not record the failure: {db_error}")
+
+    threads = [threading.Thread(target=work, args=(i,), name=f"job-worker-{i}") for i in range(num_workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
@@ -0,0 +1,472 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Client-side rate limiting and key balancing for autogen LLM calls.
+
+Concurrent runs (cron jobs, the agent service, fan-out) share the same
+OpenAI quotas. Without coordination they burst into 429s, and then each
+call waits out the SDK's and autogen's retries one by one. install_rate_limiter()
+adds three pieces:
+
+- A Budget per (model, API key, endpoint) with requests-per-minute and
+  tokens-per-minute buckets. A call reserves its estimated tokens before it
+  is sent and waits until both buckets cover it, so calls are spread over the
+  minute instead of bursting. The estimate is corrected with the reported
+  usage afterwards.
+- Feedback from response headers: x-ratelimit-limit-*, -remaining-* and
+  -reset-* replace the configured limits and the bucket levels, so the
+  budget follows the real quota (and other processes using the same key).
+- Jittered exponential backoff on 429 and 5xx responses. It waits at least as
+  long as retry-after / x-ratelimit-reset-* say, and blocks the key for that
+  long so other threads stop sending to it as well.
+
+When the config_list has several entries for the same model (different keys
+or endpoints), each call is sent first to the entry that can serve it
+soonest. autogen still falls through to the others if that call fails; a
+429 on one key is raised at once (after blocking that key) when another key
+for the model is not blocked, so the call moves on instead of waiting.
+
+Limits per model come from DEFAULT_LIMITS or a JSON file named by
+FINROBOT_RATE_LIMITS, e.g. {"gpt-4o": {"rpm": 500, "tpm": 30000}};
+FINROBOT_RATE_LIMITS=off disables the limiter.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from model_router import call_in_order
+from tracing import add_queue_time
+
+logger = logging.getLogger(__name__)
+
+# Requests and tokens per minute assumed until the response headers tell otherwise
+DEFAULT_LIMITS = {
+    "gpt-4o": {"rpm": 500, "tpm": 30000},
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200000},
+    "gpt-4-turbo": {"rpm": 500, "tpm": 30000},
+    "gpt-4": {"rpm": 500, "tpm": 10000},
+    "gpt-3.5-turbo": {"rpm": 3500, "tpm": 200000},
+}
+FALLBACK_LIMITS = {"rpm": 500, "tpm": 30000}
+
+# Fraction of the quota the limiter aims for, leaving room for estimation error
+TARGET_UTILIZATION = 0.9
+# Completion tokens assumed when a call does not set max_tokens
+COMPLETION_TOKENS_ESTIMATE = 500
+
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value):
+    """Seconds in an OpenAI reset header such as "1s", "6m0s" or "120ms" (None if absent)."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def retry_delay(headers):
+    """Seconds the server asks to wait, from retry-after(-ms) or the rate-limit reset headers."""
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    delay = parse_duration(headers.get("retry-after"))
+    if delay is not None:
+        return delay
+    resets = [parse_duration(headers.get(name)) for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")]
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else None
+
+
+def estimate_tokens(params):
+    """Prompt tokens (about four characters each) plus the completion allowance of one request."""
+    messages = params.get("messages") or []
+    characters = sum(len(json.dumps(message.get("content"), default=str)) for message in messages if isinstance(message, dict))
+    tools = params.get("tools") or params.get("functions")
+    if tools:
+        characters += len(json.dumps(tools, default=str))
+    return characters // 4 + (params.get("max_tokens") or COMPLETION_TOKENS_ESTIMATE)
+
+
+def budget_key(model, api_key, base_url):
+    """Identity of a quota: model, endpoint and a fingerprint of the key (never the key itself)."""
+    fingerprint = hashlib.sha1((api_key or "").encode("utf-8")).hexdigest()[:8]
+    return f"{model}@{str(base_url or DEFAULT_BASE_URL).rstrip('/')}#{fingerprint}"
+
+
+class Budget:
+    """Requests- and tokens-per-minute buckets for one model on one key."""
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = rpm * TARGET_UTILIZATION
+        self.tokens = tpm * TARGET_UTILIZATION
+        self.blocked_until = 0.0
+        self.in_flight = 0
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.rpm * TARGET_UTILIZATION, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.tpm * TARGET_UTILIZATION, self.tokens + elapsed * self.tpm / 60)
+
+    def _wait(self, tokens, now):
+        # Never ask for more than a full bucket, or a huge prompt would wait forever
+        tokens = min(tokens, self.tpm * TARGET_UTILIZATION)
+        wait_requests = max(0.0, 1 - self.requests) * 60 / self.rpm
+        wait_tokens = max(0.0, tokens - self.tokens) * 60 / self.tpm
+        return max(wait_requests, wait_tokens, self.blocked_until - now)
+
+    def wait_time(self, tokens):
+        """Seconds until a call of this many tokens could be sent (no reservation)."""
+        with self.lock:
+            now = time.time()
+            self._refill(now)
+            return self._wait(tokens, now)
+
+    def load(self, tokens):
+        """Sort key for choosing between keys: wait, then calls in flight, then the least used bucket."""
+        with self.lock:
+            now = time.time()
+            self._refill(now)
+            return self._wait(tokens, now), self.in_flight, -min(self.requests / self.rpm, self.tokens / self.tpm)
+
+    def claim(self, count=1):
+        """Count a call routed to this key until it finishes (see RateLimiter.order)."""
+        with self.lock:
+            self.in_flight += count
+
+    def reserve(self, tokens):
+        """
+        Reserve one request and its tokens; returns the seconds to wait before sending.
+
+        The buckets may go negative: later callers then wait for the debt to
+        refill, which queues concurrent callers instead of letting them burst.
+        """
+        with self.lock:
+            now = time.time()
+            self._refill(now)
+            wait = self._wait(tokens, now)
+            self.requests -= 1
+            self.tokens -= tokens
+            return wait
+
+    def settle(self, estimated, actual):
+        """Replace a reservation's token estimate with the reported usage."""
+        with self.lock:
+            self.tokens += estimated - actual
+
+    def update(self, headers):
+        """Adopt the limits and remaining quota reported by the server."""
+        with self.lock:
+            self._refill(time.time())
+            for name, attribute in (("requests", "rpm"), ("tokens", "tpm")):
+                limit = headers.get(f"x-ratelimit-limit-{name}")
+                remaining = headers.get(f"x-ratelimit-remaining-{name}")
+                try:
+                    if limit:
+                        setattr(self, attribute, max(1.0, float(limit)))
+                    if remaining is not None:
+                        # Other processes share the quota: never believe we have more than the server says
+                        level = float(remaining) - (1 - TARGET_UTILIZATION) * getattr(self, attribute)
+                        setattr(self, name, min(getattr(self, name), level))
+                except ValueError:
+                    continue
+
+    def block(self, seconds):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.time() + seconds)
+
+    def is_blocked(self):
+        with self.lock:
+            return self.blocked_until > time.time()
+
+
+class RateLimiter:
+    """Budgets for every (model, key, endpoint) seen, with header feedback and backoff."""
+
+    def __init__(self, limits=None, max_retries=MAX_RETRIES):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.max_retries = max_retries
+        self.budgets = {}
+        self.stats = {"calls": 0, "waited_seconds": 0.0, "rate_limited": 0, "retries": 0}
+        self._lock = threading.Lock()
+        self._order_lock = threading.Lock()
+        self._current = threading.local()
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def budget(self, key):
+        with self._lock:
+            if key not in self.budgets:
+                model = key.split("@", 1)[0]
+                limits = self.limits.get(model) or next(
+                    (value for name, value in self.limits.items() if model.startswith(name)), FALLBACK_LIMITS
+                )
+                self.budgets[key] = Budget(limits.get("rpm", FALLBACK_LIMITS["rpm"]), limits.get("tpm", FALLBACK_LIMITS["tpm"]))
+            return self.budgets[key]
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+
+    def backoff(self, attempt, headers=None):
+        """Jittered exponential delay, never shorter than what the server asked for."""
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+        hinted = retry_delay(headers)
+        return max(delay, hinted + random.uniform(0, 0.25)) if hinted is not None else delay
+
+    def observe(self, headers):
+        """Response hook: feed the rate-limit headers into the budget of the call in flight."""
+        key = getattr(self._current, "key", None)
+        if key and headers is not None and any(name.startswith("x-ratelimit-") for name in headers):
+            self.budget(key).update(headers)
+
+    def _can_fail_over(self, key):
+        """Whether the config_list of the current call has an unblocked entry for key's model on another key."""
+        model = key.split("@", 1)[0]
+        return any(
+            other != key and other.split("@", 1)[0] == model and not self.budget(other).is_blocked()
+            for other in getattr(self._current, "keys", None) or ()
+        )
+
+    def acquire(self, key):
+        """Count a call on key as in flight, taking over the claim order() made if it was for key."""
+        reserved = getattr(self._current, "reserved", None)
+        self._current.reserved = None
+        if reserved == key:
+            return
+        if reserved:
+            self.budget(reserved).claim(-1)
+        self.budget(key).claim()
+
+    def release_reservation(self):
+        """Drop the claim order() made if no request consumed it (e.g. a cached reply)."""
+        reserved = getattr(self._current, "reserved", None)
+        self._current.reserved = None
+        if reserved:
+            self.budget(reserved).claim(-1)
+
+    def finish(self):
+        """End the wrapper-level call started by order() on this thread."""
+        self._current.keys = None
+        self.release_reservation()
+
+    def call(self, key, params, send):
+        """
+        Send one request within the key's budget, retrying 429 and 5xx with backoff.
+
+        A 429 is raised without retrying when another key for the same model
+        can take the call (see _can_fail_over); autogen then tries that entry.
+
+        Parameters:
+        key (str): budget_key() of the model/key/endpoint
+        params (dict): Request parameters (for the token estimate)
+        send (callable): Performs the request; returns the response
+
+        Returns:
+        The response of send()
+        """
+        from openai import APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+
+        budget = self.budget(key)
+        estimated = estimate_tokens(params)
+        self._count("calls")
+        for attempt in range(self.max_retries + 1):
+            wait = budget.reserve(estimated)
+            if wait > 0:
+                self._count("waited_seconds", wait)
+                # Shows on the LLM call's span as queueing, not as model latency
+                add_queue_time(wait)
+                time.sleep(wait)
+            self._current.key = key
+            try:
+                response = send()
+            except APITimeoutError:
+                # Timeouts go straight back to autogen, which tries the next config_list entry
+                budget.settle(estimated, 0)
+                raise
+            except (RateLimitError, APIStatusError, APIConnectionError) as e:
+                status = getattr(e, "status_code", None)
+                headers = getattr(getattr(e, "response", None), "headers", None)
+                # Quota errors are not retried: a 429 "insufficient_quota" does not clear by waiting
+                if isinstance(e, APIStatusError) and (status not in (429, 500, 502, 503, 504) or getattr(e, "code", None) == "insufficient_quota"):
+                    raise
+                delay = self.backoff(attempt, headers)
+                budget.settle(estimated, 0)
+                if status == 429:
+                    self._count("rate_limited")
+                    budget.block(delay)
+                    if headers is not None:
+                        budget.update(headers)
+                    if self._can_fail_over(key):
+                        logger.warning(f"{key.split('#')[0]}: 429, moving on to another key for {delay:.1f}s")
+                        raise
+                if attempt == self.max_retries:
+                    raise
+                self._count("retries")
+                logger.warning(f"{key.split('#')[0]}: {status or 'connection error'}, retrying in {delay:.1f}s")
+                add_queue_time(delay)
+                time.sleep(delay)
+                continue
+            finally:
+                self._current.key = None
+            usage = getattr(response, "usage", None)
+            if usage is not None and getattr(usage, "total_tokens", None):
+                budget.settle(estimated, usage.total_tokens)
+            return response
+
+    def order(self, keys, models, tokens):
+        """
+        Indices of config_list entries with entries of the same model sorted by
+        how soon they can serve the call; the positions of the models are kept.
+
+        The entry tried first is claimed (counted as in flight) in the same
+        step, so concurrent calls spread over the keys. The claim belongs to
+        this thread's call: acquire() moves it to the key a request is
+        actually sent on (a router may reorder the entries again), and
+        finish() drops it if no request is sent.
+        """
+        order = list(range(len(keys)))
+        self.release_reservation()
+        with self._order_lock:
+            for model in set(models):
+                positions = [i for i, name in enumerate(models) if name == model]
+                if len(positions) > 1:
+                    ranked = sorted(positions, key=lambda i: (self.budget(keys[i]).load(tokens), i))
+                    for position, index in zip(positions, ranked):
+                        order[position] = index
+            self.budget(keys[order[0]]).claim()
+        self._current.reserved = keys[order[0]]
+        # The entries a 429 can fail over to (see _can_fail_over)
+        self._current.keys = keys
+        return order
+
+
+_limiter = None
+
+
+def get_rate_limiter():
+    """Return the installed limiter, or None when it is off."""
+    return _limiter
+
+
+def _client_key(client, model):
+    oai_client = getattr(client, "_oai_client", None)
+    return budget_key(model, getattr(oai_client, "api_key", None), getattr(oai_client, "base_url", None))
+
+
+def _entry_key(entry):
+    return budget_key(entry.get("model"), entry.get("api_key") or os.environ.get("OPENAI_API_KEY"), entry.get("base_url"))
+
+
+def _attach(client, limiter):
+    """Disable the SDK's own retries and observe every response's headers (once per client)."""
+    if getattr(client, "_rate_limiter_attached", False):
+        return
+    oai_client = getattr(client, "_oai_client", None)
+    if oai_client is not None and hasattr(oai_client, "with_options"):
+        # The limiter retries with header-aware backoff; the SDK's blind retries would double the wait
+        oai_client = oai_client.with_options(max_retries=0)
+        client._oai_client = oai_client
+        http_client = getattr(oai_client, "_client", None)
+        if http_client is not None and hasattr(http_client, "event_hooks"):
+            hooks = http_client.event_hooks
+            hooks["response"] = hooks.get("response", []) + [lambda response: limiter.observe(response.headers)]
+            http_client.event_hooks = hooks
+    client._rate_limiter_attached = True
+
+
+def _patch_autogen(limiter):
+    from autogen import OpenAIWrapper
+    from autogen.oai.client import OpenAIClient
+
+    original_client_create = OpenAIClient.create
+    original_create = OpenAIWrapper.create
+
+    @functools.wraps(original_client_create)
+    def client_create(self, params):
+        _attach(self, limiter)
+        key = _client_key(self, params.get("model"))
+        # In flight on the client actually used, whatever order the entries were tried in
+        limiter.acquire(key)
+        try:
+            return limiter.call(key, params, lambda: original_client_create(self, params))
+        finally:
+            limiter.budget(key).claim(-1)
+
+    @functools.wraps(original_create)
+    def create(self, **config):
+        config_list = getattr(self, "_config_list", None)
+        clients = getattr(self, "_clients", None)
+        if not config_list or not clients or len(config_list) != len(clients) or len(config_list) < 2:
+            return original_create(self, **config)
+        keys = [_entry_key(entry) for entry in config_list]
+        order = limiter.order(keys, [entry.get("model") for entry in config_list], estimate_tokens(config))
+        try:
+            return call_in_order(self, original_create, order, config)
+        finally:
+            limiter.finish()
+
+    OpenAIClient.create = client_create
+    OpenAIWrapper.create = create
+
+
+def install_rate_limiter(limiter=None):
+    """
+    Pace every autogen LLM call within per-model, per-key budgets.
+
+    Install after install_model_router(), so the router picks the tier and
+    the limiter picks the least-loaded key within it. Reads
+    FINROBOT_RATE_LIMITS (a JSON limits file, or "off").
+
+    Returns:
+    RateLimiter: The installed limiter, or None when it is off
+    """
+    global _limiter
+    if _limiter is not None:
+        return _limiter
+    setting = os.environ.get("FINROBOT_RATE_LIMITS", "")
+    if setting.lower() in ("off", "0", "false"):
+        return None
+    if limiter is None:
+        limiter = RateLimiter.from_file(setting) if setting else RateLimiter()
+    try:
+        _patch_autogen(limiter)
+    except ImportError as e:
+        logger.warning(f"autogen not available, LLM rate limiting is off: {e}")
+        return None
+    _limiter = limiter
+    return limiter
@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Local OpenAI-compatible chat-completions server for offline runs.
+
+The server answers POST /v1/chat/completions (plain and streaming, with
+tool calls) from a script of rules or from a recording of real responses,
+with configurable latency and token counts. It lets the agent scripts run
+without an API key, in CI, and under load to measure orchestration
+overhead.
+
+Every runner reads its config list through autogen's OAI_CONFIG_LIST
+environment variable, so pointing them at the server only needs:
+
+    python mock_llm_server.py --port 8765 --script mock_llm_script.json --write-config mock_oai_config.json
+    export OAI_CONFIG_LIST=$PWD/mock_oai_config.json
+    python test_trade_strategist.py
+
+Script format (JSON): {"rules": [...], "default": {...}}. A rule has
+optional conditions ("match": regex searched in the last message,
+"last_role": role of the last message, "has_tools": whether the request
+offered tools) and a response ("content", "tool_calls": [{"name",
+"arguments"}], "prompt_tokens", "completion_tokens", "latency"). The first
+matching rule is used; "default" answers everything else.
+
+Recording format (JSONL): one {"request": {...}, "response": {...}} per
+line, as written by --record while proxying to a real --upstream endpoint.
+Replay looks responses up by the request's messages and falls back to the
+recorded order.
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from context_compaction import count_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESPONSE = {"content": "This is a mock response. TERMINATE"}
+MOCK_MODELS = ["gpt-4o", "gpt-3.5-turbo"]
+
+
+def _message_text(message):
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def request_key(body):
+    """Stable key for a request: hash of its messages' roles and content."""
+    messages = [(m.get("role"), _message_text(m)) for m in body.get("messages", [])]
+    return hashlib.sha256(json.dumps(messages).encode("utf-8")).hexdigest()
+
+
+class ScriptedResponder:
+    """Pick a response for a request from an ordered list of rules."""
+
+    def __init__(self, script=None):
+        script = script or {}
+        self.rules = script.get("rules", [])
+        self.default = script.get("default", DEFAULT_RESPONSE)
+        for rule in self.rules:
+            if "match" in rule:
+                rule["_pattern"] = re.compile(rule["match"], re.IGNORECASE | re.DOTALL)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def _matches(self, rule, body):
+        messages = body.get("messages", [])
+        last = messages[-1] if messages else {}
+        if "last_role" in rule and last.get("role") != rule["last_role"]:
+            return False
+        if "has_tools" in rule and bool(body.get("tools") or body.get("functions")) != rule["has_tools"]:
+            return False
+        if "_pattern" in rule and not rule["_pattern"].search(_message_text(last)):
+            return False
+        return True
+
+    def respond(self, body):
+        for rule in self.rules:
+            if self._matches(rule, body):
+                return rule
+        return self.default
+
+
+class RecordingResponder:
+    """Replay recorded responses, by request key first and in order otherwise."""
+
+    def __init__(self, records):
+        self.by_key = {}
+        for record in records:
+            self.by_key.setdefault(request_key(record["request"]), []).append(record["response"])
+        self.sequence = itertools.cycle([record["response"] for record in records] or [None])
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls([json.loads(line) for line in f if line.strip()])
+
+    def respond(self, body):
+        with self._lock:
+            responses = self.by_key.get(request_key(body))
+            if responses:
+                # Identical requests later in the recording get the later responses
+                return {"raw": responses.pop(0) if len(responses) > 1 else responses[0]}
+            response = next(self.sequence)
+        return {"raw": response} if response else DEFAULT_RESPONSE
+
+
+class ProxyResponder:
+    """Forward requests to a real endpoint and append each exchange to a recording."""
+
+    def __init__(self, upstream, api_key, record_path):
+        self.upstream = upstream.rstrip("/")
+        self.api_key = api_key
+        self.record_path = record_path
+        self._lock = threading.Lock()
+
+    def respond(self, body):
+        request_body = dict(body, stream=False)
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(
+            f"{self.upstream}/chat/completions",
+            data=json.dumps(request_body).encode("utf-8"),
+            headers=headers,
+        )
+        with urllib.request.urlopen(request, timeout=300) as response:
+            raw = json.loads(response.read())
+        with self._lock, open(self.record_path, "a") as f:
+            f.write(json.dumps({"request": request_body, "response": raw}) + "\n")
+        return {"raw": raw, "latency": 0}
+
+
+def build_completion(body, response, model):
+    """Build a chat.completion body from a scripted response."""
+    if "raw" in response:
+        return response["raw"]
+
+    tool_calls = [
+        {
+            "id": f"call_{uuid.uuid4().hex[:24]}",
+            "type": "function",
+            "function": {
+                "name": call["name"],
+                "arguments": call["arguments"] if isinstance(call.get("arguments"), str)
+                else json.dumps(call.get("arguments", {})),
+            },
+        }
+        for call in response.get("tool_calls", [])
+    ]
+    content = response.get("content")
+    message = {"role": "assistant", "content": None if tool_calls and not content else content or ""}
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+
+    prompt_text = "\n".join(_message_text(m) for m in body.get("messages", []))
+    completion_text = (content or "") + "".join(c["function"]["arguments"] for c in tool_calls)
+    prompt_tokens = response.get("prompt_tokens", count_tokens(prompt_text))
+    completion_tokens = response.get("completion_tokens", count_tokens(completion_text))
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", model),
+        "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def stream_chunks(completion):
+    """Split a chat.completion into chat.completion.chunk dicts."""
+    message = completion["choices"][0]["message"]
+    base = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"], "model": completion["model"]}
+
+    def chunk(delta, finish_reason=None):
+        return dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": finish_reason}])
+
+    yield chunk({"role": "assistant", "content": ""})
+    for piece in re.findall(r"\S+\s*|\s+", message.get("content") or ""):
+        yield chunk({"content": piece})
+    for index, call in enumerate(message.get("tool_calls") or []):
+        yield chunk({"tool_calls": [dict(call, index=index)]})
+    yield chunk({}, completion["choices"][0].get("finish_reason", "stop"))
+
+
+class _Server(ThreadingHTTPServer):
+    # The socketserver default backlog of 5 resets connections under load tests
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class MockLLMServer:
+    """
+    Threaded chat-completions server.
+
+    Parameters:
+    responder: ScriptedResponder, RecordingResponder or ProxyResponder
+    host (str): Interface to bind
+    port (int): Port to bind (0 picks a free one)
+    latency (float): Seconds before each response starts
+    latency_per_token (float): Extra seconds per completion token, spread
+        over the chunks when streaming
+    model (str): Model name reported when the request has none
+    """
+
+    def __init__(self, responder=None, host="127.0.0.1", port=0, latency=0.0, latency_per_token=0.0, model="gpt-4o"):
+        self.responder = responder or ScriptedResponder()
+        self.latency = latency
+        self.latency_per_token = latency_per_token
+        self.model = model
+        self.stats = {"requests": 0, "streamed": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self._stats_lock = threading.Lock()
+        self.httpd = _Server((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def config_list(self, models=None):
+        """OAI_CONFIG_LIST entries that point autogen at this server."""
+        return [{"model": model, "api_key": "mock", "base_url": self.url} for model in models or MOCK_MODELS]
+
+    def write_config(self, path, models=None):
+        with open(path, "w") as f:
+            json.dump(self.config_list(models), f, indent=4)
+        return path
+
+    def start(self):
+        """Serve in a background thread and return self."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def complete(self, body):
+        """Return (completion, latency, per_token_delay) for a request body."""
+        response = self.responder.respond(body)
+        completion = build_completion(body, response, self.model)
+        usage = completion.get("usage", {})
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.stats["streamed"] += bool(body.get("stream"))
+            self.stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            self.stats["completion_tokens"] += usage.get("completion_tokens", 0)
+        latency = response.get("latency", self.latency)
+        return completion, latency, self.latency_per_token
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send_json(200, {"object": "list", "data": [{"id": m, "object": "model"} for m in MOCK_MODELS]})
+                elif self.path.rstrip("/").endswith("/stats"):
+                    self._send_json(200, dict(server.stats))
+                else:
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                    completion, latency, per_token = server.complete(body)
+                except Exception as e:
+                    logger.error(f"Mock completion failed: {e}")
+                    self._send_json(500, {"error": {"message": str(e), "type": "mock_error"}})
+                    return
+
+                time.sleep(latency)
+                completion_tokens = completion.get("usage", {}).get("completion_tokens", 0)
+                if not body.get("stream"):
+                    time.sleep(per_token * completion_tokens)
+                    self._send_json(200, completion)
+                    return
+
+                chunks = list(stream_chunks(completion))
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    chunks.append(dict(chunks[-1], choices=[], usage=completion.get("usage")))
+                delay = per_token * completion_tokens / max(len(chunks), 1)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for chunk in chunks:
+                    time.sleep(delay)
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--script", help="JSON file of scripted response rules")
+    parser.add_argument("--recording", help="JSONL file of recorded request/response pairs to replay")
+    parser.add_argument("--upstream", help="Proxy to this OpenAI-compatible base URL instead of replaying")
+    parser.add_argument("--upstream-key", default=os.environ.get("OPENAI_API_KEY"),
+                        help="API key for --upstream (default: OPENAI_API_KEY)")
+    parser.add_argument("--record", default="mock_llm_recording.jsonl", help="Where --upstream exchanges are appended")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each response")
+    parser.add_argument("--latency-per-token", type=float, default=0.0, help="Extra seconds per completion token")
+    parser.add_argument("--write-config", help="Write an OAI_CONFIG_LIST pointing at the server to this path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if args.upstream:
+        responder = ProxyResponder(args.upstream, args.upstream_key, args.record)
+    elif args.recording:
+        responder = RecordingResponder.from_file(args.recording)
+    elif args.script:
+        responder = ScriptedResponder.from_file(args.script)
+    else:
+        responder = ScriptedResponder()
+
+    server = MockLLMServer(responder, args.host, args.port, args.latency, args.latency_per_token)
+    print(f"Mock LLM server listening on {server.url}")
+    if args.write_config:
+        server.write_config(args.write_config)
+        print(f"Config list written; run: export OAI_CONFIG_LIST={args.write_config}")
+    else:
+        print(f"OAI_CONFIG_LIST='{json.dumps(server.config_list())}'")
+
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nStopping. Stats: {server.stats}")
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
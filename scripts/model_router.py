@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Per-call model routing for autogen agents.
+
+The runners load both gpt-4o and gpt-3.5-turbo into every agent's
+config_list, but autogen's OpenAIWrapper always tries the entries in order,
+so every call (coordinator orders, tool-choice turns, summaries) goes to the
+first, slowest model. install_model_router() classifies each
+OpenAIWrapper.create call into one of four task classes:
+
+- routing: the coordinator or a group-chat manager choosing who acts next
+- summarization: summary prompts (autogen's reflection_with_llm, or a
+  summarize request to a model without tools)
+- data_lookup: a short request to an agent with tools, answered by tool calls
+- analysis: everything else, including the turn that reads the tool results
+
+and reorders the wrapper's config_list for that call so that the models of
+the class's preferred tier come first. The other entries stay behind them,
+so autogen's own fallback (on to the next entry after a timeout or an API
+error such as 429) moves to the next tier instead of failing. A tier whose
+prompt limit is below the size of the prompt is moved to the back as well,
+so long prompts reach the model that can hold them.
+
+Tiers and routes can be changed with a JSON file named by
+FINROBOT_MODEL_ROUTING, e.g.
+
+    {"tiers": {"fast": ["gpt-4o-mini"], "strong": ["gpt-4o"]},
+     "routes": {"data_lookup": ["strong", "fast"]},
+     "max_prompt_tokens": {"fast": 12000}}
+
+and routing is switched off with FINROBOT_MODEL_ROUTING=off.
+"""
+
+import copy
+import functools
+import json
+import logging
+import os
+import re
+import threading
+from collections import Counter
+
+from context_compaction import count_tokens
+from runtime import current_agent, install_agent_context
+
+logger = logging.getLogger(__name__)
+
+TASK_CLASSES = ("routing", "summarization", "data_lookup", "analysis")
+
+DEFAULT_TIERS = {
+    "fast": ["gpt-4o-mini", "gpt-3.5-turbo"],
+    "strong": ["gpt-4o", "gpt-4-turbo", "gpt-4"],
+}
+
+DEFAULT_ROUTES = {
+    "routing": ["fast", "strong"],
+    "summarization": ["fast", "strong"],
+    "data_lookup": ["fast", "strong"],
+    "analysis": ["strong", "fast"],
+}
+
+USAGE_ATTRIBUTES = ("total_usage_summary", "actual_usage_summary")
+
+# Largest prompt (in tokens) sent to a tier; bigger prompts skip to the next tier
+DEFAULT_MAX_PROMPT_TOKENS = {"fast": 12000}
+
+# A tool-using request longer than this is treated as analysis, not a lookup
+DATA_LOOKUP_MAX_TOKENS = 300
+
+ROUTING_AGENT_RE = re.compile(r"coordinator|manager|router|planner", re.IGNORECASE)
+ROUTING_PROMPT_RE = re.compile(r"select the next role|only return the role|who should speak next", re.IGNORECASE)
+SUMMARY_PROMPT_RE = re.compile(r"\bsummari[sz]e\b|\bsummary\b|\btakeaway\b|\bcondense\b", re.IGNORECASE)
+
+
+def _content(message):
+    content = message.get("content") if isinstance(message, dict) else message
+    if isinstance(content, list):
+        # Multimodal content: keep the text parts
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+class ModelRouter:
+    """Classifies LLM calls and orders config_list entries by the tier for the class."""
+
+    def __init__(self, tiers=None, routes=None, max_prompt_tokens=None):
+        self.tiers = dict(DEFAULT_TIERS, **(tiers or {}))
+        self.routes = dict(DEFAULT_ROUTES, **(routes or {}))
+        self.max_prompt_tokens = dict(DEFAULT_MAX_PROMPT_TOKENS, **(max_prompt_tokens or {}))
+        self.stats = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            settings = json.load(f)
+        return cls(settings.get("tiers"), settings.get("routes"), settings.get("max_prompt_tokens"))
+
+    def classify(self, messages, has_tools=False, agent_name=None):
+        """
+        Task class of one chat-completions call.
+
+        Parameters:
+        messages (list): The call's messages
+        has_tools (bool): Whether tools/functions are offered to the model
+        agent_name (str): Name of the agent generating the reply, if known
+
+        Returns:
+        str: One of TASK_CLASSES
+        """
+        last = messages[-1] if messages else {}
+        text = _content(last)
+        if (agent_name and ROUTING_AGENT_RE.search(agent_name)) or ROUTING_PROMPT_RE.search(text):
+            return "routing"
+        # autogen's reflection_with_llm appends its summary prompt as a final system message
+        if SUMMARY_PROMPT_RE.search(text[:300]) and (last.get("role") == "system" or (last.get("role") == "user" and not has_tools)):
+            return "summarization"
+        if has_tools and last.get("role") not in ("tool", "function") and not last.get("tool_responses"):
+            if count_tokens(text) <= DATA_LOOKUP_MAX_TOKENS:
+                return "data_lookup"
+        return "analysis"
+
+    def tier_of(self, model):
+        for tier, models in self.tiers.items():
+            if model in models:
+                return tier
+        return None
+
+    def order(self, models, task, prompt_tokens=0):
+        """
+        Indices of config_list entries in the order they should be tried.
+
+        Entries of the task's tiers come first (in route order, keeping their
+        config_list order within a tier); entries of tiers whose prompt limit
+        is exceeded and entries of unknown models follow.
+        """
+        route = self.routes.get(task) or DEFAULT_ROUTES["analysis"]
+        fits = [tier for tier in route if prompt_tokens <= (self.max_prompt_tokens.get(tier) or float("inf"))]
+        preference = fits + [tier for tier in route if tier not in fits]
+        tiers = [self.tier_of(model) for model in models]
+
+        def rank(i):
+            return preference.index(tiers[i]) if tiers[i] in preference else len(preference)
+
+        return sorted(range(len(models)), key=lambda i: (rank(i), i))
+
+    def record(self, task, model):
+        with self._lock:
+            self.stats[(task, model)] += 1
+
+    def summary(self):
+        with self._lock:
+            return {f"{task}:{model}": count for (task, model), count in sorted(self.stats.items())}
+
+
+_router = None
+
+
+def get_router():
+    """Return the installed router, or None when routing is off."""
+    return _router
+
+
+def call_in_order(wrapper, create, order, config):
+    """
+    Call create(wrapper, **config) with the wrapper's config_list tried in the given order.
+
+    autogen's OpenAIWrapper tries its _clients in order and falls through to
+    the next one on timeouts and API errors, so reordering them for one call
+    chooses the model/key that is tried first without losing the fallback.
+    The call runs on a shallow copy, so concurrent calls on the same wrapper
+    neither block nor see each other's order.
+    """
+    if order == list(range(len(wrapper._config_list))):
+        return create(wrapper, **config)
+    view = copy.copy(wrapper)
+    view._clients = [wrapper._clients[i] for i in order]
+    view._config_list = [wrapper._config_list[i] for i in order]
+    try:
+        return create(view, **config)
+    finally:
+        # autogen replaces its usage summaries on the first call; keep them on the real wrapper
+        for name in USAGE_ATTRIBUTES:
+            if getattr(view, name, None) is not getattr(wrapper, name, None):
+                setattr(wrapper, name, getattr(view, name))
+
+
+def _patch_autogen(router):
+    from autogen import OpenAIWrapper
+
+    install_agent_context()
+    original_create = OpenAIWrapper.create
+
+    @functools.wraps(original_create)
+    def create(self, **config):
+        config_list = getattr(self, "_config_list", None)
+        clients = getattr(self, "_clients", None)
+        if not config_list or not clients or len(config_list) != len(clients):
+            return original_create(self, **config)
+
+        messages = config.get("messages") or []
+        has_tools = any(entry.get("tools") or entry.get("functions") for entry in [config] + config_list)
+        task = router.classify(messages, has_tools, current_agent())
+        prompt_tokens = sum(count_tokens(_content(message)) for message in messages)
+        order = router.order([entry.get("model") for entry in config_list], task, prompt_tokens)
+        response = call_in_order(self, original_create, order, config)
+        router.record(task, getattr(response, "model", None) or config_list[order[0]].get("model"))
+        return response
+
+    OpenAIWrapper.create = create
+
+
+def install_model_router(router=None):
+    """
+    Route each autogen LLM call to the model tier for its task class.
+
+    Install after install_tracing() and before agents are created, so the
+    traced calls report the model that actually answered. Reads
+    FINROBOT_MODEL_ROUTING (a JSON settings file, or "off").
+
+    Returns:
+    ModelRouter: The installed router, or None when routing is off
+    """
+    global _router
+    if _router is not None:
+        return _router
+    setting = os.environ.get("FINROBOT_MODEL_ROUTING", "")
+    if setting.lower() in ("off", "0", "false"):
+        return None
+    if router is None:
+        router = ModelRouter.from_file(setting) if setting else ModelRouter()
+    try:
+        _patch_autogen(router)
+    except ImportError as e:
+        logger.warning(f"autogen not available, model routing is off: {e}")
+        return None
+    _router = router
+    return router
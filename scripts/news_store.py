@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Incremental company-news store behind FinnHubUtils.get_company_news.
+
+The store remembers which days it has already fetched for each symbol and
+asks Finnhub only for the missing intervals, so rolling windows
+("the last 30 days", every run) cost at most the new days. Items are
+deduplicated by normalized URL and by a 64-bit SimHash of the headline and
+summary: a wire story republished by several outlets is kept once, with a
+count of how often it was syndicated. Range queries are served from an
+indexed SQLite table.
+
+Today is never marked as covered, because news for it is still arriving.
+
+Newly stored stories are also ingested into the local vector index
+(document_ingest.ingest_news), so the RAG agent's search_documents finds
+them; FINROBOT_INDEX_NEWS=off disables that.
+
+Usage:
+    install_news_store()      # after install_cache_hooks(), before creating agents
+    news = get_company_news("AAPL", "2025-05-01", "2025-06-01")
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit
+
+from data_cache import override_source_method
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(os.environ.get("FINROBOT_CACHE_DIR", "."), "news_store.db")
+# Longest interval requested in one API call; Finnhub truncates large result sets
+FETCH_WINDOW_DAYS = 30
+# A response this large is probably truncated and is re-requested in halves
+FETCH_RESULT_CAP = 240
+# Near-duplicates: at most this many differing SimHash bits...
+SIMHASH_MAX_DISTANCE = 3
+# ...between items published this close together
+SIMHASH_WINDOW_SECONDS = 3 * 86400
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS coverage (
+    symbol TEXT NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL,
+    PRIMARY KEY (symbol, start)
+);
+CREATE TABLE IF NOT EXISTS news (
+    id INTEGER PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    published INTEGER NOT NULL,
+    headline TEXT,
+    summary TEXT,
+    source TEXT,
+    url TEXT,
+    url_key TEXT,
+    simhash INTEGER NOT NULL,
+    band0 INTEGER NOT NULL,
+    band1 INTEGER NOT NULL,
+    band2 INTEGER NOT NULL,
+    band3 INTEGER NOT NULL,
+    syndicated INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS news_range ON news (symbol, published);
+CREATE UNIQUE INDEX IF NOT EXISTS news_url ON news (symbol, url_key);
+CREATE INDEX IF NOT EXISTS news_band0 ON news (symbol, band0);
+CREATE INDEX IF NOT EXISTS news_band1 ON news (symbol, band1);
+CREATE INDEX IF NOT EXISTS news_band2 ON news (symbol, band2);
+CREATE INDEX IF NOT EXISTS news_band3 ON news (symbol, band3);
+"""
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_url(url):
+    """Lower-case scheme and host, drop query, fragment and trailing slash."""
+    if not url:
+        return None
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return urlunsplit((parts.scheme.lower(), host, parts.path.rstrip("/"), "", ""))
+
+
+def simhash(text):
+    """64-bit SimHash of word 3-gram shingles (single words for short texts)."""
+    words = _WORD_RE.findall((text or "").lower())
+    shingles = [" ".join(words[i:i + 3]) for i in range(len(words) - 2)] or words
+    weights = [0] * 64
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    value = 0
+    for bit in range(64):
+        if weights[bit] > 0:
+            value |= 1 << bit
+    return value
+
+
+def _bands(value):
+    # Four 16-bit bands: two hashes within distance 3 share at least one band
+    return [(value >> (16 * i)) & 0xFFFF for i in range(4)]
+
+
+def _to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _day(value):
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+class NewsStore:
+    """Per-symbol news with fetched-interval coverage and URL/SimHash dedup."""
+
+    def __init__(self, db_path=None, fetch=None, index_documents=None):
+        """
+        Parameters:
+        db_path (str): SQLite path (default: FINROBOT_NEWS_DB or FINROBOT_CACHE_DIR/news_store.db)
+        fetch (callable): fetch(symbol, start, end) -> list of Finnhub news
+            dicts (default: the Finnhub client's company_news)
+        index_documents (bool): Ingest new stories into the vector index
+            (default: on unless FINROBOT_INDEX_NEWS is "off")
+        """
+        self.db_path = db_path or os.environ.get("FINROBOT_NEWS_DB", DEFAULT_DB_PATH)
+        self.fetch = fetch or finnhub_fetch
+        if index_documents is None:
+            index_documents = os.environ.get("FINROBOT_INDEX_NEWS", "").lower() not in ("off", "0", "false")
+        self.index_documents = index_documents
+        self._local = threading.local()
+        self._symbol_locks = {}
+        self._locks_lock = threading.Lock()
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _symbol_lock(self, symbol):
+        with self._locks_lock:
+            return self._symbol_locks.setdefault(symbol, threading.Lock())
+
+    # -- coverage --------------------------------------------------------
+
+    def coverage(self, symbol):
+        rows = self._connect().execute("SELECT start, end FROM coverage WHERE symbol = ? ORDER BY start", (symbol,))
+        return [(_day(row["start"]), _day(row["end"])) for row in rows]
+
+    def missing_intervals(self, symbol, start_date, end_date):
+        """Return the [start, end] day intervals of the range not fetched yet."""
+        start, end = _day(start_date), _day(end_date)
+        missing = []
+        cursor = start
+        for covered_start, covered_end in self.coverage(symbol):
+            if covered_end < cursor:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > cursor:
+                missing.append((cursor, min(end, covered_start - timedelta(days=1))))
+            cursor = max(cursor, covered_end + timedelta(days=1))
+            if cursor > end:
+                break
+        if cursor <= end:
+            missing.append((cursor, end))
+        return missing
+
+    def _mark_covered(self, conn, symbol, start, end):
+        """Add [start, end] to the coverage, merging overlapping or adjacent intervals."""
+        intervals = self.coverage(symbol) + [(start, end)]
+        intervals.sort()
+        merged = [list(intervals[0])]
+        for interval_start, interval_end in intervals[1:]:
+            if interval_start <= merged[-1][1] + timedelta(days=1):
+                merged[-1][1] = max(merged[-1][1], interval_end)
+            else:
+                merged.append([interval_start, interval_end])
+        conn.execute("DELETE FROM coverage WHERE symbol = ?", (symbol,))
+        conn.executemany(
+            "INSERT INTO coverage (symbol, start, end) VALUES (?, ?, ?)",
+            [(symbol, s.isoformat(), e.isoformat()) for s, e in merged],
+        )
+
+    # -- ingestion -------------------------------------------------------
+
+    def _fetch_window(self, symbol, start, end):
+        items = self.fetch(symbol, start.isoformat(), end.isoformat())
+        if len(items) >= FETCH_RESULT_CAP and start < end:
+            middle = start + (end - start) // 2
+            return self._fetch_window(symbol, start, middle) + self._fetch_window(symbol, middle + timedelta(days=1), end)
+        return items
+
+    def add_items(self, symbol, items):
+        """
+        Store Finnhub news dicts, skipping URL and near-text duplicates.
+
+        Returns:
+        tuple: (stored, duplicates)
+        """
+        conn = self._connect()
+        stored = duplicates = 0
+        with conn:
+            for item in items:
+                url_key = normalize_url(item.get("url"))
+                published = int(item.get("datetime") or 0)
+                fingerprint = simhash(f"{item.get('headline', '')} {item.get('summary', '')}")
+                bands = _bands(fingerprint)
+                duplicate_id = None
+                if url_key:
+                    row = conn.execute("SELECT id FROM news WHERE symbol = ? AND url_key = ?", (symbol, url_key)).fetchone()
+                    if row:
+                        # Same article seen again (overlapping fetch), not a syndication
+                        duplicates += 1
+                        continue
+                rows = conn.execute(
+                    "SELECT id, simhash FROM news WHERE symbol = ? AND published BETWEEN ? AND ? "
+                    "AND (band0 = ? OR band1 = ? OR band2 = ? OR band3 = ?)",
+                    (symbol, published - SIMHASH_WINDOW_SECONDS, published + SIMHASH_WINDOW_SECONDS, *bands),
+                )
+                for row in rows:
+                    if bin((row["simhash"] & 0xFFFFFFFFFFFFFFFF) ^ fingerprint).count("1") <= SIMHASH_MAX_DISTANCE:
+                        duplicate_id = row["id"]
+                        break
+                if duplicate_id is not None:
+                    conn.execute("UPDATE news SET syndicated = syndicated + 1 WHERE id = ?", (duplicate_id,))
+                    duplicates += 1
+                    continue
+                conn.execute(
+                    "INSERT INTO news (symbol, published, headline, summary, source, url, url_key, simhash, "
+                    "band0, band1, band2, band3) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (symbol, published, item.get("headline"), item.get("summary"), item.get("source"),
+                     item.get("url"), url_key, _to_signed(fingerprint), *bands),
+                )
+                stored += 1
+        return stored, duplicates
+
+    def update(self, symbol, start_date, end_date):
+        """
+        Fetch the parts of [start_date, end_date] that are not covered yet.
+
+        Returns:
+        dict: api_calls, stored and duplicates
+        """
+        symbol = symbol.upper()
+        today = datetime.now().date()
+        stats = {"api_calls": 0, "stored": 0, "duplicates": 0}
+        with self._symbol_lock(symbol):
+            for start, end in self.missing_intervals(symbol, start_date, end_date):
+                window_start = start
+                while window_start <= end:
+                    window_end = min(end, window_start + timedelta(days=FETCH_WINDOW_DAYS - 1))
+                    items = self._fetch_window(symbol, window_start, window_end)
+                    stats["api_calls"] += 1
+                    stored, duplicates = self.add_items(symbol, items)
+                    stats["stored"] += stored
+                    stats["duplicates"] += duplicates
+                    covered_end = min(window_end, today - timedelta(days=1))
+                    if covered_end >= window_start:
+                        conn = self._connect()
+                        with conn:
+                            self._mark_covered(conn, symbol, window_start, covered_end)
+                    window_start = window_end + timedelta(days=1)
+        if stats["api_calls"]:
+            logger.info(f"News for {symbol}: {stats['api_calls']} API calls, {stats['stored']} new, {stats['duplicates']} duplicates")
+        if stats["stored"] and self.index_documents:
+            self._index_news(symbol, start_date, end_date)
+        return stats
+
+    def _index_news(self, symbol, start_date, end_date):
+        """Ingest the range's stories into the vector index; unchanged ones are skipped by hash."""
+        try:
+            from document_ingest import ingest_news
+
+            ingest_news(symbol, start_date, end_date, store=self)
+        except Exception as e:
+            # The index is a by-product; news lookups must not fail because of it
+            logger.warning(f"Could not index news for {symbol}: {e}")
+
+    # -- queries ---------------------------------------------------------
+
+    def query(self, symbol, start_date, end_date, limit=None):
+        """Return stored news for symbol in [start_date, end_date] (inclusive days), oldest first."""
+        start = datetime.combine(_day(start_date), datetime.min.time()).timestamp()
+        end = datetime.combine(_day(end_date) + timedelta(days=1), datetime.min.time()).timestamp()
+        query = "SELECT * FROM news WHERE symbol = ? AND published >= ? AND published < ? ORDER BY published"
+        args = [symbol.upper(), int(start), int(end)]
+        rows = [dict(row) for row in self._connect().execute(query, args)]
+        if limit is not None and len(rows) > limit:
+            # Keep the most widely syndicated stories, newest first among equals
+            keep = sorted(rows, key=lambda row: (row["syndicated"], row["published"]), reverse=True)[:limit]
+            rows = sorted(keep, key=lambda row: row["published"])
+        return rows
+
+    def get_news(self, symbol, start_date, end_date, limit=None):
+        """Fetch missing days, then answer from the store."""
+        self.update(symbol, start_date, end_date)
+        return self.query(symbol, start_date, end_date, limit)
+
+
+def finnhub_fetch(symbol, start_date, end_date):
+    """Raw Finnhub company_news call (keeps URL, source and id, unlike FinnHubUtils)."""
+    import finnhub
+
+    client = finnhub.Client(api_key=os.environ["FINNHUB_API_KEY"])
+    return client.company_news(symbol, _from=start_date, to=end_date)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = NewsStore()
+        return _store
+
+
+def get_company_news(symbol, start_date, end_date, max_news_num=10, save_path=None):
+    """
+    Drop-in replacement for FinnHubUtils.get_company_news served from the store.
+
+    Returns the same DataFrame columns (date as %Y%m%d%H%M%S, headline,
+    summary), with duplicates removed and the most syndicated stories kept
+    when there are more than max_news_num.
+    """
+    import pandas as pd
+
+    rows = get_store().get_news(symbol, start_date, end_date, limit=max_news_num)
+    news = pd.DataFrame(
+        [
+            {
+                "date": datetime.fromtimestamp(row["published"]).strftime("%Y%m%d%H%M%S"),
+                "headline": row["headline"],
+                "summary": row["summary"],
+            }
+            for row in rows
+        ],
+        columns=["date", "headline", "summary"],
+    )
+    if save_path:
+        news.to_csv(save_path)
+        print(f"News saved to {save_path}")
+    return news
+
+
+def install_news_store():
+    """Serve FinnHubUtils.get_company_news (and its prefetch) from the news store."""
+    try:
+        override_source_method("finnhub_utils", "FinnHubUtils", "get_company_news", get_company_news)
+    except (ImportError, AttributeError) as e:
+        logger.warning(f"Cannot route company news through the news store: {e}")
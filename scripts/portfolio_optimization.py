@@ -26,6 +26,14 @@ def load_factor_rankings():
     except FileNotFoundError:
         print("Momentum rankings file not found")
     
+    # Try to load technical rankings
+    try:
+        technical_df = pd.read_csv('dow_jones_technical_rankings.csv', index_col=0)
+        rankings['technical'] = technical_df
+        print("Technical rankings loaded successfully")
+    except FileNotFoundError:
+        print("Technical rankings file not found")
+    
     # Add more factors as they become available
     # try:
     #     quality_df = pd.read_csv('dow_jones_quality_rankings.csv', index_col=0)
@@ -73,6 +81,8 @@ def combine_factor_rankings(rankings, weights=None):
             combined_df[f'{factor}_rank'] = df['Composite Value Rank']
         elif factor == 'momentum' and 'Composite Momentum Rank' in df.columns:
             combined_df[f'{factor}_rank'] = df['Composite Momentum Rank']
+        elif factor == 'technical' and 'Composite Technical Rank' in df.columns:
+            combined_df[f'{factor}_rank'] = df['Composite Technical Rank']
         # Add more factors as they become available
     
     # Fill NaN values with the median rank
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Speculative prefetch of the data agents commonly request for a symbol.
+
+As soon as a symbol is entered, price history, company profile, news and
+basic financials are fetched concurrently into the process-wide data cache.
+The data-source methods are routed through that cache (see
+data_cache.install_cache_hooks), so when the LLM later asks for the data the
+tool call resolves from memory, and the network latency overlaps with the
+first LLM turn instead of following it.
+
+Usage:
+    from prefetch import prefetch_symbol
+    prefetch = prefetch_symbol("AAPL", one_year_ago, current_date, news_start_date=one_month_ago)
+    ...  # build the query, start the chat
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from data_cache import cached_source_call, get_cache, import_data_source, install_cache_hooks
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetch:
+    """Handle for a running prefetch; the fetches continue in the background."""
+
+    def __init__(self, symbol, futures):
+        self.symbol = symbol
+        self.futures = futures
+        self.started = time.time()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the prefetch to finish.
+
+        Returns:
+        dict: Map of request name to "ok", "error: ..." or "pending"
+        """
+        wait(list(self.futures.values()), timeout=timeout)
+        return self.status()
+
+    def status(self):
+        status = {}
+        for name, future in self.futures.items():
+            if not future.done():
+                status[name] = "pending"
+            elif future.exception() is not None:
+                status[name] = f"error: {future.exception()}"
+            else:
+                status[name] = "ok"
+        return status
+
+
+def prefetch_symbol(symbol, start_date, end_date, news_start_date=None, cache=None, max_workers=4):
+    """
+    Start fetching the commonly requested data for symbol in the background.
+
+    Price history is fetched for the widest window (start_date to end_date);
+    narrower requests are later answered by slicing it. News is fetched from
+    news_start_date (default: start_date) to end_date.
+
+    Parameters:
+    symbol (str): Stock ticker symbol
+    start_date (str): Start of the price history window (YYYY-MM-DD)
+    end_date (str): End of all windows (YYYY-MM-DD)
+    news_start_date (str): Start of the news window (YYYY-MM-DD)
+    cache (MarketDataCache): Cache to fill (default: process-wide cache)
+    max_workers (int): Number of concurrent requests
+
+    Returns:
+    Prefetch: Handle to inspect or wait for the prefetch
+    """
+    cache = cache or get_cache()
+    install_cache_hooks(cache)
+
+    try:
+        YFinanceUtils = import_data_source("yfinance_utils", "YFinanceUtils")
+        FinnHubUtils = import_data_source("finnhub_utils", "FinnHubUtils")
+    except ImportError as e:
+        logger.warning(f"Prefetch disabled, data sources unavailable: {e}")
+        return Prefetch(symbol, {})
+
+    requests = {
+        "stock_data": (YFinanceUtils, "get_stock_data", (symbol, start_date, end_date)),
+        "company_profile": (FinnHubUtils, "get_company_profile", (symbol,)),
+        "company_news": (FinnHubUtils, "get_company_news", (symbol, news_start_date or start_date, end_date)),
+        "basic_financials": (FinnHubUtils, "get_basic_financials", (symbol,)),
+    }
+
+    def fetch(name, cls, method_name, args):
+        started = time.time()
+        try:
+            result = cached_source_call(cls, method_name, *args, cache=cache)
+        except Exception as e:
+            logger.warning(f"Prefetch of {name} for {symbol} failed: {e}")
+            raise
+        logger.info(f"Prefetched {name} for {symbol} in {time.time() - started:.2f}s")
+        return result
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+    futures = {
+        name: executor.submit(fetch, name, cls, method_name, args)
+        for name, (cls, method_name, args) in requests.items()
+    }
+    # Let the fetches finish in the background without blocking the caller
+    executor.shutdown(wait=False)
+    return Prefetch(symbol, futures)
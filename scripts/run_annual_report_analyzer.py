@@ -13,6 +13,12 @@ sys.path.insert(0, parent_dir)
 
 from FinRobot.finrobot.agents.annual_report_analyzer import AnnualReportAnalyzer
 from FinRobot.finrobot.utils import register_keys_from_json
+from runtime import install_runtime
+from prefetch import prefetch_symbol
+from filing_sections import section_prompt
+from filing_store import FilingStore
+from filing_mapreduce import analyze_filing
+from document_ingest import ingest_stored_filing
 
 # Set the paths
 config_api_keys_path = os.path.join(parent_dir, "FinRobot", "config_api_keys")
@@ -30,7 +36,8 @@ except Exception as e:
 try:
     llm_config = {
         "config_list": autogen.config_list_from_json(
-            oai_config_list_path,
+            "OAI_CONFIG_LIST",
+            file_location=os.path.dirname(oai_config_list_path),
             filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
         ),
         "timeout": 120,
@@ -41,6 +48,10 @@ except Exception as e:
     print(f"Failed to set up LLM config: {e}")
     sys.exit(1)
 
+# Install the cache, news store, tracing, model routing, rate limiting, streaming and
+# history hooks, in the order they depend on (must precede agent creation)
+install_runtime()
+
 # Initialize Annual Report Analyzer
 annual_report_analyzer = AnnualReportAnalyzer(
     "Annual_Report_Analyzer",
@@ -51,11 +62,47 @@ annual_report_analyzer = AnnualReportAnalyzer(
 # Get current date and date ranges for analysis
 current_date = datetime.now().strftime("%Y-%m-%d")
 one_year_ago = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d")
+one_month_ago = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
 
 # Get user input for stock symbol
 stock_symbol = input("Enter a stock symbol to analyze (default: AAPL): ") or "AAPL"
 print(f"Analyzing {stock_symbol}...")
 
+# Fetch the data the agents usually ask for while the first LLM turn runs
+prefetch = prefetch_symbol(stock_symbol, one_year_ago, current_date, news_start_date=one_month_ago)
+
+# A locally saved 10-K lets the analyzer read only Items 1A and 7 instead of the whole filing.
+# Without an explicit path the filing store is used; it only goes to EDGAR when no recent 10-K is stored.
+filing_path = input("Path to a downloaded 10-K filing (optional, press Enter to use the filing store): ").strip()
+if not filing_path:
+    try:
+        filing_path = FilingStore().latest_filing_path(stock_symbol, "10-K")
+    except Exception as e:
+        print(f"Could not load the latest 10-K from the filing store: {e}")
+    if filing_path:
+        # Index the stored 10-K for search_documents; unchanged paragraphs are not embedded again
+        try:
+            stats = ingest_stored_filing(stock_symbol)
+            print(f"Indexed the 10-K: {stats['embedded']} new chunks, {stats['skipped']} unchanged")
+        except Exception as e:
+            print(f"Could not index the 10-K: {e}")
+filing_sections = ""
+# Map-reduce mode reads Items 1A, 7 and 8 in full: chunks are analyzed concurrently and merged
+use_map_reduce = filing_path and input("Analyze the full filing with parallel map-reduce? (y/N): ").strip().lower() == "y"
+if use_map_reduce:
+    try:
+        result = analyze_filing(filing_path, llm_config, symbol=stock_symbol)
+        print(f"Map-reduce analysis of {result['chunks']} chunks ({result['cached_chunks']} cached) took {result['seconds']:.1f}s")
+        filing_sections = f"A chunk-by-chunk analysis of the latest 10-K (Items 1A, 7 and 8) is included below; build on it instead of fetching the filing.\n\n{result['analysis']}\n"
+    except Exception as e:
+        print(f"Map-reduce analysis failed, falling back to section excerpts: {e}")
+if filing_path and not filing_sections:
+    filing_sections = section_prompt(filing_path, items=("1A", "7"))
+    if filing_sections:
+        filing_sections = f"The relevant sections of the latest 10-K are included below; use them instead of fetching the filing.\n\n{filing_sections}"
+    else:
+        print(f"Could not locate Items 1A/7 in {filing_path}, the analyzer will fetch the filing itself")
+
 # Create the analysis query
 query = f"""
 IMPORTANT: Today is {current_date}. When using any data source tools, use the following date ranges:
@@ -66,7 +113,8 @@ IMPORTANT: Today is {current_date}. When using any data source tools, use the fo
 Analyze the latest annual report for {stock_symbol} and highlight key financial metrics, risks, and growth opportunities.
 Also analyze the latest 10-K SEC filing for {stock_symbol}, focusing on the Risk Factors (Section 1A) and Management's Discussion (Section 7).
 Make sure to use the most recent data available and explicitly mention the dates you're using in your analysis.
-"""
+
+{filing_sections}"""
 
 # Run the analyzer
 print("Starting analysis, this may take a few minutes...")
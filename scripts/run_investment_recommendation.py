@@ -14,6 +14,11 @@ sys.path.insert(0, parent_dir)
 from FinRobot.finrobot.agents.annual_report_analyzer import AnnualReportAnalyzer
 from FinRobot.finrobot.agents.trade_strategist import TradeStrategist
 from FinRobot.finrobot.utils import register_keys_from_json
+from runtime import install_runtime
+from prefetch import prefetch_symbol
+from analysis_packet import packet_prompt
+from context_compaction import condense_analysis, HANDOFF_TOKEN_BUDGET
+from job_queue import JobQueue, Pipeline, run_workers
 
 # Set the paths
 config_api_keys_path = os.path.join(parent_dir, "FinRobot", "config_api_keys")
@@ -31,7 +36,8 @@ except Exception as e:
 try:
     llm_config = {
         "config_list": autogen.config_list_from_json(
-            oai_config_list_path,
+            "OAI_CONFIG_LIST",
+            file_location=os.path.dirname(oai_config_list_path),
             filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
         ),
         "timeout": 120,
@@ -42,28 +48,31 @@ except Exception as e:
     print(f"Failed to set up LLM config: {e}")
     sys.exit(1)
 
+# Install the cache, news store, tracing, model routing, rate limiting, streaming and
+# history hooks, in the order they depend on (must precede agent creation)
+install_runtime()
+
 # Get current date and date ranges for analysis
 current_date = datetime.now().strftime("%Y-%m-%d")
 one_year_ago = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d")
 one_month_ago = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
 
-# Get user input for stock symbol
-stock_symbol = input("Enter a stock symbol to analyze (default: AAPL): ") or "AAPL"
-print(f"Analyzing {stock_symbol}...")
 
-# Step 1: Run Annual Report Analysis
-print("\n=== Step 1: Running Annual Report Analysis ===\n")
-print("This may take a few minutes...")
+def annual_report_stage(params, outputs):
+    """Step 1: Run Annual Report Analysis"""
+    stock_symbol = params["symbol"]
+    print(f"\n=== Step 1: Running Annual Report Analysis for {stock_symbol} ===\n")
+    print("This may take a few minutes...")
 
-# Initialize Annual Report Analyzer
-annual_report_analyzer = AnnualReportAnalyzer(
-    "Annual_Report_Analyzer",
-    llm_config,
-    human_input_mode="NEVER"
-)
+    # Initialize Annual Report Analyzer
+    annual_report_analyzer = AnnualReportAnalyzer(
+        "Annual_Report_Analyzer",
+        llm_config,
+        human_input_mode="NEVER"
+    )
 
-# Create the annual report analysis query
-annual_report_query = f"""
+    # Create the annual report analysis query
+    annual_report_query = f"""
 IMPORTANT: Today is {current_date}. When using any data source tools, use the following date ranges:
 - Current date: {current_date}
 - Start date for annual report data: {one_year_ago}
@@ -76,11 +85,10 @@ Make sure to use the most recent data available and explicitly mention the dates
 Provide a concise summary that can be used by an investment strategist.
 """
 
-# Run the annual report analyzer and capture the response
-try:
+    # Run the annual report analyzer and capture the response
     print("Starting annual report analysis...")
     annual_report_response = annual_report_analyzer.chat(annual_report_query)
-    
+
     # Extract the first response from the conversation
     if isinstance(annual_report_response, str):
         annual_report_analysis = annual_report_response
@@ -88,35 +96,44 @@ try:
         # If it's not a string, it might be a more complex object
         print("Warning: Unexpected response type from annual report analyzer")
         annual_report_analysis = str(annual_report_response)
-    
-    print("\n=== Annual Report Analysis ===\n")
+
+    print(f"\n=== Annual Report Analysis for {stock_symbol} ===\n")
     print(annual_report_analysis)
     print("\n=== End of Annual Report Analysis ===\n")
-except Exception as e:
-    print(f"Error during annual report analysis: {e}")
-    sys.exit(1)
+    return annual_report_analysis
+
 
-# Step 2: Generate Investment Recommendation based on Annual Report Analysis
-print("\n=== Step 2: Generating Investment Recommendation ===\n")
-print("This may take a few minutes...")
+def recommendation_stage(params, outputs):
+    """Step 2: Generate Investment Recommendation based on Annual Report Analysis"""
+    stock_symbol = params["symbol"]
+    print(f"\n=== Step 2: Generating Investment Recommendation for {stock_symbol} ===\n")
+    print("This may take a few minutes...")
 
-# Initialize Trade Strategist
-trade_strategist = TradeStrategist(
-    "Trade_Strategist",
-    llm_config,
-    human_input_mode="NEVER"
-)
+    # Initialize Trade Strategist
+    trade_strategist = TradeStrategist(
+        "Trade_Strategist",
+        llm_config,
+        human_input_mode="NEVER"
+    )
 
-# Create the investment recommendation query
-investment_recommendation_query = f"""
+    # Condense the analysis so the handoff stays within a fixed token budget
+    handoff_analysis = condense_analysis(outputs["annual_report"], HANDOFF_TOKEN_BUDGET)
+
+    # Precompute prices, indicators and fundamentals so the strategist can answer in one turn
+    analysis_packet = packet_prompt(stock_symbol, one_year_ago, current_date)
+
+    # Create the investment recommendation query
+    investment_recommendation_query = f"""
 IMPORTANT: Today is {current_date}. When using any data source tools, use the following date ranges:
 - Current date: {current_date}
 - Start date for historical data: {one_month_ago}
 - End date for historical data: {current_date}
 
+{analysis_packet}
+
 Based on the following annual report analysis for {stock_symbol}, develop a comprehensive investment recommendation:
 
-{annual_report_analysis}
+{handoff_analysis}
 
 Your recommendation should include:
 1. A clear investment stance (Buy, Hold, or Sell)
@@ -129,15 +146,51 @@ Use technical analysis to support your recommendation and provide specific price
 Make sure to use the most recent data available and explicitly mention the dates you're using in your analysis.
 """
 
-# Run the trade strategist
-try:
+    # Run the trade strategist
     print("Starting investment recommendation generation...")
     investment_recommendation = trade_strategist.chat(investment_recommendation_query)
-    
-    # Print the final output
-    print("\n=== Investment Recommendation for", stock_symbol, "===\n")
-    print(investment_recommendation)
-    print("\n=== Analysis Complete ===\n")
-except Exception as e:
-    print(f"Error during investment recommendation generation: {e}")
+    return investment_recommendation if isinstance(investment_recommendation, str) else str(investment_recommendation)
+
+
+pipeline = Pipeline("investment_recommendation", [
+    ("annual_report", annual_report_stage),
+    ("recommendation", recommendation_stage),
+])
+
+# Symbols can be passed on the command line for a batch run; otherwise ask for one
+if len(sys.argv) > 1:
+    stock_symbols = [symbol.upper() for symbol in sys.argv[1:]]
+else:
+    stock_symbols = [(input("Enter a stock symbol to analyze (default: AAPL): ") or "AAPL").upper()]
+print(f"Analyzing {', '.join(stock_symbols)}...")
+
+# Each stage's output is checkpointed, so re-running after a crash or timeout
+# resumes at the first unfinished stage instead of redoing the annual report
+job_queue = JobQueue()
+job_ids = {}
+for stock_symbol in stock_symbols:
+    job_id = job_queue.enqueue("investment_recommendation", {"symbol": stock_symbol}, job_id=f"{stock_symbol}:{current_date}")
+    job_queue.retry(job_id)
+    job_ids[stock_symbol] = job_id
+
+    # Fetch the data the agents usually ask for while the first LLM turn runs
+    prefetch_symbol(stock_symbol, one_year_ago, current_date, news_start_date=one_month_ago)
+
+num_workers = int(os.environ.get("FINROBOT_WORKERS", min(len(stock_symbols), 4)))
+run_workers(job_queue, {"investment_recommendation": pipeline}, num_workers=num_workers)
+
+# Print the final output
+failed = False
+for stock_symbol, job_id in job_ids.items():
+    job = job_queue.get(job_id)
+    if job["status"] == "done":
+        print("\n=== Investment Recommendation for", stock_symbol, "===\n")
+        print(job["stages"]["recommendation"])
+    else:
+        failed = True
+        print(f"\nError during investment recommendation for {stock_symbol}: {job['error']}")
+        print(f"Completed stages are saved in {job_queue.db_path}; run the script again to resume.")
+
+print("\n=== Analysis Complete ===\n")
+if failed:
     sys.exit(1)
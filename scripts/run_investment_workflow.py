@@ -14,6 +14,10 @@ parent_dir = os.path.dirname(current_dir)
 sys.path.insert(0, parent_dir)
 
 from FinRobot.finrobot.utils import register_keys_from_json
+from runtime import install_runtime
+from prefetch import prefetch_symbol
+from chat_summary import extractive_summary
+from context_compaction import condense_analysis, HANDOFF_TOKEN_BUDGET
 
 # Set the paths
 config_api_keys_path = os.path.join(parent_dir, "FinRobot", "config_api_keys")
@@ -31,7 +35,8 @@ except Exception as e:
 try:
     llm_config = {
         "config_list": autogen.config_list_from_json(
-            oai_config_list_path,
+            "OAI_CONFIG_LIST",
+            file_location=os.path.dirname(oai_config_list_path),
             filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
         ),
         "timeout": 120,
@@ -42,6 +47,10 @@ except Exception as e:
     print(f"Failed to set up LLM config: {e}")
     sys.exit(1)
 
+# Install the cache, news store, tracing, model routing, rate limiting, streaming and
+# history hooks, in the order they depend on (must precede agent creation)
+install_runtime()
+
 # Get current date and date ranges for analysis
 current_date = datetime.now().strftime("%Y-%m-%d")
 one_year_ago = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d")
@@ -51,6 +60,9 @@ one_month_ago = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
 stock_symbol = input("Enter a stock symbol to analyze (default: AAPL): ") or "AAPL"
 print(f"Analyzing {stock_symbol}...")
 
+# Fetch the data the agents usually ask for while the first LLM turn runs
+prefetch = prefetch_symbol(stock_symbol, one_year_ago, current_date, news_start_date=one_month_ago)
+
 # Create the workflow coordinator
 workflow_coordinator = autogen.AssistantAgent(
     name="Workflow_Coordinator",
@@ -149,8 +161,8 @@ def order_trigger(pattern, sender):
 
 def order_message(pattern, recipient, messages, sender, config):
     full_order = recipient.chat_messages_for_summary(sender)[-1]["content"]
-    pattern = rf"\[{pattern}\](?::)?\s*(.+?)(?=\n\[|$)"
-    match = re.search(pattern, full_order, re.DOTALL)
+    order_pattern = rf"\[{pattern}\](?::)?\s*(.+?)(?=\n\[|$)"
+    match = re.search(order_pattern, full_order, re.DOTALL)
     if match:
         order = match.group(1).strip()
     else:
@@ -173,6 +185,7 @@ def order_message(pattern, recipient, messages, sender, config):
             if msg["role"] == "assistant" and msg["name"] == "Annual_Report_Analyzer":
                 annual_report_analysis = msg["content"]
                 break
+        annual_report_analysis = condense_analysis(annual_report_analysis, HANDOFF_TOKEN_BUDGET)
         
         return f"""
         Based on the following annual report analysis for {stock_symbol}, develop a comprehensive investment recommendation:
@@ -201,7 +214,8 @@ executor.register_nested_chats(
             "sender": executor,
             "recipient": annual_report_analyzer,
             "message": partial(order_message, "Annual_Report_Analyzer"),
-            "summary_method": "reflection_with_llm",
+            "summary_method": extractive_summary,
+            "summary_args": {"max_tokens": 600},
             "max_turns": 10,
         }
     ],
@@ -214,7 +228,8 @@ executor.register_nested_chats(
             "sender": executor,
             "recipient": trade_strategist,
             "message": partial(order_message, "Trade_Strategist"),
-            "summary_method": "reflection_with_llm",
+            "summary_method": extractive_summary,
+            "summary_args": {"max_tokens": 600},
             "max_turns": 10,
         }
     ],
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# run_parallel_analysis.py
+
+import sys
+import os
+import time
+from datetime import datetime, timedelta
+import autogen
+
+# Add parent directory to path to import finrobot modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+from FinRobot.finrobot.utils import register_keys_from_json
+from runtime import install_runtime
+from prefetch import prefetch_symbol
+from agent_service import AgentPool
+from fan_out import fan_out, merge_reports, specialist_tasks
+
+# Set the paths
+config_api_keys_path = os.path.join(parent_dir, "FinRobot", "config_api_keys")
+oai_config_list_path = os.path.join(parent_dir, "FinRobot", "OAI_CONFIG_LIST")
+
+# Register API keys
+try:
+    register_keys_from_json(config_api_keys_path)
+    print("API keys registered successfully")
+except Exception as e:
+    print(f"Failed to register API keys: {e}")
+    sys.exit(1)
+
+# Setup LLM config
+try:
+    llm_config = {
+        "config_list": autogen.config_list_from_json(
+            "OAI_CONFIG_LIST",
+            file_location=os.path.dirname(oai_config_list_path),
+            filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
+        ),
+        "timeout": 120,
+        "temperature": 0,
+    }
+    print("LLM config set up successfully")
+except Exception as e:
+    print(f"Failed to set up LLM config: {e}")
+    sys.exit(1)
+
+# Install the cache, news store, tracing, model routing, rate limiting, streaming and
+# history hooks, in the order they depend on (must precede agent creation)
+install_runtime()
+
+# Get current date and date ranges for analysis
+current_date = datetime.now().strftime("%Y-%m-%d")
+one_year_ago = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d")
+one_month_ago = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+
+# Get user input for stock symbol
+stock_symbol = input("Enter a stock symbol to analyze (default: AAPL): ") or "AAPL"
+timeout = float(os.environ.get("FINROBOT_AGENT_TIMEOUT", 300))
+print(f"Analyzing {stock_symbol} with all specialist agents in parallel (timeout {timeout:.0f}s per agent)...")
+
+# Fetch the data the agents usually ask for while the agents are being built
+prefetch = prefetch_symbol(stock_symbol, one_year_ago, current_date, news_start_date=one_month_ago)
+
+# One pre-built instance of each specialist; agents that are not installed are skipped
+pool = AgentPool(llm_config, pool_size=1)
+
+# Fan out: the specialists need different data and do not wait for one another
+started = time.time()
+results = fan_out(pool, specialist_tasks(stock_symbol, timeout=timeout, current_date=current_date))
+for agent_type, result in results.items():
+    print(f"- {agent_type}: {result['status']} in {result['seconds']:.1f}s" + (f" ({result['error']})" if result.get("error") else ""))
+
+# Fan in: one aggregation call merges whatever finished into a structured report
+report = merge_reports(stock_symbol, results, llm_config, current_date=current_date)
+print(f"\nParallel analysis finished in {time.time() - started:.1f}s")
+
+output_dir = os.path.join(current_dir, "analysis_output")
+os.makedirs(output_dir, exist_ok=True)
+report_path = os.path.join(output_dir, f"{stock_symbol}_parallel_report_{current_date}.md")
+with open(report_path, "w") as f:
+    f.write(report)
+
+print("\n=== Combined Specialist Report ===\n")
+print(report)
+print(f"\nReport saved to {report_path}")
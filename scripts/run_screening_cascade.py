@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# run_screening_cascade.py
+
+import sys
+import os
+import time
+from datetime import datetime
+import autogen
+
+# Add parent directory to path to import finrobot modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+from FinRobot.finrobot.utils import register_keys_from_json
+from runtime import install_runtime
+from agent_service import AgentPool
+from screening_cascade import (
+    LLM_AGENTS, LLMBudget, download_prices, factor_scores, run_llm_stage, shortlist, universe_metrics
+)
+
+# Set the paths
+config_api_keys_path = os.path.join(parent_dir, "FinRobot", "config_api_keys")
+oai_config_list_path = os.path.join(parent_dir, "FinRobot", "OAI_CONFIG_LIST")
+
+# Dow Jones 30 tickers, screened when no universe file is given
+dow_tickers = [
+    'AAPL', 'AMGN', 'AXP', 'BA', 'CAT', 'CRM', 'CSCO', 'CVX', 'DIS', 'DOW',
+    'GS', 'HD', 'HON', 'IBM', 'INTC', 'JNJ', 'JPM', 'KO', 'MCD', 'MMM',
+    'MRK', 'MSFT', 'NKE', 'PG', 'TRV', 'UNH', 'V', 'VZ', 'WBA', 'WMT'
+]
+
+# Universe: a file with one ticker per line (or comma-separated) as the first argument
+if len(sys.argv) > 1:
+    with open(sys.argv[1]) as f:
+        universe = [ticker.strip().upper() for ticker in f.read().replace(",", "\n").split() if ticker.strip()]
+else:
+    universe = dow_tickers
+
+top_k = int(os.environ.get("FINROBOT_SCREEN_TOP_K", 10))
+token_budget = int(os.environ.get("FINROBOT_SCREEN_TOKEN_BUDGET", 400000))
+min_score = float(os.environ["FINROBOT_SCREEN_MIN_SCORE"]) if os.environ.get("FINROBOT_SCREEN_MIN_SCORE") else None
+
+# Register API keys
+try:
+    register_keys_from_json(config_api_keys_path)
+    print("API keys registered successfully")
+except Exception as e:
+    print(f"Failed to register API keys: {e}")
+    sys.exit(1)
+
+# Setup LLM config
+try:
+    llm_config = {
+        "config_list": autogen.config_list_from_json(
+            "OAI_CONFIG_LIST",
+            file_location=os.path.dirname(oai_config_list_path),
+            filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
+        ),
+        "timeout": 120,
+        "temperature": 0,
+    }
+    print("LLM config set up successfully")
+except Exception as e:
+    print(f"Failed to set up LLM config: {e}")
+    sys.exit(1)
+
+# Install the cache, news store, tracing, model routing, rate limiting, streaming and
+# history hooks, in the order they depend on (must precede agent creation)
+install_runtime()
+
+current_date = datetime.now().strftime("%Y-%m-%d")
+output_dir = os.path.join(current_dir, "analysis_output")
+os.makedirs(output_dir, exist_ok=True)
+
+# Stage 1: rank the whole universe on value, momentum, quality and growth
+print(f"Screening {len(universe)} tickers...")
+started = time.time()
+prices = download_prices(universe)
+scores = factor_scores(universe_metrics(prices))
+scores_path = os.path.join(output_dir, f"screen_scores_{current_date}.csv")
+scores.to_csv(scores_path)
+names = shortlist(scores, top_k=top_k, min_score=min_score)
+print(f"Quantitative stage ranked {len(scores)} tickers in {time.time() - started:.1f}s (scores saved to {scores_path})")
+print(scores.head(len(names)).round(3).to_string())
+
+if not names:
+    print("No ticker passed the screen")
+    sys.exit(0)
+
+# Stage 2: the agents only see the shortlist, within a fixed LLM budget
+print(f"\nRunning the Annual Report Analyzer and Trade Strategist on {len(names)} names (token budget {token_budget})...")
+pool = AgentPool(llm_config, pool_size=2, agent_types=LLM_AGENTS)
+budget = LLMBudget(max_names=top_k, max_tokens=token_budget)
+results = run_llm_stage(pool, names, budget=budget, scores=scores, current_date=current_date)
+
+report_path = os.path.join(output_dir, f"screen_report_{current_date}.md")
+with open(report_path, "w") as f:
+    f.write(f"# Screening report {current_date}\n\n")
+    for rank, symbol in enumerate(names, start=1):
+        result = results[symbol]
+        print(f"- {rank}. {symbol}: {result['status']} ({result.get('tokens', 0)} tokens, {result['seconds']:.1f}s)")
+        f.write(f"## {rank}. {symbol} (composite {scores.loc[symbol, 'composite']:.2f})\n\n")
+        if result["status"] == "done":
+            f.write(f"### Recommendation\n\n{result['recommendation']}\n\n### Annual report\n\n{result['annual_report']}\n\n")
+        else:
+            f.write(f"Not analyzed: {result.get('error', result['status'])}\n\n")
+
+print(f"\nLLM budget used: {budget.summary()}")
+print(f"Screening finished in {time.time() - started:.1f}s, report saved to {report_path}")
@@ -13,6 +13,10 @@ sys.path.insert(0, parent_dir)
 
 from FinRobot.finrobot.agents.trade_strategist import TradeStrategist
 from FinRobot.finrobot.utils import register_keys_from_json
+from runtime import install_runtime
+from prefetch import prefetch_symbol
+from analysis_packet import packet_prompt
+from context_compaction import condense_analysis, HANDOFF_TOKEN_BUDGET
 
 # Set the paths
 config_api_keys_path = os.path.join(parent_dir, "FinRobot", "config_api_keys")
@@ -30,7 +34,8 @@ except Exception as e:
 try:
     llm_config = {
         "config_list": autogen.config_list_from_json(
-            oai_config_list_path,
+            "OAI_CONFIG_LIST",
+            file_location=os.path.dirname(oai_config_list_path),
             filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
         ),
         "timeout": 120,
@@ -41,6 +46,10 @@ except Exception as e:
     print(f"Failed to set up LLM config: {e}")
     sys.exit(1)
 
+# Install the cache, news store, tracing, model routing, rate limiting, streaming and
+# history hooks, in the order they depend on (must precede agent creation)
+install_runtime()
+
 # Get current date and date ranges for analysis
 current_date = datetime.now().strftime("%Y-%m-%d")
 one_year_ago = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d")
@@ -50,6 +59,9 @@ one_month_ago = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
 stock_symbol = input("Enter a stock symbol to analyze (default: AAPL): ") or "AAPL"
 print(f"Analyzing {stock_symbol}...")
 
+# Fetch the data the agents usually ask for while the first LLM turn runs
+prefetch = prefetch_symbol(stock_symbol, one_year_ago, current_date, news_start_date=one_month_ago)
+
 # Sample annual report analysis for NVDA (will be replaced with actual analysis if stock_symbol is not NVDA)
 nvda_analysis = """
 ### Analysis of NVIDIA Corporation (NVDA) Annual Report and 10-K Filing
@@ -178,6 +190,12 @@ trade_strategist = TradeStrategist(
     human_input_mode="NEVER"
 )
 
+# Condense the analysis so the handoff stays within a fixed token budget
+handoff_analysis = condense_analysis(annual_report_analysis, HANDOFF_TOKEN_BUDGET)
+
+# Precompute prices, indicators and fundamentals so the strategist can answer in one turn
+analysis_packet = packet_prompt(stock_symbol, one_year_ago, current_date)
+
 # Create the investment recommendation query
 investment_recommendation_query = f"""
 IMPORTANT: Today is {current_date}. When using any data source tools, use the following date ranges:
@@ -185,9 +203,11 @@ IMPORTANT: Today is {current_date}. When using any data source tools, use the fo
 - Start date for historical data: {one_month_ago}
 - End date for historical data: {current_date}
 
+{analysis_packet}
+
 Based on the following annual report analysis for {stock_symbol}, develop a comprehensive investment recommendation:
 
-{annual_report_analysis}
+{handoff_analysis}
 
 Your recommendation should include:
 1. A clear investment stance (Buy, Hold, or Sell)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Process-wide hooks shared by the runner scripts and the agent service.
+
+Several modules patch the FinRobot data sources or autogen itself, so they
+must be installed before any agent is created and in a fixed order:
+
+1. data_cache.install_cache_hooks: data-source calls go through the shared cache
+2. news_store.install_news_store: company news from the local store
+3. tracing.install_tracing: chat, LLM and tool spans (FINROBOT_TRACE)
+4. model_router.install_model_router: model tier per task class
+   (FINROBOT_MODEL_ROUTING); after tracing, so spans report the model that
+   answered
+5. llm_rate_limit.install_rate_limiter: RPM/TPM budgets and key balancing
+   (FINROBOT_RATE_LIMITS); after the router, so it balances the keys of
+   the tier the router chose
+6. token_stream.install_streaming: token-by-token output (FINROBOT_STREAM)
+7. history_policy.install_history_policy: pruned prompts
+   (FINROBOT_HISTORY_WINDOW)
+
+install_runtime() runs them in that order. Each one is switched off by its
+environment variable and is a no-op when called again.
+
+Hooks that need to know which agent an LLM call belongs to read
+current_agent(); install_agent_context() wraps
+ConversableAgent.generate_oai_reply once to record it, however many hooks
+ask for it.
+
+Usage:
+    from runtime import install_runtime
+    install_runtime()
+"""
+
+import functools
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_agent_context = threading.local()
+_agent_context_lock = threading.Lock()
+_agent_context_installed = False
+
+
+def current_agent():
+    """Name of the agent whose reply this thread is generating, or None."""
+    return getattr(_agent_context, "agent", None)
+
+
+def install_agent_context():
+    """
+    Record the replying agent's name for current_agent() (autogen 0.2).
+
+    Patches ConversableAgent.generate_oai_reply the first time it is called;
+    later calls do nothing. Raises ImportError without autogen.
+    """
+    global _agent_context_installed
+    with _agent_context_lock:
+        if _agent_context_installed:
+            return
+        from autogen import ConversableAgent
+
+        original_generate = ConversableAgent.generate_oai_reply
+
+        @functools.wraps(original_generate)
+        def generate_oai_reply(self, messages=None, sender=None, config=None):
+            previous = current_agent()
+            _agent_context.agent = self.name
+            try:
+                return original_generate(self, messages=messages, sender=sender, config=config)
+            finally:
+                _agent_context.agent = previous
+
+        ConversableAgent.generate_oai_reply = generate_oai_reply
+        _agent_context_installed = True
+
+
+def install_runtime(console=True):
+    """
+    Install the data, tracing, routing, rate-limit, streaming and history hooks.
+
+    Must run before agents are created.
+
+    Parameters:
+    console (bool): Print streamed tokens to stdout (the agent service
+        serves them over HTTP instead)
+
+    Returns:
+    dict: The tracer, model router, rate limiter, token stream and history
+        policy by name (None for each one that is off)
+    """
+    from data_cache import install_cache_hooks
+    from history_policy import install_history_policy
+    from llm_rate_limit import install_rate_limiter
+    from model_router import install_model_router
+    from news_store import install_news_store
+    from token_stream import install_streaming
+    from tracing import install_tracing
+
+    install_cache_hooks()
+    install_news_store()
+    installed = {}
+    installed["tracing"] = install_tracing()
+    installed["model_router"] = install_model_router()
+    installed["rate_limiter"] = install_rate_limiter()
+    installed["streaming"] = install_streaming(console=console)
+    installed["history_policy"] = install_history_policy()
+    logger.info(f"Runtime hooks on: {', '.join(name for name, value in installed.items() if value is not None) or 'none'}")
+    return installed
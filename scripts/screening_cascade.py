@@ -0,0 +1,446 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Two-stage screening cascade: a quantitative prefilter over the whole
+universe, then the LLM agents on the shortlist only.
+
+Stage 1 computes the value, momentum, quality and growth metrics of every
+ticker (momentum from one (dates x tickers) price matrix, the fundamentals
+from one quote lookup plus the annual and quarterly income statements per
+ticker, fetched concurrently) and turns each metric
+into a cross-sectional percentile with the same directions and exclusions
+as the rank_*_stocks functions of the factor scripts. Factor scores are the
+mean of their metric percentiles and the composite is their weighted mean,
+so a universe of thousands of names is ranked in a few vectorized passes.
+
+Stage 2 sends only the top K names (or those passing score thresholds) to
+the Annual Report Analyzer and then the Trade Strategist. The shortlist is
+streamed through three overlapping stages in rank order: data preparation
+(prefetch and analysis packet), annual-report analysis and strategy, so the
+strategist works on one name while the analyzer works on the next and the
+data of the one after is being fetched. An LLMBudget caps the number of
+names and the tokens spent per run; names beyond it are reported as skipped.
+
+Usage:
+    metrics = universe_metrics(prices)
+    scores = factor_scores(metrics)
+    names = shortlist(scores, top_k=10)
+    results = run_llm_stage(AgentPool(llm_config, agent_types=LLM_AGENTS), names, LLMBudget(10, 400000))
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from context_compaction import condense_analysis, count_tokens, HANDOFF_TOKEN_BUDGET
+from fan_out import agent_output, specialist_tasks
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_K = 10
+FUNDAMENTAL_WORKERS = 16
+PREPARE_WORKERS = 4
+# Tokens reserved for a name before it is admitted to the LLM stage (both agents, tool calls included)
+TOKENS_PER_NAME_ESTIMATE = 30000
+
+LLM_AGENTS = ["annual_report_analyzer", "trade_strategist"]
+
+# factor -> (metric column, higher is better, only positive values are ranked), as in the factor scripts
+FACTOR_METRICS = {
+    "value": [
+        ("P/E Ratio", False, True),
+        ("P/B Ratio", False, True),
+        ("Dividend Yield", True, True),
+        ("EV/EBITDA", False, True),
+    ],
+    "momentum": [
+        ("1-Month Return (%)", True, False),
+        ("3-Month Return (%)", True, False),
+        ("6-Month Return (%)", True, False),
+        ("12-Month Return (%)", True, False),
+        ("Price/50-Day MA", True, False),
+        ("Price/200-Day MA", True, False),
+        ("50-Day MA/200-Day MA", True, False),
+    ],
+    "quality": [
+        ("ROE", True, True),
+        ("ROA", True, True),
+        ("Debt-to-Equity", False, True),
+        ("Operating Margin", True, True),
+        ("FCF Yield", True, True),
+    ],
+    "growth": [
+        ("Revenue Growth (1Y)", True, True),
+        ("Earnings Growth (1Y)", True, True),
+        ("Revenue Growth (Q)", True, True),
+        ("Earnings Growth (Q)", True, True),
+    ],
+}
+
+RETURN_PERIODS = [("1-Month", 21), ("3-Month", 63), ("6-Month", 126), ("12-Month", 252)]
+
+STRATEGY_QUERY = """IMPORTANT: Today is {current_date}. Use price data from {one_month_ago} to {current_date}.
+
+{packet}
+
+{symbol} passed a quantitative screen (composite percentile {score:.2f}; {factors}).
+Based on the following annual report analysis, give a Buy, Hold or Sell stance, a target price range,
+entry and exit levels, a stop loss and the investment timeframe.
+
+{analysis}"""
+
+
+def download_prices(symbols, days=400):
+    """Download daily closes for the whole universe in one batched yfinance call."""
+    import yfinance as yf
+    from technical_factor_analysis import extract_field
+
+    end_date = datetime.now()
+    data = yf.download(list(symbols), start=end_date - timedelta(days=days), end=end_date, progress=False)
+    close = extract_field(data, "Adj Close")
+    return close if close is not None else extract_field(data, "Close")
+
+
+def momentum_metrics(prices):
+    """
+    Momentum metrics for every column of a (dates x tickers) close matrix.
+
+    Parameters:
+    prices (DataFrame): Daily closes, one column per ticker
+
+    Returns:
+    DataFrame: Returns over 1/3/6/12 months and moving-average ratios per ticker
+    """
+    prices = prices.ffill()
+    last = prices.iloc[-1]
+    metrics = pd.DataFrame(index=prices.columns)
+    for label, periods in RETURN_PERIODS:
+        base = prices.iloc[-1 - periods] if len(prices) > periods else pd.Series(np.nan, index=prices.columns)
+        metrics[f"{label} Return (%)"] = (last / base - 1) * 100
+    metrics["Current Price"] = last
+    if len(prices) >= 200:
+        ma_50 = prices.iloc[-50:].mean()
+        ma_200 = prices.iloc[-200:].mean()
+        # Tickers listed for less than 200 days have no long average
+        ma_200 = ma_200.where(prices.iloc[-200:].notna().all())
+        metrics["Price/50-Day MA"] = last / ma_50
+        metrics["Price/200-Day MA"] = last / ma_200
+        metrics["50-Day MA/200-Day MA"] = ma_50 / ma_200
+    return metrics
+
+
+def _statement_growth(statement, row):
+    """Latest over previous period of one income-statement row, minus 1 (as in growth_factor_analysis)."""
+    if statement is None or statement.empty or row not in statement.index:
+        return None
+    values = statement.loc[row]
+    return values.iloc[0] / values.iloc[1] - 1 if len(values) >= 2 else None
+
+
+def yfinance_fundamentals(symbol):
+    """
+    Value, quality and growth metrics of one ticker from yfinance.
+
+    Value and quality come from the quote lookup; growth is computed from the
+    annual and quarterly income statements like growth_factor_analysis does
+    (year over year, and quarter over quarter), not from the quote's
+    year-over-year quarterly growth fields.
+    """
+    import yfinance as yf
+
+    ticker = yf.Ticker(symbol)
+    info = ticker.info or {}
+    annual = ticker.financials
+    quarterly = ticker.quarterly_financials
+    market_cap = info.get("marketCap")
+    free_cash_flow = info.get("freeCashflow")
+    return {
+        "P/E Ratio": info.get("trailingPE"),
+        "P/B Ratio": info.get("priceToBook"),
+        "Dividend Yield": info["dividendYield"] * 100 if info.get("dividendYield") else None,
+        "EV/EBITDA": info.get("enterpriseToEbitda"),
+        "Market Cap (B)": market_cap / 1e9 if market_cap else None,
+        "ROE": info.get("returnOnEquity"),
+        "ROA": info.get("returnOnAssets"),
+        "Debt-to-Equity": info["debtToEquity"] / 100 if info.get("debtToEquity") else None,
+        "Operating Margin": info.get("operatingMargins"),
+        "FCF Yield": free_cash_flow / market_cap if free_cash_flow and market_cap else None,
+        "Revenue Growth (1Y)": _statement_growth(annual, "Total Revenue"),
+        "Earnings Growth (1Y)": _statement_growth(annual, "Net Income"),
+        "Revenue Growth (Q)": _statement_growth(quarterly, "Total Revenue"),
+        "Earnings Growth (Q)": _statement_growth(quarterly, "Net Income"),
+    }
+
+
+def fundamental_metrics(symbols, fetch=yfinance_fundamentals, workers=FUNDAMENTAL_WORKERS):
+    """
+    Fetch fundamentals for many tickers concurrently; failures become NaN rows.
+
+    Returns:
+    DataFrame: One row per ticker
+    """
+    symbols = list(symbols)
+
+    def safe_fetch(symbol):
+        try:
+            return fetch(symbol)
+        except Exception as e:
+            logger.warning(f"No fundamentals for {symbol}: {e}")
+            return {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(symbols)))) as pool:
+        rows = list(pool.map(safe_fetch, symbols))
+    return pd.DataFrame(rows, index=symbols).apply(pd.to_numeric, errors="coerce")
+
+
+def universe_metrics(prices, fundamentals=None, fetch=yfinance_fundamentals, workers=FUNDAMENTAL_WORKERS):
+    """Momentum metrics from prices joined with fundamentals (fetched when not given)."""
+    metrics = momentum_metrics(prices)
+    if fundamentals is None:
+        fundamentals = fundamental_metrics(metrics.index, fetch=fetch, workers=workers)
+    return metrics.join(fundamentals.drop(columns=metrics.columns, errors="ignore"), how="left")
+
+
+def factor_scores(metrics, weights=None):
+    """
+    Cross-sectional percentile scores per factor and a weighted composite.
+
+    Each available metric is ranked as a percentile over the whole universe
+    (1.0 is best); non-positive values of positive-only metrics are left
+    unranked, as in the factor scripts. A factor score is the mean of its
+    metric percentiles, and the composite is the weighted mean of the factor
+    scores a ticker has.
+
+    Parameters:
+    metrics (DataFrame): One row per ticker, columns as in FACTOR_METRICS
+    weights (dict): factor -> weight (default: equal weights)
+
+    Returns:
+    DataFrame: value, momentum, quality, growth and composite scores, best first
+    """
+    scores = pd.DataFrame(index=metrics.index)
+    for factor, columns in FACTOR_METRICS.items():
+        percentiles = []
+        for column, higher_is_better, positive_only in columns:
+            if column not in metrics.columns:
+                continue
+            values = pd.to_numeric(metrics[column], errors="coerce")
+            if positive_only:
+                values = values.where(values > 0)
+            percentiles.append(values.rank(pct=True, ascending=higher_is_better))
+        if percentiles:
+            scores[factor] = pd.concat(percentiles, axis=1).mean(axis=1)
+
+    weights = weights or {factor: 1.0 for factor in scores.columns}
+    factors = [factor for factor in scores.columns if weights.get(factor)]
+    if not factors:
+        raise ValueError("None of the weighted factors has metrics")
+    weight_vector = np.array([weights[factor] for factor in factors], dtype=float)
+    values = scores[factors].to_numpy()
+    present = ~np.isnan(values)
+    total_weight = present @ weight_vector
+    composite = np.where(present, values, 0.0) @ weight_vector
+    scores["composite"] = np.divide(composite, total_weight, out=np.full(len(scores), np.nan), where=total_weight > 0)
+    scores["factors_available"] = present.sum(axis=1)
+    return scores.sort_values("composite", ascending=False)
+
+
+def shortlist(scores, top_k=DEFAULT_TOP_K, min_score=None, min_factor_scores=None):
+    """
+    Pick the names that go to the LLM stage.
+
+    Parameters:
+    scores (DataFrame): Output of factor_scores()
+    top_k (int): Maximum number of names (None: all that pass the thresholds)
+    min_score (float): Minimum composite percentile
+    min_factor_scores (dict): factor -> minimum percentile
+
+    Returns:
+    list: Tickers, best first
+    """
+    passed = scores[scores["composite"].notna()]
+    if min_score is not None:
+        passed = passed[passed["composite"] >= min_score]
+    for factor, minimum in (min_factor_scores or {}).items():
+        passed = passed[passed[factor].fillna(0) >= minimum]
+    names = list(passed.index)
+    return names[:top_k] if top_k is not None else names
+
+
+class LLMBudget:
+    """Caps the LLM stage of a screening run by number of names and tokens."""
+
+    def __init__(self, max_names=DEFAULT_TOP_K, max_tokens=None, tokens_per_name=TOKENS_PER_NAME_ESTIMATE):
+        self.max_names = max_names
+        self.max_tokens = max_tokens
+        self.tokens_per_name = tokens_per_name
+        self.names = 0
+        self.tokens = 0
+        self.reserved = 0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Admit one more name if its estimated cost still fits; returns False otherwise."""
+        with self._lock:
+            if self.max_names is not None and self.names >= self.max_names:
+                return False
+            if self.max_tokens is not None and self.tokens + self.reserved + self.tokens_per_name > self.max_tokens:
+                return False
+            self.names += 1
+            self.reserved += self.tokens_per_name
+            return True
+
+    def charge(self, tokens, release=False):
+        """Record tokens actually used; release=True returns the name's reservation."""
+        with self._lock:
+            self.tokens += tokens
+            if release:
+                self.reserved = max(0, self.reserved - self.tokens_per_name)
+
+    def summary(self):
+        return {"names": self.names, "tokens": self.tokens, "max_names": self.max_names, "max_tokens": self.max_tokens}
+
+
+def usage_tokens(agent):
+    """Total tokens reported by the agent's OpenAI client so far, or None if unknown."""
+    assistant = getattr(agent, "assistant", agent)
+    try:
+        usage = assistant.get_total_usage()
+    except Exception:
+        return None
+    if not usage:
+        return None
+    return sum(value.get("total_tokens", 0) for value in usage.values() if isinstance(value, dict))
+
+
+def run_agent(pool, agent_type, query):
+    """Run one pooled agent; returns (output, tokens used)."""
+    agent = pool.checkout(agent_type)
+    try:
+        before = usage_tokens(agent)
+        output = agent_output(agent, agent.chat(query))
+        after = usage_tokens(agent)
+    finally:
+        pool.checkin(agent_type, agent)
+    if before is not None and after is not None and after >= before:
+        return output, after - before
+    # Client usage is unavailable: count the visible prompt and answer
+    return output, count_tokens(query) + count_tokens(output)
+
+
+def prepare_symbol(symbol, current_date):
+    """Warm the data cache for one shortlisted name and build its analysis packet."""
+    from analysis_packet import packet_prompt
+    from prefetch import prefetch_symbol
+
+    today = datetime.strptime(current_date, "%Y-%m-%d")
+    one_year_ago = (today - timedelta(days=365)).strftime("%Y-%m-%d")
+    one_month_ago = (today - timedelta(days=30)).strftime("%Y-%m-%d")
+    prefetch_symbol(symbol, one_year_ago, current_date, news_start_date=one_month_ago)
+    return packet_prompt(symbol, one_year_ago, current_date)
+
+
+def run_llm_stage(pool, symbols, budget=None, scores=None, current_date=None, prepare=prepare_symbol,
+                  prepare_workers=PREPARE_WORKERS):
+    """
+    Run the Annual Report Analyzer and then the Trade Strategist on a shortlist.
+
+    Names are processed in the given (rank) order through three overlapping
+    stages: data preparation, annual-report analysis and strategy. Each stage
+    runs as many names at once as the pool has agents of its type. A name is
+    admitted to the LLM stages only if the budget still allows it.
+
+    Parameters:
+    pool (AgentPool): Pool with annual_report_analyzer and trade_strategist agents
+    symbols (list): Shortlisted tickers, best first
+    budget (LLMBudget): Names/tokens cap (default: no cap beyond the shortlist)
+    scores (DataFrame): factor_scores() output, quoted to the strategist
+    current_date (str): YYYY-MM-DD (default: today)
+    prepare (callable): prepare(symbol, current_date) -> analysis packet text
+
+    Returns:
+    dict: symbol -> {status ("done", "failed" or "skipped"), annual_report,
+    recommendation, tokens, seconds, error}
+    """
+    for agent_type in LLM_AGENTS:
+        if agent_type not in pool.pools:
+            raise ValueError(f"The screening cascade needs a pooled {agent_type}")
+    budget = budget or LLMBudget(max_names=None)
+    current_date = current_date or datetime.now().strftime("%Y-%m-%d")
+    one_month_ago = (datetime.strptime(current_date, "%Y-%m-%d") - timedelta(days=30)).strftime("%Y-%m-%d")
+    results = {}
+    lock = threading.Lock()
+
+    def record(symbol, **result):
+        with lock:
+            results[symbol] = result
+
+    def safe_prepare(symbol):
+        try:
+            return prepare(symbol, current_date)
+        except Exception as e:
+            logger.warning(f"Could not prepare data for {symbol}: {e}")
+            return ""
+
+    def strategize(symbol, packet, analysis, tokens, started):
+        try:
+            row = scores.loc[symbol] if scores is not None and symbol in scores.index else None
+            factors = ", ".join(
+                f"{factor} {row[factor]:.2f}" for factor in FACTOR_METRICS if row is not None and factor in row and pd.notna(row[factor])
+            )
+            query = STRATEGY_QUERY.format(
+                current_date=current_date,
+                one_month_ago=one_month_ago,
+                packet=packet,
+                symbol=symbol,
+                score=row["composite"] if row is not None else float("nan"),
+                factors=factors or "no factor detail",
+                analysis=condense_analysis(analysis, HANDOFF_TOKEN_BUDGET),
+            )
+            recommendation, used = run_agent(pool, "trade_strategist", query)
+            budget.charge(used, release=True)
+            record(symbol, status="done", annual_report=analysis, recommendation=recommendation,
+                   tokens=tokens + used, seconds=time.time() - started)
+        except Exception as e:
+            budget.charge(0, release=True)
+            logger.error(f"Trade Strategist failed for {symbol}: {e}")
+            record(symbol, status="failed", annual_report=analysis, error=str(e), tokens=tokens, seconds=time.time() - started)
+
+    def analyze(symbol, packet_future, strategist_pool):
+        started = time.time()
+        if not budget.reserve():
+            record(symbol, status="skipped", error="LLM budget exhausted", tokens=0, seconds=0.0)
+            return None
+        packet = packet_future.result()
+        query = specialist_tasks(symbol, ["annual_report_analyzer"], current_date=current_date)[0][1]
+        try:
+            analysis, tokens = run_agent(pool, "annual_report_analyzer", query)
+        except Exception as e:
+            budget.charge(0, release=True)
+            logger.error(f"Annual Report Analyzer failed for {symbol}: {e}")
+            record(symbol, status="failed", error=str(e), tokens=0, seconds=time.time() - started)
+            return None
+        budget.charge(tokens)
+        return strategist_pool.submit(strategize, symbol, packet, analysis, tokens, started)
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=pool.sizes["trade_strategist"], thread_name_prefix="screen-strategy") as strategist_pool, \
+            ThreadPoolExecutor(max_workers=pool.sizes["annual_report_analyzer"], thread_name_prefix="screen-report") as analyst_pool, \
+            ThreadPoolExecutor(max_workers=prepare_workers, thread_name_prefix="screen-prepare") as prepare_pool:
+        # Executors start tasks in submission order, so names enter every stage in rank order
+        packets = [prepare_pool.submit(safe_prepare, symbol) for symbol in symbols]
+        analyses = [analyst_pool.submit(analyze, symbol, packet, strategist_pool) for symbol, packet in zip(symbols, packets)]
+        for future in analyses:
+            strategy = future.result()
+            if strategy is not None:
+                strategy.result()
+
+    done = sum(1 for result in results.values() if result["status"] == "done")
+    logger.info(f"LLM stage finished {done}/{len(symbols)} names in {time.time() - started:.1f}s, budget {budget.summary()}")
+    return {symbol: results[symbol] for symbol in symbols}
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Batched sentiment scoring for screening workloads.
+
+Two scorers share one interface, score(texts) -> float32 array in [-1, 1]:
+
+- LexiconSentiment: a financial word list (Loughran-McDonald style) with
+  negation handling. The whole batch is joined into one string and
+  tokenized in a single regex pass; word weights, negation windows and the
+  per-text sums (bincount) are then computed on flat arrays, so a week of
+  news for 500 tickers is scored in about a second instead of one call per text.
+- LLMSentiment: packs many headlines into one numbered prompt and parses a
+  JSON array of scores, with batches sent concurrently under a rate limit.
+  Texts the LLM could not score get lexicon scores for this call only.
+
+Both consult a per-text cache (in memory, plus SQLite when a path or
+FINROBOT_CACHE_DIR is set), so re-screening the same headlines is free.
+Only scores produced by the scorer itself are cached, never fallbacks.
+
+Usage:
+    scores = score_texts(headlines)                      # lexicon
+    scores = score_texts(headlines, method="llm", llm_config=llm_config)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from filing_mapreduce import RateLimiter, make_completion
+
+logger = logging.getLogger(__name__)
+
+LLM_BATCH_SIZE = 50
+LLM_WORKERS = 4
+LLM_REQUESTS_PER_MINUTE = 60
+# Characters of each text sent to the LLM; headlines and lead sentences carry the sentiment
+LLM_TEXT_CHARS = 300
+
+POSITIVE_WORDS = """
+beat beats exceeded exceeds outperform outperformed outperforms record strong stronger strongest
+growth grew grow grows gain gains gained rise rises rising rose surge surged surges rally rallied
+upgrade upgraded upgrades profit profitable profitability improve improved improves improvement
+robust boost boosted expand expanded expansion accelerate accelerated momentum bullish optimistic
+positive success successful innovative breakthrough raise raised raises dividend buyback
+rebound rebounded recover recovered recovery solid upbeat tops topped higher win wins won award
+""".split()
+
+NEGATIVE_WORDS = """
+miss missed misses weak weaker weakest decline declined declines declining fall falls fell drop
+dropped drops plunge plunged plunges slump slumped loss losses lose losing downgrade downgraded
+downgrades cut cuts cutting layoff layoffs lawsuit litigation investigation probe fraud recall
+bearish pessimistic negative warning warns warned concern concerns risk risks default bankruptcy
+impairment writedown shortfall slowdown slowing slower lower underperform underperformed
+volatile volatility uncertainty delay delayed halt halted fine fined penalty sued scandal
+""".split()
+
+NEGATIONS = frozenset(["not", "no", "never", "without", "didn't", "doesn't", "don't", "won't", "wasn't", "isn't", "fails", "failed"])
+NEGATION_WINDOW = 3
+
+_TOKEN_RE = re.compile(r"[a-z]+(?:'[a-z]+)?|\0")
+
+
+class SentimentCache:
+    """Per-text score cache keyed by scorer name and text hash."""
+
+    def __init__(self, path=None):
+        self._memory = {}
+        self._lock = threading.Lock()
+        if path is None and os.environ.get("FINROBOT_CACHE_DIR"):
+            path = os.path.join(os.environ["FINROBOT_CACHE_DIR"], "sentiment_cache.db")
+        self.path = path
+        self._local = threading.local()
+        if path:
+            self._db().execute("CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, score REAL NOT NULL)")
+
+    def _db(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key(scorer, text):
+        return hashlib.sha1(f"{scorer}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """Return {key: score} for the cached keys."""
+        with self._lock:
+            found = {key: self._memory[key] for key in keys if key in self._memory}
+        missing = [key for key in keys if key not in found]
+        if self.path and missing:
+            conn = self._db()
+            for start in range(0, len(missing), 500):
+                batch = missing[start:start + 500]
+                rows = conn.execute(f"SELECT key, score FROM scores WHERE key IN ({', '.join('?' * len(batch))})", batch)
+                found.update(rows)
+        return found
+
+    def put_many(self, items):
+        with self._lock:
+            self._memory.update(items)
+        if self.path and items:
+            conn = self._db()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO scores (key, score) VALUES (?, ?)", list(items.items()))
+
+
+class BatchScorer:
+    """Base class: cache lookup around a score_uncached(texts) implementation."""
+
+    name = "base"
+
+    def __init__(self, cache=None):
+        self.cache = cache if cache is not None else SentimentCache()
+
+    def score(self, texts):
+        """
+        Score texts in [-1, 1] (negative to positive).
+
+        Parameters:
+        texts (iterable): Strings (headlines, summaries, sentences)
+
+        Returns:
+        numpy.ndarray: float32 scores in input order
+        """
+        texts = ["" if text is None else str(text) for text in texts]
+        keys = [SentimentCache.key(self.name, text) for text in texts]
+        cached = self.cache.get_many(list(set(keys)))
+        scores = np.zeros(len(texts), dtype=np.float32)
+        todo = {}
+        for i, key in enumerate(keys):
+            if key in cached:
+                scores[i] = cached[key]
+            else:
+                todo.setdefault(key, []).append(i)
+        if todo:
+            unique_keys = list(todo)
+            new_scores, cacheable = self.score_uncached_masked([texts[todo[key][0]] for key in unique_keys])
+            for key, score in zip(unique_keys, new_scores):
+                scores[todo[key]] = score
+            self.cache.put_many({
+                key: float(score) for key, score, keep in zip(unique_keys, new_scores, cacheable) if keep
+            })
+        return scores
+
+    def score_uncached(self, texts):
+        raise NotImplementedError
+
+    def score_uncached_masked(self, texts):
+        """Scores plus a boolean mask of the ones that may be cached under this scorer's name."""
+        scores = self.score_uncached(texts)
+        return scores, np.ones(len(scores), dtype=bool)
+
+
+class LexiconSentiment(BatchScorer):
+    """Word-list scorer with negation; one tokenizing pass over the joined batch."""
+
+    name = "lexicon-v1"
+
+    def __init__(self, positive=POSITIVE_WORDS, negative=NEGATIVE_WORDS, cache=None):
+        super().__init__(cache)
+        self.weights = {word: 1.0 for word in positive}
+        self.weights.update({word: -1.0 for word in negative})
+
+    def score_uncached(self, texts):
+        if not texts:
+            return np.zeros(0, dtype=np.float32)
+        # Texts are joined with a NUL separator token so the batch is tokenized in one C-level pass
+        tokens = _TOKEN_RE.findall("\0".join(text.replace("\0", " ") for text in texts).lower())
+        count = len(tokens)
+        # Map tokens to ids of the batch vocabulary (id 0 is the separator), then look up per word
+        vocabulary = {"\0": 0}
+        ids = np.fromiter((vocabulary.setdefault(token, len(vocabulary)) for token in tokens), dtype=np.int64, count=count)
+        weights = np.array([self.weights.get(word, 0.0) for word in vocabulary])[ids]
+        negator = np.array([word in NEGATIONS for word in vocabulary])[ids]
+        owner = np.cumsum(ids == 0)
+
+        # A negator up to NEGATION_WINDOW tokens before a sentiment word (in the same text) flips its sign
+        negated = np.zeros(count, dtype=bool)
+        for shift in range(1, NEGATION_WINDOW + 1):
+            negated[shift:] |= negator[:-shift] & (owner[:-shift] == owner[shift:])
+        values = np.where(negated, -weights, weights)
+
+        positive = np.bincount(owner, weights=np.clip(values, 0, None), minlength=len(texts))
+        negative = np.bincount(owner, weights=np.clip(-values, 0, None), minlength=len(texts))
+        total = positive + negative
+        scores = np.divide(positive - negative, total + 1.0, out=np.zeros(len(texts)), where=total > 0)
+        return scores.astype(np.float32)
+
+
+class LLMSentiment(BatchScorer):
+    """Scores many texts per LLM request; batches run concurrently under a rate limit."""
+
+    def __init__(self, llm_config=None, complete=None, batch_size=LLM_BATCH_SIZE, workers=LLM_WORKERS,
+                 rate_per_minute=LLM_REQUESTS_PER_MINUTE, cache=None):
+        super().__init__(cache)
+        config_list = (llm_config or {}).get("config_list") or [{}]
+        self.name = f"llm-v1:{config_list[0].get('model', '')}"
+        self.complete = complete or make_completion(llm_config)
+        self.batch_size = batch_size
+        self.workers = workers
+        self.limiter = RateLimiter(rate_per_minute)
+        self.fallback = LexiconSentiment(cache=self.cache)
+
+    @staticmethod
+    def _prompt(texts):
+        lines = "\n".join(f"{i + 1}. {' '.join(text.split())[:LLM_TEXT_CHARS]}" for i, text in enumerate(texts))
+        return (
+            "Rate the sentiment of each numbered financial news item for the company's stock, from -1 (very negative) "
+            "to 1 (very positive), 0 if neutral. Reply with only a JSON array of "
+            f"{len(texts)} numbers in the same order.\n\n{lines}"
+        )
+
+    def _fallback(self, texts):
+        return self.fallback.score_uncached(texts), np.zeros(len(texts), dtype=bool)
+
+    def _score_batch(self, texts):
+        """(scores, mask of scores that came from the LLM) for one batch."""
+        self.limiter.wait()
+        try:
+            reply = self.complete([{"role": "user", "content": self._prompt(texts)}])
+        except Exception as e:
+            # The endpoint is failing: splitting would only multiply requests
+            logger.warning(f"LLM sentiment batch of {len(texts)} failed, using lexicon scores: {e}")
+            return self._fallback(texts)
+        match = re.search(r"\[[^\[\]]*\]", reply or "")
+        try:
+            values = json.loads(match.group(0)) if match else None
+            if isinstance(values, list) and len(values) == len(texts):
+                return np.clip(np.asarray(values, dtype=np.float32), -1, 1), np.ones(len(texts), dtype=bool)
+        except (ValueError, TypeError):
+            values = None
+        logger.warning(f"LLM returned {len(values) if isinstance(values, list) else 'no'} scores for {len(texts)} texts")
+        # Split a batch the model miscounted; single texts fall back to the lexicon
+        if len(texts) > 1:
+            middle = len(texts) // 2
+            (left, left_mask), (right, right_mask) = self._score_batch(texts[:middle]), self._score_batch(texts[middle:])
+            return np.concatenate([left, right]), np.concatenate([left_mask, right_mask])
+        return self._fallback(texts)
+
+    def score_uncached_masked(self, texts):
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        if not batches:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=bool)
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(batches))), thread_name_prefix="sentiment") as pool:
+            results = list(pool.map(self._score_batch, batches))
+        return np.concatenate([scores for scores, _ in results]), np.concatenate([mask for _, mask in results])
+
+    def score_uncached(self, texts):
+        return self.score_uncached_masked(texts)[0]
+
+
+_scorers = {}
+_scorers_lock = threading.Lock()
+
+
+def score_texts(texts, method="lexicon", llm_config=None):
+    """
+    Score an iterable of texts with a shared, cached scorer.
+
+    Parameters:
+    texts (iterable): Strings to score
+    method (str): "lexicon" or "llm"
+    llm_config (dict): Required for method="llm"
+
+    Returns:
+    numpy.ndarray: float32 scores in [-1, 1]
+    """
+    with _scorers_lock:
+        if method not in _scorers:
+            if method == "lexicon":
+                _scorers[method] = LexiconSentiment()
+            elif method == "llm":
+                _scorers[method] = LLMSentiment(llm_config)
+            else:
+                raise ValueError(f"Unknown sentiment method '{method}'")
+        scorer = _scorers[method]
+    return scorer.score(texts)
+
+
+class BatchSentimentAnalysis:
+    """SentimentAnalysis-style wrapper adding analyze_sentiment_batch()."""
+
+    def __init__(self, method="lexicon", llm_config=None):
+        self.scorer = LexiconSentiment() if method == "lexicon" else LLMSentiment(llm_config)
+
+    def analyze_sentiment(self, text):
+        score = float(self.scorer.score([text])[0])
+        label = "positive" if score > 0.1 else "negative" if score < -0.1 else "neutral"
+        return {"score": score, "label": label}
+
+    def analyze_sentiment_batch(self, texts):
+        return self.scorer.score(texts)
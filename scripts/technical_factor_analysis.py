@@ -0,0 +1,136 @@
+import pandas as pd
+
+from momentum_factor_analysis import download_dow_jones_data
+from technical_indicators import atr, bollinger_bands, macd, obv, rsi, sma
+
+# Function to extract one price field as a (dates x tickers) DataFrame
+def extract_field(data, field):
+    if isinstance(data.columns, pd.MultiIndex):
+        # MultiIndex format (e.g., from yf.download with multiple tickers)
+        if field in data.columns.get_level_values(0):
+            return data[field].astype(float)
+        return None
+
+    # Single-level columns (e.g., from CSV) named like "AAPL_Close"
+    columns = [col for col in data.columns if col.endswith(f"_{field}")]
+    if not columns:
+        return None
+    return pd.DataFrame({col[:-len(field) - 1]: data[col] for col in columns}, index=data.index).astype(float)
+
+# Function to calculate technical factors for all tickers at once
+def calculate_technical_factors(data=None):
+    if data is None:
+        # Try to load from CSV, if not available, download
+        try:
+            data = pd.read_csv('dow_jones_30_data.csv', header=[0, 1], index_col=0, parse_dates=True)
+            print("Data loaded from CSV file")
+        except (FileNotFoundError, ValueError):
+            print("CSV file not found, downloading data...")
+            data = download_dow_jones_data()
+
+    close = extract_field(data, 'Adj Close')
+    if close is None:
+        close = extract_field(data, 'Close')
+    high = extract_field(data, 'High')
+    low = extract_field(data, 'Low')
+    volume = extract_field(data, 'Volume')
+
+    # Every indicator is computed for the whole (dates x tickers) matrix in one call
+    rsi_14 = rsi(close, 14)
+    macd_values = macd(close)
+    bands = bollinger_bands(close)
+    sma_50 = sma(close, 50)
+
+    last_close = close.ffill().iloc[-1]
+    technical_df = pd.DataFrame({
+        'Current Price': last_close,
+        'RSI (14)': rsi_14.iloc[-1],
+        'MACD Histogram (% of Price)': macd_values['hist'].iloc[-1] / last_close * 100,
+        'Bollinger %B': bands['pct_b'].iloc[-1],
+        'Price/50-Day MA': last_close / sma_50.iloc[-1],
+    })
+
+    if high is not None and low is not None:
+        technical_df['ATR (% of Price)'] = atr(high, low, close).iloc[-1] / last_close * 100
+    if volume is not None and len(close) > 20:
+        # 20-day change in On-Balance Volume relative to average daily volume
+        obv_values = obv(close, volume)
+        technical_df['OBV Trend'] = (obv_values.iloc[-1] - obv_values.iloc[-21]) / volume.tail(20).mean() / 20
+
+    # Save to CSV
+    technical_df.to_csv('dow_jones_technical_metrics.csv')
+    print(f"Technical metrics for {len(technical_df)} stocks saved to dow_jones_technical_metrics.csv")
+
+    return technical_df
+
+# Function to rank stocks based on technical factors
+def rank_technical_stocks(technical_df=None):
+    if technical_df is None:
+        try:
+            technical_df = pd.read_csv('dow_jones_technical_metrics.csv', index_col=0)
+            print("Technical metrics loaded from CSV file")
+        except FileNotFoundError:
+            print("Technical metrics CSV file not found, calculating metrics...")
+            technical_df = calculate_technical_factors()
+
+    # Create a copy to avoid modifying the original
+    df = technical_df.copy()
+
+    rankings = {}
+
+    # RSI closest to neutral (50) is best: rewards names that are neither overbought nor oversold
+    rankings['RSI Rank'] = (df['RSI (14)'] - 50).abs().rank()
+
+    # Positive MACD histogram, price above the 50-day MA and rising OBV are better
+    rankings['MACD Rank'] = df['MACD Histogram (% of Price)'].rank(ascending=False)
+    rankings['Price/50-Day MA Rank'] = df['Price/50-Day MA'].rank(ascending=False)
+    if 'OBV Trend' in df.columns:
+        rankings['OBV Rank'] = df['OBV Trend'].rank(ascending=False)
+
+    # %B in the middle of the bands is better than at the extremes
+    rankings['Bollinger Rank'] = (df['Bollinger %B'] - 0.5).abs().rank()
+
+    # Lower volatility (ATR relative to price) is better
+    if 'ATR (% of Price)' in df.columns:
+        rankings['ATR Rank'] = df['ATR (% of Price)'].rank()
+
+    # Combine rankings
+    for rank_col, rank_series in rankings.items():
+        df[rank_col] = rank_series
+
+    # Calculate composite technical score (average of all ranks)
+    df['Composite Technical Rank'] = df[list(rankings)].mean(axis=1)
+
+    # Sort by composite rank
+    df_sorted = df.sort_values('Composite Technical Rank')
+
+    # Save to CSV
+    df_sorted.to_csv('dow_jones_technical_rankings.csv')
+    print(f"Technical rankings saved to dow_jones_technical_rankings.csv")
+
+    return df_sorted
+
+# Main execution
+if __name__ == "__main__":
+    print("Starting Technical Factor Analysis for Dow Jones 30 stocks...")
+
+    # Download data
+    data = download_dow_jones_data()
+
+    # Calculate technical metrics
+    technical_df = calculate_technical_factors(data)
+
+    # Rank stocks
+    ranked_stocks = rank_technical_stocks(technical_df)
+
+    columns = ['Current Price', 'RSI (14)', 'MACD Histogram (% of Price)', 'Bollinger %B', 'Composite Technical Rank']
+
+    # Print top 5 technical stocks
+    print("\nTop 5 Technical Stocks:")
+    print(ranked_stocks.head(5)[columns])
+
+    # Print bottom 5 technical stocks
+    print("\nBottom 5 Technical Stocks:")
+    print(ranked_stocks.tail(5)[columns])
+
+    print("\nTechnical Factor Analysis Complete!")
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Vectorized technical indicators for whole (dates x tickers) price matrices.
+
+Every function accepts a DataFrame with one column per ticker (or a single
+Series) and computes the indicator for all columns at once. Rolling
+indicators use pandas' rolling windows; EMA-type indicators (EMA, Wilder
+RSI, MACD, ATR) use a NumPy recursion that steps through the dates once and
+updates every ticker in the same vector operation.
+
+The same functions serve the agents' tools (indicator_frame for one symbol's
+OHLCV data), the analysis packet and the cross-sectional technical factor
+in technical_factor_analysis.py.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _as_frame(data):
+    """Return (DataFrame, was_series) so Series inputs come back as Series."""
+    if isinstance(data, pd.Series):
+        return data.to_frame(), True
+    return data, False
+
+
+def _restore(values, like, was_series):
+    frame = pd.DataFrame(values, index=like.index, columns=like.columns)
+    return frame.iloc[:, 0].rename(like.columns[0]) if was_series else frame
+
+
+def ema_recursion(values, alpha):
+    """
+    Exponential smoothing of a 2-D array along axis 0.
+
+    Each column is seeded with its first valid value and then updated as
+    s[t] = alpha * x[t] + (1 - alpha) * s[t-1], which matches pandas'
+    ewm(alpha=alpha, adjust=False). Missing inputs leave the state untouched
+    and produce NaN at that position.
+
+    Parameters:
+    values (ndarray): Array of shape (dates, tickers)
+    alpha (float): Smoothing factor in (0, 1]
+
+    Returns:
+    ndarray: Smoothed array of the same shape
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        return ema_recursion(values[:, None], alpha)[:, 0]
+
+    missing = np.isnan(values)
+    out = np.empty(values.shape)
+    decay = 1.0 - alpha
+
+    # Fast path: columns only have leading gaps (listing dates, diff()), so
+    # the update is two in-place vector operations per date
+    first_valid = np.where(missing.all(axis=0), values.shape[0], missing.argmin(axis=0))
+    if not np.any(missing & (np.arange(values.shape[0])[:, None] > first_valid)):
+        state = np.full(values.shape[1], np.nan)
+        scaled = alpha * values
+        seeds = {}
+        for column, t in enumerate(first_valid):
+            seeds.setdefault(t, []).append(column)
+        for t in range(values.shape[0]):
+            state *= decay
+            state += scaled[t]
+            if t in seeds:
+                state[seeds[t]] = values[t, seeds[t]]
+            out[t] = state
+        return out
+
+    state = np.full(values.shape[1], np.nan)
+    for t in range(values.shape[0]):
+        row = values[t]
+        valid = ~missing[t]
+        updated = np.where(np.isnan(state), row, alpha * row + decay * state)
+        state = np.where(valid, updated, state)
+        out[t] = np.where(valid, state, np.nan)
+    return out
+
+
+def sma(prices, window):
+    """Simple moving average over window periods."""
+    return prices.rolling(window, min_periods=window).mean()
+
+
+def ema(prices, span):
+    """Exponential moving average with pandas' span convention (alpha = 2 / (span + 1))."""
+    frame, was_series = _as_frame(prices)
+    return _restore(ema_recursion(frame.to_numpy(dtype=np.float64), 2.0 / (span + 1)), frame, was_series)
+
+
+def wilder_smooth(values, period):
+    """Wilder's smoothing (an EMA with alpha = 1 / period)."""
+    frame, was_series = _as_frame(values)
+    return _restore(ema_recursion(frame.to_numpy(dtype=np.float64), 1.0 / period), frame, was_series)
+
+
+def rsi(prices, period=14):
+    """
+    Wilder's Relative Strength Index.
+
+    Returns 100 where there were no losses over the smoothing window, and
+    NaN where there were neither gains nor losses (a flat, e.g. halted,
+    price is not overbought).
+    """
+    frame, was_series = _as_frame(prices)
+    values = frame.to_numpy(dtype=np.float64)
+    delta = np.diff(values, axis=0, prepend=np.nan)
+    gains = ema_recursion(np.where(np.isnan(delta), np.nan, np.clip(delta, 0, None)), 1.0 / period)
+    losses = ema_recursion(np.where(np.isnan(delta), np.nan, np.clip(-delta, 0, None)), 1.0 / period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = 100.0 - 100.0 / (1.0 + gains / losses)
+    result = np.where((losses == 0) & (gains > 0), 100.0, result)
+    result = np.where((losses == 0) & (gains == 0), np.nan, result)
+    return _restore(result, frame, was_series)
+
+
+def macd(prices, fast=12, slow=26, signal=9):
+    """
+    Moving Average Convergence Divergence.
+
+    Returns:
+    dict: "macd", "signal" and "hist" with the shape of prices
+    """
+    macd_line = ema(prices, fast) - ema(prices, slow)
+    signal_line = ema(macd_line, signal)
+    return {"macd": macd_line, "signal": signal_line, "hist": macd_line - signal_line}
+
+
+def bollinger_bands(prices, window=20, num_std=2.0):
+    """
+    Bollinger Bands around a simple moving average.
+
+    Returns:
+    dict: "upper", "mid", "lower" and "pct_b" (position of price within the bands)
+    """
+    mid = sma(prices, window)
+    std = prices.rolling(window, min_periods=window).std()
+    upper = mid + num_std * std
+    lower = mid - num_std * std
+    width = (upper - lower).replace(0, np.nan)
+    return {"upper": upper, "mid": mid, "lower": lower, "pct_b": (prices - lower) / width}
+
+
+def true_range(high, low, close):
+    """True range: the largest of high-low, |high - previous close| and |low - previous close|."""
+    previous_close = close.shift(1)
+    ranges = [
+        (high - low).to_numpy(dtype=np.float64),
+        (high - previous_close).abs().to_numpy(dtype=np.float64),
+        (low - previous_close).abs().to_numpy(dtype=np.float64),
+    ]
+    with np.errstate(invalid="ignore"):
+        values = np.fmax(np.fmax(ranges[0], ranges[1]), ranges[2])
+    if isinstance(close, pd.Series):
+        return pd.Series(values, index=close.index, name=close.name)
+    return pd.DataFrame(values, index=close.index, columns=close.columns)
+
+
+def atr(high, low, close, period=14):
+    """Average True Range with Wilder's smoothing."""
+    return wilder_smooth(true_range(high, low, close), period)
+
+
+def obv(close, volume):
+    """On-Balance Volume: cumulative volume signed by the direction of the close."""
+    direction = np.sign(close.diff()).fillna(0)
+    return (direction * volume.fillna(0)).cumsum()
+
+
+def indicator_frame(stock_data):
+    """
+    All indicators for one symbol's OHLCV DataFrame, as used by the agent tools.
+
+    Parameters:
+    stock_data (DataFrame): Frame with Close and optionally High, Low, Volume
+
+    Returns:
+    DataFrame: Close plus SMA/EMA/RSI/MACD/Bollinger (and ATR/OBV when the
+    inputs are available), indexed like stock_data
+    """
+    close = stock_data["Close"].astype(float)
+    indicators = pd.DataFrame(index=stock_data.index)
+    indicators["Close"] = close
+    indicators["SMA_20"] = sma(close, 20)
+    indicators["SMA_50"] = sma(close, 50)
+    indicators["EMA_12"] = ema(close, 12)
+    indicators["EMA_26"] = ema(close, 26)
+    indicators["RSI_14"] = rsi(close, 14)
+
+    macd_values = macd(close)
+    indicators["MACD"] = macd_values["macd"]
+    indicators["MACD_Signal"] = macd_values["signal"]
+    indicators["MACD_Hist"] = macd_values["hist"]
+
+    bands = bollinger_bands(close)
+    indicators["BB_Upper"] = bands["upper"]
+    indicators["BB_Middle"] = bands["mid"]
+    indicators["BB_Lower"] = bands["lower"]
+
+    if "High" in stock_data and "Low" in stock_data:
+        indicators["ATR_14"] = atr(stock_data["High"].astype(float), stock_data["Low"].astype(float), close)
+    if "Volume" in stock_data:
+        indicators["OBV"] = obv(close, stock_data["Volume"].astype(float))
+    return indicators
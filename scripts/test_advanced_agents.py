@@ -49,7 +49,8 @@ def test_rag_agent(stock_symbol):
             # Setup LLM config using autogen's config_list_from_json
             llm_config = {
                 "config_list": autogen.config_list_from_json(
-                    "FinRobot/OAI_CONFIG_LIST",
+                    "OAI_CONFIG_LIST",
+                    file_location="FinRobot",
                     filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
                 ),
                 "timeout": 120,
@@ -105,7 +106,8 @@ def test_trade_strategist(stock_symbol):
             # Setup LLM config using autogen's config_list_from_json
             llm_config = {
                 "config_list": autogen.config_list_from_json(
-                    "FinRobot/OAI_CONFIG_LIST",
+                    "OAI_CONFIG_LIST",
+                    file_location="FinRobot",
                     filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
                 ),
                 "timeout": 120,
@@ -161,7 +163,8 @@ def test_annual_report_analyzer(stock_symbol):
             # Setup LLM config using autogen's config_list_from_json
             llm_config = {
                 "config_list": autogen.config_list_from_json(
-                    "FinRobot/OAI_CONFIG_LIST",
+                    "OAI_CONFIG_LIST",
+                    file_location="FinRobot",
                     filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
                 ),
                 "timeout": 120,
@@ -217,7 +220,8 @@ def test_fingpt_forecaster(stock_symbol):
             # Setup LLM config using autogen's config_list_from_json
             llm_config = {
                 "config_list": autogen.config_list_from_json(
-                    "FinRobot/OAI_CONFIG_LIST",
+                    "OAI_CONFIG_LIST",
+                    file_location="FinRobot",
                     filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
                 ),
                 "timeout": 120,
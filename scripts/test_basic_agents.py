@@ -40,7 +40,8 @@ def test_single_assistant():
         # Setup LLM config using autogen's config_list_from_json
         llm_config = {
             "config_list": autogen.config_list_from_json(
-                "FinRobot/OAI_CONFIG_LIST",
+                "OAI_CONFIG_LIST",
+                file_location="FinRobot",
                 filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
             ),
             "timeout": 120,
@@ -77,7 +78,8 @@ def test_group_chat(stock_symbol):
         # Setup LLM config using autogen's config_list_from_json
         llm_config = {
             "config_list": autogen.config_list_from_json(
-                "FinRobot/OAI_CONFIG_LIST",
+                "OAI_CONFIG_LIST",
+                file_location="FinRobot",
                 filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
             ),
             "timeout": 120,
@@ -142,7 +144,8 @@ def test_stock_analysis(stock_symbol):
         # Setup LLM config using autogen's config_list_from_json
         llm_config = {
             "config_list": autogen.config_list_from_json(
-                "FinRobot/OAI_CONFIG_LIST",
+                "OAI_CONFIG_LIST",
+                file_location="FinRobot",
                 filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
             ),
             "timeout": 120,
@@ -5,7 +5,8 @@ from finrobot.agents.workflow import SingleAssistant
 # Read OpenAI API keys from a JSON file
 llm_config = {
     "config_list": autogen.config_list_from_json(
-        "FinRobot/OAI_CONFIG_LIST",
+        "OAI_CONFIG_LIST",
+        file_location="FinRobot",
         filter_dict={"model": ["gpt-4o"]},
     ),
     "timeout": 120,
@@ -65,6 +65,81 @@ def test_technical_analysis():
         logger.error(f"Error in technical analysis test: {e}")
         return False
 
+def test_vectorized_indicators():
+    """Test the multi-symbol indicator library against per-symbol pandas results."""
+    logger.info("Testing vectorized technical indicators...")
+    
+    try:
+        import numpy as np
+        from technical_indicators import ema, rsi, macd, bollinger_bands, atr, obv
+        
+        # Create sample data: 250 days x 50 tickers of random-walk prices
+        dates = pd.date_range(start='2023-01-01', periods=250)
+        rng = np.random.default_rng(0)
+        close = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0, 0.01, (250, 50)), axis=0)), index=dates)
+        volume = pd.DataFrame(rng.integers(100000, 1000000, (250, 50)), index=dates).astype(float)
+        
+        # The EMA recursion must match pandas for every column
+        expected = close.ewm(span=12, adjust=False).mean()
+        if not np.allclose(ema(close, 12), expected):
+            logger.error("Vectorized EMA does not match pandas ewm")
+            return False
+        
+        rsi_values = rsi(close)
+        macd_values = macd(close)
+        bands = bollinger_bands(close)
+        atr_values = atr(close * 1.01, close * 0.99, close)
+        obv_values = obv(close, volume)
+        logger.info(f"Mean RSI: {rsi_values.iloc[-1].mean():.2f}")
+        logger.info(f"Mean MACD histogram: {macd_values['hist'].iloc[-1].mean():.2f}")
+        logger.info(f"Mean Bollinger %B: {bands['pct_b'].iloc[-1].mean():.2f}")
+        logger.info(f"Mean ATR: {atr_values.iloc[-1].mean():.2f}")
+        logger.info(f"Mean OBV: {obv_values.iloc[-1].mean():.2f}")
+        
+        logger.info("Vectorized indicators test completed successfully")
+        return True
+    except Exception as e:
+        logger.error(f"Error in vectorized indicators test: {e}")
+        return False
+
+def test_historical_indicators():
+    """Test that an old window is not answered from newer stored indicator state."""
+    logger.info("Testing incremental indicators on a historical window...")
+    
+    try:
+        import tempfile
+        import numpy as np
+        from incremental_indicators import IndicatorStateStore, SymbolIndicators, update_indicators
+        
+        dates = pd.bdate_range("2023-01-02", "2024-02-23")
+        closes = 100 + np.cumsum(np.random.default_rng(0).normal(0, 1, len(dates)))
+        stock_data = pd.DataFrame({"Close": closes, "High": closes + 1, "Low": closes - 1}, index=dates)
+        store = IndicatorStateStore(tempfile.mkdtemp())
+        
+        # Store state up to 2024-02-23, then ask for a window ending 2023-05-19
+        update_indicators("TEST", stock_data, store=store)
+        old_window = stock_data[:"2023-05-19"]
+        indicators = update_indicators("TEST", old_window, store=store)
+        logger.info(f"Historical window answered as of {indicators.last_timestamp[:10]}")
+        
+        if indicators.last_timestamp[:10] != "2023-05-19":
+            logger.error(f"Indicators for a window ending 2023-05-19 are as of {indicators.last_timestamp[:10]}")
+            return False
+        expected = SymbolIndicators()
+        expected.update_frame(old_window)
+        if any(abs(indicators.values()[name] - value) > 1e-9 for name, value in expected.values().items()):
+            logger.error("Historical indicators do not match a fresh computation over the window")
+            return False
+        if store.load("TEST").last_timestamp[:10] != "2024-02-23":
+            logger.error("The stored state was overwritten by the historical window")
+            return False
+        
+        logger.info("Historical indicators test completed successfully")
+        return True
+    except Exception as e:
+        logger.error(f"Error in historical indicators test: {e}")
+        return False
+
 def test_fundamental_analysis():
     """Test the fundamental analysis functionality if available."""
     logger.info("Testing fundamental analysis functionality...")
@@ -126,6 +201,76 @@ def test_sentiment_analysis():
         logger.error(f"Error in sentiment analysis test: {e}")
         return False
 
+def test_batch_sentiment():
+    """Test batched lexicon sentiment scoring against one-at-a-time scoring."""
+    logger.info("Testing batched sentiment scoring...")
+    
+    try:
+        import time
+        import numpy as np
+        from sentiment_batch import LexiconSentiment, SentimentCache
+        
+        headlines = [
+            "The company reported strong earnings, beating analyst expectations.",
+            "Shares fell after the company did not beat revenue estimates.",
+            "The board will meet on Tuesday.",
+        ] * 2000
+        scorer = LexiconSentiment(cache=SentimentCache(path=""))
+        
+        started = time.time()
+        scores = scorer.score_uncached(headlines)
+        logger.info(f"Scored {len(headlines)} texts in {time.time() - started:.3f}s: {scores[:3]}")
+        
+        # The batch must agree with scoring each text on its own
+        single = np.array([scorer.score_uncached([text])[0] for text in headlines[:3]])
+        if not np.allclose(scores[:3], single) or not (scores[0] > 0 > scores[1]) or scores[2] != 0:
+            logger.error("Batched sentiment scores are inconsistent")
+            return False
+        
+        logger.info("Batched sentiment test completed successfully")
+        return True
+    except Exception as e:
+        logger.error(f"Error in batched sentiment test: {e}")
+        return False
+
+def test_history_window():
+    """Test that history pruning never sends a tool response without its tool call."""
+    logger.info("Testing conversation history pruning...")
+    
+    try:
+        from history_policy import HistoryPolicy
+        
+        # A one-message task, 20 small tool turns, then one tool response far over the window budget
+        messages = [{"role": "user", "content": "Develop a trading strategy for AAPL"}]
+        for i in range(21):
+            messages.append({
+                "role": "assistant", "content": None,
+                "tool_calls": [{"id": f"call_{i}", "type": "function", "function": {"name": "get_stock_data", "arguments": "{}"}}],
+            })
+            rows = 1000 if i == 20 else 1
+            messages.append({"role": "tool", "tool_call_id": f"call_{i}", "content": "2024-01-02 185.20 186.10 183.90 185.64 52455980\n" * rows})
+        
+        pruned = HistoryPolicy().apply(messages)
+        logger.info(f"Pruned {len(messages)} messages to roles {[m['role'] for m in pruned]}")
+        
+        # Every tool response must follow an assistant message that requested it (OpenAI rejects it otherwise)
+        requested = set()
+        for message in pruned:
+            for call in message.get("tool_calls") or []:
+                requested.add(call["id"])
+            if message["role"] == "tool" and message["tool_call_id"] not in requested:
+                logger.error(f"Tool response {message['tool_call_id']} was sent without its tool call")
+                return False
+        if len(pruned) >= len(messages):
+            logger.error("History was not pruned")
+            return False
+        
+        logger.info("History pruning test completed successfully")
+        return True
+    except Exception as e:
+        logger.error(f"Error in history pruning test: {e}")
+        return False
+
 def test_portfolio_optimization():
     """Test the portfolio optimization functionality if available."""
     logger.info("Testing portfolio optimization functionality...")
@@ -181,8 +326,12 @@ def main():
     # Run tests
     tests = [
         ("Technical Analysis", test_technical_analysis),
+        ("Vectorized Indicators", test_vectorized_indicators),
+        ("Historical Indicators", test_historical_indicators),
         ("Fundamental Analysis", test_fundamental_analysis),
         ("Sentiment Analysis", test_sentiment_analysis),
+        ("Batched Sentiment", test_batch_sentiment),
+        ("History Pruning", test_history_window),
         ("Portfolio Optimization", test_portfolio_optimization)
     ]
     
@@ -50,6 +50,9 @@ except ImportError as e:
         logger.error(f"Failed to import modules: {e2}")
         sys.exit(1)
 
+from analysis_packet import packet_prompt
+from tool_registry import build_rag_tools
+
 def get_user_input():
     """Get user input for stock symbol and other parameters"""
     print("\n=== User Input Required ===")
@@ -70,7 +73,8 @@ def test_rag_agent(stock_symbol, current_date):
     oai_config_path = os.path.join(os.path.join(current_dir, "FinRobot"), "OAI_CONFIG_LIST")
     llm_config = {
         "config_list": autogen.config_list_from_json(
-            oai_config_path,
+            "OAI_CONFIG_LIST",
+            file_location=os.path.dirname(oai_config_path),
             filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
         ),
         "timeout": 120,
@@ -84,6 +88,11 @@ def test_rag_agent(stock_symbol, current_date):
         human_input_mode="TERMINATE"
     )
     
+    # Let the agent search the local document index before fetching anything
+    rag_tools = build_rag_tools()
+    rag_tools.register_with_agents(getattr(rag_agent, "assistant", rag_agent), rag_agent.user_proxy)
+    logger.info(f"Registered tools: {', '.join(rag_tools.names)}")
+    
     # Get date ranges for analysis
     one_month_ago = (datetime.strptime(current_date, "%Y-%m-%d") - timedelta(days=30)).strftime("%Y-%m-%d")
     
@@ -111,7 +120,8 @@ def test_trade_strategist(stock_symbol, current_date):
     oai_config_path = os.path.join(os.path.join(current_dir, "FinRobot"), "OAI_CONFIG_LIST")
     llm_config = {
         "config_list": autogen.config_list_from_json(
-            oai_config_path,
+            "OAI_CONFIG_LIST",
+            file_location=os.path.dirname(oai_config_path),
             filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
         ),
         "timeout": 120,
@@ -127,6 +137,10 @@ def test_trade_strategist(stock_symbol, current_date):
     
     # Get date ranges for analysis
     one_month_ago = (datetime.strptime(current_date, "%Y-%m-%d") - timedelta(days=30)).strftime("%Y-%m-%d")
+    one_year_ago = (datetime.strptime(current_date, "%Y-%m-%d") - timedelta(days=365)).strftime("%Y-%m-%d")
+    
+    # Precompute prices, indicators and fundamentals so the agent can answer in one turn
+    analysis_packet = packet_prompt(stock_symbol, one_year_ago, current_date)
     
     # Test a trading strategy query
     query = f"""
@@ -135,6 +149,7 @@ def test_trade_strategist(stock_symbol, current_date):
     - Start date for historical data: {one_month_ago}
     - End date for historical data: {current_date}
     
+    {analysis_packet}
     Develop a trading strategy for {stock_symbol} based on recent market trends and technical indicators.
     Make sure to use the most recent data available and explicitly mention the dates you're using in your analysis.
     """
@@ -152,7 +167,8 @@ def test_annual_report_analyzer(stock_symbol, current_date):
     oai_config_path = os.path.join(os.path.join(current_dir, "FinRobot"), "OAI_CONFIG_LIST")
     llm_config = {
         "config_list": autogen.config_list_from_json(
-            oai_config_path,
+            "OAI_CONFIG_LIST",
+            file_location=os.path.dirname(oai_config_path),
             filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
         ),
         "timeout": 120,
@@ -193,7 +209,8 @@ def test_fingpt_forecaster(stock_symbol, current_date):
     oai_config_path = os.path.join(os.path.join(current_dir, "FinRobot"), "OAI_CONFIG_LIST")
     llm_config = {
         "config_list": autogen.config_list_from_json(
-            oai_config_path,
+            "OAI_CONFIG_LIST",
+            file_location=os.path.dirname(oai_config_path),
             filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
         ),
         "timeout": 120,
@@ -209,6 +226,10 @@ def test_fingpt_forecaster(stock_symbol, current_date):
     
     # Get date ranges for analysis
     one_month_ago = (datetime.strptime(current_date, "%Y-%m-%d") - timedelta(days=30)).strftime("%Y-%m-%d")
+    one_year_ago = (datetime.strptime(current_date, "%Y-%m-%d") - timedelta(days=365)).strftime("%Y-%m-%d")
+    
+    # Precompute prices, indicators and fundamentals so the agent can answer in one turn
+    analysis_packet = packet_prompt(stock_symbol, one_year_ago, current_date)
     
     # Test a forecasting query
     query = f"""
@@ -217,6 +238,7 @@ def test_fingpt_forecaster(stock_symbol, current_date):
     - Start date for historical data: {one_month_ago}
     - End date for historical data: {current_date}
     
+    {analysis_packet}
     Forecast the stock price movement for {stock_symbol} over the next week based on historical data and market sentiment.
     Make sure to use the most recent data available and explicitly mention the dates you're using in your analysis.
     """
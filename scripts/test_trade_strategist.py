@@ -44,6 +44,9 @@ except ImportError as e:
         logger.error(f"Failed to import modules: {e2}")
         sys.exit(1)
 
+from tool_registry import build_trade_tools
+from token_stream import install_streaming, stream_to_file
+
 def get_user_input():
     """Get user input for stock symbol and other parameters"""
     stock_symbol = input("Enter stock symbol (e.g., AAPL): ").strip() or "AAPL"
@@ -76,9 +79,9 @@ def test_basic_strategy(trade_strategist, stock_symbol, current_date, time_perio
     Focus on SMA, EMA, and RSI indicators.
     
     IMPORTANT INSTRUCTIONS:
-    1. DO NOT try to execute code directly. Instead, ASK the User_Proxy to execute functions for you.
-    2. First, ask User_Proxy to fetch stock data: "Could you please fetch the stock data using get_stock_data('{stock_symbol}', '{start_date}', '{current_date}')"
-    3. Then, ask User_Proxy to calculate indicators: "Could you please calculate the technical indicators using calculate_technical_indicators(stock_data)"
+    1. DO NOT try to execute code directly. Use the provided tools instead.
+    2. In a single turn, call get_stock_data and calculate_technical_indicators for '{stock_symbol}' from '{start_date}' to '{current_date}'
+    3. Only call get_company_profile if you need company fundamentals
     4. Include the ACTUAL VALUES of indicators in your analysis (e.g., "Current RSI is 65.3")
     5. Cite specific price levels and dates in your analysis
     6. Make specific recommendations based on the actual data values
@@ -89,12 +92,13 @@ def test_basic_strategy(trade_strategist, stock_symbol, current_date, time_perio
     """
     
     try:
-        # Get response from the agent
-        response = trade_strategist.chat(query)
+        # Stream the reply into the results file while it is generated
+        filename = f"{stock_symbol}_basic_strategy_{current_date.replace('-', '')}.txt"
+        with stream_to_file(filename):
+            response = trade_strategist.chat(query)
         logger.info(f"Basic strategy response: {response[:100]}...")
         
-        # Save the response to a file
-        filename = f"{stock_symbol}_basic_strategy_{current_date.replace('-', '')}.txt"
+        # Save the final response to the file
         with open(filename, "w") as f:
             f.write(response)
         logger.info(f"Response saved to {filename}")
@@ -122,9 +126,9 @@ def test_advanced_strategy(trade_strategist, stock_symbol, current_date, time_pe
     Include analysis of MACD, RSI, Bollinger Bands, and moving averages.
     
     IMPORTANT INSTRUCTIONS:
-    1. DO NOT try to execute code directly. Instead, ASK the User_Proxy to execute functions for you.
-    2. First, ask User_Proxy to fetch stock data: "Could you please fetch the stock data using get_stock_data('{stock_symbol}', '{start_date}', '{current_date}')"
-    3. Then, ask User_Proxy to calculate indicators: "Could you please calculate the technical indicators using calculate_technical_indicators(stock_data)"
+    1. DO NOT try to execute code directly. Use the provided tools instead.
+    2. In a single turn, call get_stock_data and calculate_technical_indicators for '{stock_symbol}' from '{start_date}' to '{current_date}'
+    3. Only call get_company_profile if you need company fundamentals
     4. Include the ACTUAL VALUES of indicators in your analysis (e.g., "Current MACD is -0.42")
     5. Cite specific price levels and performance metrics in your comparison
     6. Make specific recommendations based on the actual data values
@@ -137,12 +141,13 @@ def test_advanced_strategy(trade_strategist, stock_symbol, current_date, time_pe
     """
     
     try:
-        # Get response from the agent
-        response = trade_strategist.chat(query)
+        # Stream the reply into the results file while it is generated
+        filename = f"{stock_symbol}_advanced_strategy_{current_date.replace('-', '')}.txt"
+        with stream_to_file(filename):
+            response = trade_strategist.chat(query)
         logger.info(f"Advanced strategy response: {response[:100]}...")
         
-        # Save the response to a file
-        filename = f"{stock_symbol}_advanced_strategy_{current_date.replace('-', '')}.txt"
+        # Save the final response to the file
         with open(filename, "w") as f:
             f.write(response)
         logger.info(f"Response saved to {filename}")
@@ -184,11 +189,10 @@ def test_comparative_analysis(trade_strategist, stock_symbol, current_date, time
     Compare trading strategies for {stock_symbol} and {competitor} based on their recent performance and technical indicators.
     
     IMPORTANT INSTRUCTIONS:
-    1. DO NOT try to execute code directly. Instead, ASK the User_Proxy to execute functions for you.
-    2. First, ask User_Proxy to fetch stock data for both companies:
-       - "Could you please fetch the stock data using get_stock_data('{stock_symbol}', '{start_date}', '{current_date}')"
-       - "Could you please fetch the stock data using get_stock_data('{competitor}', '{start_date}', '{current_date}')"
-    3. Then, ask User_Proxy to calculate indicators for both companies
+    1. DO NOT try to execute code directly. Use the provided tools instead.
+    2. In a single turn, call get_stock_data and calculate_technical_indicators for both
+       '{stock_symbol}' and '{competitor}' from '{start_date}' to '{current_date}'
+    3. Use the returned values for both companies
     4. Compare the performance and technical indicators of both stocks
     5. Recommend which stock has better trading potential in the short and long term
     
@@ -198,12 +202,13 @@ def test_comparative_analysis(trade_strategist, stock_symbol, current_date, time
     """
     
     try:
-        # Get response from the agent
-        response = trade_strategist.chat(query)
+        # Stream the reply into the results file while it is generated
+        filename = f"{stock_symbol}_vs_{competitor}_analysis_{current_date.replace('-', '')}.txt"
+        with stream_to_file(filename):
+            response = trade_strategist.chat(query)
         logger.info(f"Comparative analysis response: {response[:100]}...")
         
-        # Save the response to a file
-        filename = f"{stock_symbol}_vs_{competitor}_analysis_{current_date.replace('-', '')}.txt"
+        # Save the final response to the file
         with open(filename, "w") as f:
             f.write(response)
         logger.info(f"Response saved to {filename}")
@@ -234,13 +239,17 @@ def main():
     oai_config_path = os.path.join(os.path.join(current_dir, "FinRobot"), "OAI_CONFIG_LIST")
     llm_config = {
         "config_list": autogen.config_list_from_json(
-            oai_config_path,
+            "OAI_CONFIG_LIST",
+            file_location=os.path.dirname(oai_config_path),
             filter_dict={"model": ["gpt-4o", "gpt-3.5-turbo"]}
         ),
         "timeout": 120,
         "temperature": 0,
     }
     
+    # Stream tokens to the console and the results files as they arrive (must precede agent creation)
+    install_streaming()
+    
     # Initialize Trade Strategist with custom message handler
     trade_strategist = TradeStrategist(
         "Trade_Strategist",
@@ -248,80 +257,13 @@ def main():
         human_input_mode="NEVER"  # Use NEVER mode to prevent auto-reply loops
     )
     
-    # Create a custom message handler for the User_Proxy
-    def custom_message_handler(recipient, messages, sender, config):
-        """Custom message handler to process function execution requests"""
-        if not messages:
-            return False
-        
-        message = messages[-1]
-        content = message.get("content", "")
-        
-        # Check if the message is asking to execute a function
-        if "get_stock_data" in content or "calculate_technical_indicators" in content or "get_company_profile" in content:
-            logger.info(f"Detected function execution request: {content[:100]}...")
-            
-            # Extract function name and parameters
-            if "get_stock_data" in content:
-                try:
-                    # Execute the function
-                    import re
-                    match = re.search(r"get_stock_data\('([^']+)', '([^']+)', '([^']+)'\)", content)
-                    if match:
-                        symbol, start_date, end_date = match.groups()
-                        from finrobot.data_source.yfinance_utils import YFinanceUtils
-                        stock_data = YFinanceUtils.get_stock_data(symbol, start_date, end_date)
-                        
-                        # Send the response back to the assistant
-                        response = f"Here's the stock data for {symbol} from {start_date} to {end_date}:\n{stock_data.head().to_string()}\n...\n{stock_data.tail().to_string()}"
-                        recipient.receive(response, sender)
-                        return True
-                except Exception as e:
-                    recipient.receive(f"Error executing get_stock_data: {str(e)}", sender)
-                    return True
-            
-            if "calculate_technical_indicators" in content:
-                try:
-                    # Execute the function
-                    from finrobot.data_source.yfinance_utils import YFinanceUtils
-                    symbol = trade_strategist.last_symbol if hasattr(trade_strategist, 'last_symbol') else "MSFT"
-                    start_date = (datetime.strptime(current_date, "%Y-%m-%d") - timedelta(days=time_period)).strftime("%Y-%m-%d")
-                    stock_data = YFinanceUtils.get_stock_data(symbol, start_date, current_date)
-                    
-                    # Calculate indicators
-                    indicators = trade_strategist._calculate_technical_indicators(stock_data)
-                    
-                    # Send the response back to the assistant
-                    response = f"Here are the technical indicators for {symbol}:\n{indicators.head().to_string()}\n...\n{indicators.tail().to_string()}"
-                    recipient.receive(response, sender)
-                    return True
-                except Exception as e:
-                    recipient.receive(f"Error executing calculate_technical_indicators: {str(e)}", sender)
-                    return True
-            
-            if "get_company_profile" in content:
-                try:
-                    # Execute the function
-                    import re
-                    match = re.search(r"get_company_profile\('([^']+)'\)", content)
-                    if match:
-                        symbol = match.groups()[0]
-                        from finrobot.data_source.finnhub_utils import FinnHubUtils
-                        profile = FinnHubUtils.get_company_profile(symbol)
-                        
-                        # Send the response back to the assistant
-                        response = f"Here's the company profile for {symbol}:\n{profile}"
-                        recipient.receive(response, sender)
-                        return True
-                except Exception as e:
-                    recipient.receive(f"Error executing get_company_profile: {str(e)}", sender)
-                    return True
-        
-        return False
-    
-    # Set the custom message handler for the User_Proxy
+    # Expose the data tools through native function calling; the model can
+    # request several of them in one turn and they run concurrently
+    tool_registry = build_trade_tools()
+    assistant = getattr(trade_strategist, "assistant", trade_strategist)
     trade_strategist.user_proxy.human_input_mode = "NEVER"
-    trade_strategist.user_proxy.register_reply([custom_message_handler])
+    tool_registry.register_with_agents(assistant, trade_strategist.user_proxy)
+    logger.info(f"Registered tools: {', '.join(tool_registry.names)}")
     
     # Run the selected test(s)
     results = {}
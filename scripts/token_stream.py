@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Streaming token output from agents.
+
+install_streaming() turns on streaming for every autogen LLM call and
+publishes the tokens as they arrive on a TokenStream. Consumers subscribe
+with a callback, or read events from a blocking iterator or an async
+iterator, and can work on a reply before it is complete:
+
+- ConsoleSink prints tokens as they arrive, prefixed with the agent's name.
+  One reply streams live at a time; replies generated concurrently (fan-out
+  runs) are buffered and printed whole when they end.
+- FileSink appends one agent's tokens (or all of them) to a file, flushed
+  per token, so result files grow while the agent is still writing.
+- iterate() / aiterate() hand events to the next pipeline stage or a web
+  handler.
+
+Every event is a dict with "type" ("start", "token" or "end"), "agent",
+"call" (an id shared by the events of one LLM call), "tag" (set with
+tagged(), e.g. a service job id) and "text" (the token, or the whole reply
+for "end"). close() ends all iterators.
+
+autogen streams a completion itself when "stream" is set and prints the
+chunks through its IOStream. Each call gets a per-context IOStream that
+forwards those chunks, so this needs an autogen 0.2 release with
+autogen.io. Streaming is switched off with FINROBOT_STREAM=off.
+
+Usage:
+    stream = install_streaming()            # console output on
+    with stream_to_file("AAPL_analysis.txt", agent="Trade_Strategist"):
+        response = trade_strategist.chat(query)
+"""
+
+import asyncio
+import functools
+import itertools
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+from contextlib import contextmanager
+
+from runtime import current_agent, install_agent_context
+
+logger = logging.getLogger(__name__)
+
+_ANSI_RE = re.compile(r"\x1b\[[0-9;]*m")
+
+
+class TokenStream:
+    """Publishes streamed LLM tokens to callbacks and iterators."""
+
+    def __init__(self):
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._calls = itertools.count(1)
+
+    def subscribe(self, callback):
+        """Call callback(event) for every event from now on; returns callback."""
+        with self._lock:
+            self._callbacks = self._callbacks + [callback]
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._callbacks = [existing for existing in self._callbacks if existing is not callback]
+
+    def new_call(self):
+        return next(self._calls)
+
+    def emit(self, event):
+        # Callbacks run on the thread of the LLM call; a failing consumer must not break the agent
+        for callback in self._callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.warning(f"Stream consumer {callback!r} failed: {e}")
+
+    def close(self):
+        """End every iterator and let sinks release their files."""
+        self.emit({"type": "close", "agent": None, "call": None, "tag": None, "text": ""})
+
+    def iterate(self, agent=None, timeout=None, tag=None):
+        """
+        Blocking iterator over events (optionally of one agent or tag) until close().
+
+        Subscribes immediately, so events emitted after this call are not
+        missed even if iteration starts later. With a timeout, iteration also
+        ends after that many seconds without an event.
+        """
+        events = queue.Queue()
+        callback = self.subscribe(events.put)
+
+        def generate():
+            try:
+                while True:
+                    event = events.get(timeout=timeout)
+                    if event["type"] == "close":
+                        return
+                    if (agent is None or event["agent"] == agent) and (tag is None or event.get("tag") == tag):
+                        yield event
+            except queue.Empty:
+                return
+            finally:
+                self.unsubscribe(callback)
+
+        return generate()
+
+    async def aiterate(self, agent=None):
+        """Async iterator over events (optionally of one agent) until close()."""
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        callback = self.subscribe(lambda event: loop.call_soon_threadsafe(events.put_nowait, event))
+        try:
+            while True:
+                event = await events.get()
+                if event["type"] == "close":
+                    return
+                if agent is None or event["agent"] == agent:
+                    yield event
+        finally:
+            self.unsubscribe(callback)
+
+
+class ConsoleSink:
+    """
+    Prints tokens as they arrive, with the agent's name before each reply.
+
+    One call streams live at a time; tokens of calls running concurrently
+    are buffered and shown once the live call ends (whole if the reply is
+    finished by then, otherwise it becomes the live call), so parallel
+    agents do not interleave token by token.
+    """
+
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+        self._live = None
+        # call -> [agent, buffered parts, finished]
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def _header(self, agent):
+        self.out.write(f"\n[{agent or 'LLM'}] ")
+
+    def _next_live(self):
+        for call in list(self._buffers):
+            agent, parts, finished = self._buffers.pop(call)
+            self._header(agent)
+            self.out.write("".join(parts))
+            if finished:
+                self.out.write("\n")
+            else:
+                self._live = call
+                return
+
+    def __call__(self, event):
+        if event["type"] not in ("token", "end"):
+            return
+        with self._lock:
+            call = event["call"]
+            if event["type"] == "end":
+                if call == self._live:
+                    self.out.write("\n")
+                    self._live = None
+                    self._next_live()
+                elif call in self._buffers:
+                    self._buffers[call][2] = True
+                self.out.flush()
+                return
+            if self._live is None:
+                self._live = call
+                self._header(event["agent"])
+            if call == self._live:
+                self.out.write(event["text"])
+                self.out.flush()
+            else:
+                self._buffers.setdefault(call, [event["agent"], [], False])[1].append(event["text"])
+
+
+class FileSink:
+    """Appends streamed tokens (of one agent, or all) to a file as they arrive."""
+
+    def __init__(self, path, agent=None, mode="w"):
+        self.path = path
+        self.agent = agent
+        self._file = open(path, mode, encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            if self._file is None:
+                return
+            if event["type"] == "close":
+                self.close()
+            elif event["type"] == "token" and (self.agent is None or event["agent"] == self.agent):
+                self._file.write(event["text"])
+                self._file.flush()
+            elif event["type"] == "end" and (self.agent is None or event["agent"] == self.agent) and event["text"]:
+                self._file.write("\n\n")
+                self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class _ForwardingIOStream:
+    """autogen IOStream for one LLM call: printed chunks become token events."""
+
+    def __init__(self, stream, agent, call, fallback, tag=None):
+        self.stream = stream
+        self.agent = agent
+        self.call = call
+        self.fallback = fallback
+        self.tag = tag
+        self.parts = []
+
+    def print(self, *objects, sep=" ", end="\n", flush=False):
+        text = _ANSI_RE.sub("", sep.join(str(obj) for obj in objects) + end)
+        if text:
+            self.parts.append(text)
+            self.stream.emit({"type": "token", "agent": self.agent, "call": self.call, "tag": self.tag, "text": text})
+
+    def input(self, prompt="", *, password=False):
+        return self.fallback.input(prompt, password=password)
+
+
+_stream = None
+_current = threading.local()
+
+
+def get_stream():
+    """Return the installed TokenStream, or None when streaming is off."""
+    return _stream
+
+
+def _patch_autogen(stream):
+    from autogen.io.base import IOStream
+    from autogen.oai.client import OpenAIClient
+
+    install_agent_context()
+    original_client_create = OpenAIClient.create
+
+    @functools.wraps(original_client_create)
+    def client_create(self, params):
+        if params.get("stream") is False or "messages" not in params:
+            return original_client_create(self, params)
+        agent = current_agent()
+        tag = getattr(_current, "tag", None)
+        call = stream.new_call()
+        forward = _ForwardingIOStream(stream, agent, call, IOStream.get_default(), tag)
+        stream.emit({"type": "start", "agent": agent, "call": call, "tag": tag, "text": ""})
+        try:
+            with IOStream.set_default(forward):
+                return original_client_create(self, dict(params, stream=True))
+        finally:
+            stream.emit({"type": "end", "agent": agent, "call": call, "tag": tag, "text": "".join(forward.parts)})
+
+    OpenAIClient.create = client_create
+
+
+def install_streaming(console=True, stream=None):
+    """
+    Stream every autogen LLM call and publish its tokens.
+
+    Must run before agents are created. Reads FINROBOT_STREAM ("off"
+    disables it).
+
+    Parameters:
+    console (bool): Print tokens to stdout as they arrive
+    stream (TokenStream): Stream to publish on (default: a new one)
+
+    Returns:
+    TokenStream: The installed stream, or None when streaming is off
+    """
+    global _stream
+    if _stream is not None:
+        return _stream
+    if os.environ.get("FINROBOT_STREAM", "").lower() in ("off", "0", "false"):
+        return None
+    stream = stream or TokenStream()
+    try:
+        _patch_autogen(stream)
+    except ImportError as e:
+        logger.warning(f"This autogen version cannot stream through IOStream, streaming is off: {e}")
+        return None
+    if console:
+        stream.subscribe(ConsoleSink())
+    _stream = stream
+    return stream
+
+
+@contextmanager
+def tagged(tag):
+    """Tag the events of LLM calls made by this thread while the block runs (e.g. with a job id)."""
+    previous = getattr(_current, "tag", None)
+    _current.tag = tag
+    try:
+        yield
+    finally:
+        _current.tag = previous
+
+
+@contextmanager
+def stream_to_file(path, agent=None):
+    """
+    Write streamed tokens to path while the block runs.
+
+    The file exists and grows from the first token on; callers usually
+    overwrite it with the final reply when the chat returns. Without an
+    installed stream this does nothing.
+    """
+    if _stream is None:
+        yield None
+        return
+    sink = _stream.subscribe(FileSink(path, agent=agent))
+    try:
+        yield sink
+    finally:
+        _stream.unsubscribe(sink)
+        sink.close()
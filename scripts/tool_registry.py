@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Typed tool registry exposed to FinRobot agents through OpenAI function calling.
+
+Instead of asking the User_Proxy in prose and having a message handler
+regex-parse the request, the assistant receives JSON schemas for the tools
+and issues native tool calls. Several tool calls returned in one turn are
+executed concurrently, and results are memoized so repeated calls with the
+same arguments cost nothing; the underlying data comes from the
+process-wide data_cache, so overlapping date ranges are not re-downloaded.
+
+Usage:
+    registry = build_trade_tools()
+    registry.register_with_agents(trade_strategist.assistant, trade_strategist.user_proxy)
+"""
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import autogen
+
+from context_compaction import compact_frame, format_number, TOOL_RESPONSE_TOKEN_BUDGET
+from data_cache import cached_company_profile, cached_stock_data
+from incremental_indicators import update_indicators
+from tracing import get_tracer, trace_span
+from technical_indicators import indicator_frame
+from vector_index import format_hits, get_index
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of tool calls from one turn that run at the same time
+MAX_PARALLEL_TOOL_CALLS = 8
+
+
+class ToolRegistry:
+    """Registry of callable tools with JSON schemas and memoized execution."""
+
+    def __init__(self, cache_size=128):
+        self._tools = {}
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._cache_order = []
+        self.cache_size = cache_size
+
+    def register(self, name, description, parameters, required=None, memoize=True):
+        """
+        Decorator that registers a function as a tool.
+
+        Parameters:
+        name (str): Tool name shown to the model
+        description (str): What the tool does
+        parameters (dict): Map of parameter name to (JSON type, description)
+        required (list): Required parameter names (default: all)
+        memoize (bool): Whether results are cached by arguments
+        """
+        def decorator(func):
+            self._tools[name] = {
+                "func": func,
+                "memoize": memoize,
+                "schema": {
+                    "type": "function",
+                    "function": {
+                        "name": name,
+                        "description": description,
+                        "parameters": {
+                            "type": "object",
+                            "properties": {
+                                param: {"type": param_type, "description": param_description}
+                                for param, (param_type, param_description) in parameters.items()
+                            },
+                            "required": list(parameters) if required is None else required,
+                        },
+                    },
+                },
+            }
+            return func
+        return decorator
+
+    @property
+    def names(self):
+        return list(self._tools)
+
+    def schemas(self):
+        """Return the tool definitions in OpenAI "tools" format."""
+        return [tool["schema"] for tool in self._tools.values()]
+
+    def call(self, name, arguments):
+        """
+        Execute a tool by name.
+
+        Parameters:
+        name (str): Registered tool name
+        arguments (dict or str): Arguments, as a dict or a JSON string
+
+        Returns:
+        str: Tool output (errors are returned as text so the model can react)
+        """
+        return self._execute(name, arguments)[0]
+
+    def _execute(self, name, arguments):
+        """Execute a tool and return (output, served_from_memo)."""
+        if name not in self._tools:
+            return f"Error: unknown tool '{name}'. Available tools: {', '.join(self._tools)}", False
+        if isinstance(arguments, str):
+            try:
+                arguments = json.loads(arguments) if arguments.strip() else {}
+            except json.JSONDecodeError as e:
+                return f"Error: invalid JSON arguments for {name}: {e}", False
+
+        tool = self._tools[name]
+        key = (name, json.dumps(arguments, sort_keys=True, default=str))
+        if tool["memoize"]:
+            with self._lock:
+                if key in self._cache:
+                    return self._cache[key], True
+
+        try:
+            result = tool["func"](**arguments)
+        except Exception as e:
+            logger.error(f"Error executing {name}: {e}")
+            return f"Error executing {name}: {str(e)}", False
+
+        result = result if isinstance(result, str) else str(result)
+        if tool["memoize"]:
+            with self._lock:
+                self._cache[key] = result
+                self._cache_order.append(key)
+                if len(self._cache_order) > self.cache_size:
+                    self._cache.pop(self._cache_order.pop(0), None)
+        return result, False
+
+    def execute_tool_calls(self, tool_calls):
+        """
+        Execute the tool calls of one assistant turn concurrently.
+
+        Parameters:
+        tool_calls (list): OpenAI tool call dicts ({"id", "function": {"name", "arguments"}})
+
+        Returns:
+        list: Tool response messages in the same order as tool_calls
+        """
+        tracer = get_tracer()
+        parent = tracer.current_span() if tracer else None
+        submitted = time.time()
+
+        def run(tool_call):
+            function = tool_call.get("function", {})
+            name = function.get("name", "")
+            with trace_span(name, "tool", parent=parent, queued_at=submitted) as span:
+                output, memo_hit = self._execute(name, function.get("arguments") or "{}")
+                if span is not None:
+                    span.set(cache_hit=memo_hit, result_chars=len(output))
+                return output
+
+        workers = min(MAX_PARALLEL_TOOL_CALLS, max(len(tool_calls), 1))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            outputs = list(pool.map(run, tool_calls))
+
+        return [
+            {"tool_call_id": tool_call.get("id"), "role": "tool", "content": output}
+            for tool_call, output in zip(tool_calls, outputs)
+        ]
+
+    def tool_calls_reply(self, recipient, messages=None, sender=None, config=None):
+        """
+        autogen reply function that answers all tool calls of a turn at once.
+
+        Registered on the executing agent ahead of autogen's own tool reply so
+        that the calls run in parallel; calls to unknown tools are left for
+        autogen to handle.
+        """
+        if not messages:
+            return False, None
+        message = messages[-1]
+        tool_calls = message.get("tool_calls") or []
+        if not tool_calls:
+            return False, None
+        if any(call.get("function", {}).get("name") not in self._tools for call in tool_calls):
+            return False, None
+
+        logger.info(f"Executing {len(tool_calls)} tool call(s): {[c['function']['name'] for c in tool_calls]}")
+        responses = self.execute_tool_calls(tool_calls)
+        return True, {
+            "role": "tool",
+            "tool_responses": responses,
+            "content": "\n\n".join(response["content"] for response in responses),
+        }
+
+    def register_with_agents(self, caller, executor):
+        """
+        Expose the tools to caller's LLM and execute them on executor.
+
+        Parameters:
+        caller (ConversableAgent): Agent whose LLM decides which tools to call
+        executor (ConversableAgent): Agent that runs the tools (e.g. the User_Proxy)
+        """
+        for schema in self.schemas():
+            caller.update_tool_signature(schema, is_remove=False)
+
+        executor.register_function({name: self._caller(name) for name in self._tools})
+        executor.register_reply([autogen.Agent, None], self.tool_calls_reply, position=0)
+
+    def _caller(self, name):
+        """Return a keyword-argument function that calls the named tool."""
+        def call(**kwargs):
+            return self.call(name, kwargs)
+        call.__name__ = name
+        return call
+
+
+def build_trade_tools(indicator_func=indicator_frame, registry=None):
+    """
+    Build the registry used by the Trade Strategist.
+
+    Parameters:
+    indicator_func (callable): Maps an OHLCV DataFrame to an indicator
+        DataFrame (default: technical_indicators.indicator_frame)
+    registry (ToolRegistry): Registry to add the tools to (default: new one)
+
+    Returns:
+    ToolRegistry: Registry with get_stock_data, calculate_technical_indicators,
+    get_latest_indicators and get_company_profile
+    """
+    registry = registry or ToolRegistry()
+    date_range = {
+        "symbol": ("string", "Stock ticker symbol, e.g. AAPL"),
+        "start_date": ("string", "Start date in YYYY-MM-DD format"),
+        "end_date": ("string", "End date in YYYY-MM-DD format"),
+    }
+
+    @registry.register(
+        "get_stock_data",
+        "Get daily OHLCV price history for a stock as summary statistics plus the most recent rows.",
+        date_range,
+    )
+    def get_stock_data(symbol, start_date, end_date):
+        stock_data = cached_stock_data(symbol, start_date, end_date)
+        return f"Stock data for {symbol} from {start_date} to {end_date}:\n{compact_frame(stock_data, TOOL_RESPONSE_TOKEN_BUDGET)}"
+
+    @registry.register(
+        "calculate_technical_indicators",
+        "Calculate technical indicators (SMA, EMA, RSI, MACD, Bollinger Bands, ATR, OBV) for a stock over a date range. "
+        "Fetches the price data itself; there is no need to call get_stock_data first.",
+        date_range,
+    )
+    def calculate_technical_indicators(symbol, start_date, end_date):
+        stock_data = cached_stock_data(symbol, start_date, end_date)
+        indicators = indicator_func(stock_data)
+        return f"Technical indicators for {symbol} from {start_date} to {end_date}:\n{compact_frame(indicators, TOOL_RESPONSE_TOKEN_BUDGET)}"
+
+    @registry.register(
+        "get_latest_indicators",
+        "Get only the latest value of each technical indicator (EMA, RSI, MACD, Bollinger Bands, ATR) for a stock. "
+        "Cheaper than calculate_technical_indicators when the history is not needed.",
+        date_range,
+    )
+    def get_latest_indicators(symbol, start_date, end_date):
+        stock_data = cached_stock_data(symbol, start_date, end_date)
+        indicators = update_indicators(symbol, stock_data)
+        values = " ".join(f"{name}={format_number(value)}" for name, value in indicators.values().items() if value is not None)
+        return f"Latest indicators for {symbol} as of {indicators.last_timestamp[:10]}: {values}"
+
+    @registry.register(
+        "get_company_profile",
+        "Get the company profile (name, industry, market cap, exchange, IPO date) for a stock.",
+        {"symbol": ("string", "Stock ticker symbol, e.g. AAPL")},
+    )
+    def get_company_profile(symbol):
+        return f"Company profile for {symbol}:\n{cached_company_profile(symbol)}"
+
+    return registry
+
+
+def build_rag_tools(index=None, registry=None):
+    """
+    Build the registry used by the RAG agent.
+
+    Parameters:
+    index (VectorIndex): Index to search (default: vector_index.get_index())
+    registry (ToolRegistry): Registry to add the tools to (default: new one)
+
+    Returns:
+    ToolRegistry: Registry with search_documents and get_company_profile
+    """
+    registry = registry or ToolRegistry()
+
+    # Not memoized: the index grows while the service is running
+    @registry.register(
+        "search_documents",
+        "Search the local index of 10-K filings and company news for passages relevant to a question. "
+        "Use it before fetching data; optionally restrict to a ticker, a source (filing or news) or a date range.",
+        {
+            "query": ("string", "What to look for, in natural language"),
+            "symbol": ("string", "Stock ticker symbol, e.g. AAPL (optional)"),
+            "source": ("string", "filing or news (optional)"),
+            "start_date": ("string", "Earliest document date in YYYY-MM-DD format (optional)"),
+            "end_date": ("string", "Latest document date in YYYY-MM-DD format (optional)"),
+        },
+        required=["query"],
+        memoize=False,
+    )
+    def search_documents(query, symbol=None, source=None, start_date=None, end_date=None):
+        hits = (index or get_index()).search(query, k=5, symbol=symbol, source=source, start_date=start_date, end_date=end_date)
+        if not hits:
+            return f"No indexed documents match '{query}'."
+        return f"Top passages for '{query}':\n{format_hits(hits)}"
+
+    @registry.register(
+        "get_company_profile",
+        "Get the company profile (name, industry, market cap, exchange, IPO date) for a stock.",
+        {"symbol": ("string", "Stock ticker symbol, e.g. AAPL")},
+    )
+    def get_company_profile(symbol):
+        return f"Company profile for {symbol}:\n{cached_company_profile(symbol)}"
+
+    return registry
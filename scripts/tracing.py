@@ -0,0 +1,402 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Span tracing for agent conversations: LLM calls, tool executions and chats.
+
+install_tracing() patches autogen so that every chat (including nested
+chats), every LLM reply turn, every OpenAIWrapper.create call and every
+function execution is recorded as a span with wall time, queueing delay
+(time waiting for a worker thread, or for rate-limit quota in
+llm_rate_limit), prompt/completion tokens, cache hits and model name. Spans are written on
+exit as JSONL (one span per line) or, for paths ending in .json, as an
+OpenTelemetry OTLP/JSON trace file.
+
+Tracing is enabled by setting FINROBOT_TRACE to the output path:
+
+    FINROBOT_TRACE=workflow_trace.jsonl python run_investment_workflow.py
+    python tracing.py workflow_trace.jsonl --top 10
+"""
+
+import argparse
+import atexit
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+import runtime
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """One timed operation; attributes are filled in while it runs."""
+
+    def __init__(self, tracer, name, kind, parent_id=None, queued_at=None, **attributes):
+        self.tracer = tracer
+        self.trace_id = tracer.trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time()
+        self.end = None
+        self.queue_ms = round((self.start - queued_at) * 1000, 3) if queued_at else 0.0
+        self.status = "ok"
+        self.error = None
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def add_queue(self, seconds):
+        """Count time spent waiting inside the span (e.g. for rate-limit quota) as queueing delay."""
+        self.queue_ms = round(self.queue_ms + seconds * 1000, 3)
+
+    @property
+    def wall_ms(self):
+        return round(((self.end or time.time()) - self.start) * 1000, 3)
+
+    def to_dict(self):
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "end": self.end,
+            "wall_ms": self.wall_ms,
+            "queue_ms": self.queue_ms,
+            "status": self.status,
+        }
+        if self.error:
+            record["error"] = self.error
+        record.update(self.attributes)
+        return record
+
+
+class Tracer:
+    """Collects spans for one process run; parents are tracked per thread."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.trace_id = uuid.uuid4().hex
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def current_span(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def current_agent(self):
+        """The replying agent (runtime.current_agent), else the nearest agent on this thread's spans."""
+        if runtime.current_agent():
+            return runtime.current_agent()
+        for span in reversed(self._stack()):
+            if span.attributes.get("agent"):
+                return span.attributes["agent"]
+        return None
+
+    @contextmanager
+    def span(self, name, kind, parent=None, queued_at=None, **attributes):
+        """
+        Record a span around the enclosed block.
+
+        Parameters:
+        name (str): Span name (tool name, "chat A -> B", ...)
+        kind (str): "chat", "turn", "llm" or "tool"
+        parent (Span): Explicit parent, for work handed to another thread
+        queued_at (float): time.time() when the work was submitted
+        """
+        parent = parent or self.current_span()
+        if "agent" not in attributes and parent is not None:
+            attributes["agent"] = parent.attributes.get("agent") or self.current_agent()
+        span = Span(self, name, kind, parent.span_id if parent else None, queued_at, **attributes)
+        stack = self._stack()
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end = time.time()
+            stack.pop()
+            with self._lock:
+                self.spans.append(span)
+
+    def export(self, path=None):
+        """Write the spans to path (JSONL, or OTLP/JSON for .json paths)."""
+        path = path or self.path
+        if not path:
+            return None
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        if path.endswith(".json"):
+            with open(path, "w") as f:
+                json.dump(to_otlp(spans), f)
+        else:
+            with open(path, "w") as f:
+                for span in spans:
+                    f.write(json.dumps(span.to_dict(), default=str) + "\n")
+        logger.info(f"Wrote {len(spans)} spans to {path}")
+        return path
+
+
+def to_otlp(spans, service_name="finrobot"):
+    """Convert spans to the OTLP/JSON export format."""
+    def attribute(key, value):
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    otlp_spans = []
+    for span in spans:
+        attributes = dict(span.attributes, kind=span.kind, queue_ms=span.queue_ms)
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 3 if span.kind == "llm" else 1,
+            "startTimeUnixNano": str(int(span.start * 1e9)),
+            "endTimeUnixNano": str(int((span.end or span.start) * 1e9)),
+            "attributes": [attribute(k, v) for k, v in attributes.items() if v is not None],
+            "status": {"code": 2, "message": span.error} if span.status == "error" else {"code": 1},
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        otlp_spans.append(otlp_span)
+
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [attribute("service.name", service_name)]},
+            "scopeSpans": [{"scope": {"name": "finrobot.tracing"}, "spans": otlp_spans}],
+        }]
+    }
+
+
+_tracer = None
+
+
+def get_tracer():
+    """Return the installed tracer, or None when tracing is off."""
+    return _tracer
+
+
+@contextmanager
+def trace_span(name, kind, **kwargs):
+    """Span on the installed tracer; a no-op yielding None when tracing is off."""
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.span(name, kind, **kwargs) as span:
+        yield span
+
+
+def add_queue_time(seconds):
+    """Add seconds of waiting to the current span's queueing delay; does nothing when tracing is off."""
+    span = _tracer.current_span() if _tracer is not None else None
+    if span is not None:
+        span.add_queue(seconds)
+
+
+def _usage_totals(summary):
+    if not summary:
+        return 0
+    return sum(v.get("prompt_tokens", 0) + v.get("completion_tokens", 0) for v in summary.values() if isinstance(v, dict))
+
+
+def _patch_autogen(tracer):
+    import autogen
+    from autogen import ConversableAgent, OpenAIWrapper
+
+    runtime.install_agent_context()
+    original_create = OpenAIWrapper.create
+    original_generate = ConversableAgent.generate_oai_reply
+    original_execute = ConversableAgent.execute_function
+    original_initiate = ConversableAgent.initiate_chat
+
+    @functools.wraps(original_create)
+    def create(self, **config):
+        actual_before = _usage_totals(getattr(self, "actual_usage_summary", None))
+        with tracer.span("chat.completions", "llm") as span:
+            response = original_create(self, **config)
+            usage = getattr(response, "usage", None)
+            actual_after = _usage_totals(getattr(self, "actual_usage_summary", None))
+            span.set(
+                model=getattr(response, "model", None) or config.get("model"),
+                prompt_tokens=getattr(usage, "prompt_tokens", None),
+                completion_tokens=getattr(usage, "completion_tokens", None),
+                # autogen only adds to the actual usage for responses that were not served from its cache
+                cache_hit=actual_after == actual_before if hasattr(self, "actual_usage_summary") else None,
+                messages=len(config.get("messages") or []),
+            )
+            return response
+
+    @functools.wraps(original_generate)
+    def generate_oai_reply(self, messages=None, sender=None, config=None):
+        with tracer.span(f"turn {self.name}", "turn", agent=self.name):
+            return original_generate(self, messages=messages, sender=sender, config=config)
+
+    @functools.wraps(original_execute)
+    def execute_function(self, func_call, *args, **kwargs):
+        name = func_call.get("name", "") if isinstance(func_call, dict) else ""
+        with tracer.span(name, "tool", agent=self.name) as span:
+            success, result = original_execute(self, func_call, *args, **kwargs)
+            span.set(success=bool(success), result_chars=len(str(result.get("content", ""))) if isinstance(result, dict) else None)
+            return success, result
+
+    @functools.wraps(original_initiate)
+    def initiate_chat(self, recipient, *args, **kwargs):
+        with tracer.span(f"chat {self.name} -> {recipient.name}", "chat", agent=self.name, recipient=recipient.name):
+            return original_initiate(self, recipient, *args, **kwargs)
+
+    OpenAIWrapper.create = create
+    ConversableAgent.generate_oai_reply = generate_oai_reply
+    ConversableAgent.execute_function = execute_function
+    ConversableAgent.initiate_chat = initiate_chat
+    logger.info(f"Tracing autogen {getattr(autogen, '__version__', '')} calls")
+
+
+def install_tracing(path=None):
+    """
+    Start tracing if path (or FINROBOT_TRACE) is set; export on exit.
+
+    Must run before agents are constructed, because autogen registers
+    generate_oai_reply when an agent is created.
+
+    Returns:
+    Tracer: The installed tracer, or None when tracing is off
+    """
+    global _tracer
+    path = path or os.environ.get("FINROBOT_TRACE")
+    if not path:
+        return None
+    if _tracer is not None:
+        return _tracer
+
+    tracer = Tracer(path)
+    try:
+        _patch_autogen(tracer)
+    except ImportError as e:
+        logger.warning(f"autogen not available, only explicit spans are traced: {e}")
+    _tracer = tracer
+    atexit.register(tracer.export)
+    return tracer
+
+
+def load_spans(path):
+    """Load spans from a JSONL or OTLP/JSON trace file as dicts."""
+    with open(path) as f:
+        if not path.endswith(".json"):
+            return [json.loads(line) for line in f if line.strip()]
+        data = json.load(f)
+
+    spans = []
+    for resource in data.get("resourceSpans", []):
+        for scope in resource.get("scopeSpans", []):
+            for span in scope.get("spans", []):
+                attributes = {}
+                for item in span.get("attributes", []):
+                    value = next(iter(item["value"].values()))
+                    attributes[item["key"]] = int(value) if "intValue" in item["value"] else value
+                start = int(span["startTimeUnixNano"]) / 1e9
+                end = int(span["endTimeUnixNano"]) / 1e9
+                spans.append(dict(
+                    attributes,
+                    name=span["name"],
+                    span_id=span["spanId"],
+                    parent_id=span.get("parentSpanId"),
+                    start=start,
+                    end=end,
+                    wall_ms=(end - start) * 1000,
+                ))
+    return spans
+
+
+def summarize(spans, top=10):
+    """Return a text report: totals, slowest LLM turns, tokens per agent, tool time."""
+    if not spans:
+        return "No spans recorded."
+
+    lines = []
+    start = min(span["start"] for span in spans)
+    end = max(span["end"] or span["start"] for span in spans)
+    llm_spans = [span for span in spans if span.get("kind") == "llm"]
+    tool_spans = [span for span in spans if span.get("kind") == "tool"]
+    lines.append(
+        f"Trace: {len(spans)} spans over {end - start:.2f}s; {len(llm_spans)} LLM calls "
+        f"({sum(s['wall_ms'] for s in llm_spans) / 1000:.2f}s, of which "
+        f"{sum(s.get('queue_ms') or 0 for s in llm_spans) / 1000:.2f}s queued for rate limits), {len(tool_spans)} tool calls "
+        f"({sum(s['wall_ms'] for s in tool_spans) / 1000:.2f}s)"
+    )
+
+    lines.append(f"\nSlowest {min(top, len(llm_spans))} LLM calls:")
+    for span in sorted(llm_spans, key=lambda s: s["wall_ms"], reverse=True)[:top]:
+        lines.append(
+            f"  {span['wall_ms'] / 1000:8.2f}s  {span.get('agent') or '-':<24} {span.get('model') or '-':<16} "
+            f"queued={(span.get('queue_ms') or 0) / 1000:<6.2f} "
+            f"prompt={span.get('prompt_tokens') or 0:<7} completion={span.get('completion_tokens') or 0:<6}"
+            f"{' (cached)' if span.get('cache_hit') else ''}"
+        )
+
+    per_agent = defaultdict(lambda: {"calls": 0, "prompt": 0, "completion": 0, "seconds": 0.0, "queue": 0.0})
+    for span in llm_spans:
+        totals = per_agent[span.get("agent") or "-"]
+        totals["calls"] += 1
+        totals["prompt"] += span.get("prompt_tokens") or 0
+        totals["completion"] += span.get("completion_tokens") or 0
+        totals["seconds"] += span["wall_ms"] / 1000
+        totals["queue"] += (span.get("queue_ms") or 0) / 1000
+    lines.append("\nTokens per agent:")
+    for agent, totals in sorted(per_agent.items(), key=lambda item: -(item[1]["prompt"] + item[1]["completion"])):
+        lines.append(
+            f"  {agent:<24} calls={totals['calls']:<4} prompt={totals['prompt']:<8} "
+            f"completion={totals['completion']:<7} llm_time={totals['seconds']:.2f}s queued={totals['queue']:.2f}s"
+        )
+
+    per_tool = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "queue": 0.0, "hits": 0})
+    for span in tool_spans:
+        totals = per_tool[span["name"]]
+        totals["calls"] += 1
+        totals["seconds"] += span["wall_ms"] / 1000
+        totals["queue"] += (span.get("queue_ms") or 0) / 1000
+        totals["hits"] += bool(span.get("cache_hit"))
+    if per_tool:
+        lines.append("\nTool time:")
+        for name, totals in sorted(per_tool.items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(
+                f"  {name:<32} calls={totals['calls']:<4} time={totals['seconds']:.2f}s "
+                f"queued={totals['queue']:.2f}s cache_hits={totals['hits']}"
+            )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a FinRobot trace file")
+    parser.add_argument("trace", help="Trace file written with FINROBOT_TRACE (.jsonl or OTLP .json)")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest LLM calls to show")
+    args = parser.parse_args()
+    print(summarize(load_spans(args.trace), args.top))
+
+
+if __name__ == "__main__":
+    main()
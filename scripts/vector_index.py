@@ -0,0 +1,484 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Local vector index for retrieval over filings, news and transcripts.
+
+Chunks are embedded by a pluggable local embedder (the default hashing
+embedder needs no model download or network) and stored in an append-only,
+memory-mapped float32 matrix. The symbol, date and source of every chunk
+are kept in a parallel memory-mapped record array so metadata filters are
+vectorized, and chunk texts live in SQLite. An IVF index (spherical k-means
+centroids plus inverted lists) restricts a query to the few lists nearest
+to it; rows added after the index was trained are assigned to their
+nearest list and scanned as a small tail until the next retrain.
+
+Because everything is read through np.memmap, several processes (agent
+service workers, runner scripts) share the same page cache instead of
+each loading the matrix. Files that are rewritten (the IVF lists) are
+never changed in place: a retrain writes a new version under new names
+and then swaps the manifest, so readers keep a consistent mapping.
+
+Usage:
+    index = VectorIndex("vector_index")
+    index.add(["Revenue grew 8% ..."], [{"symbol": "AAPL", "date": "2024-11-01", "source": "filing"}])
+    hits = index.search("iPhone revenue growth", k=5, symbol="AAPL")
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
+
+from atomic_file import atomic_write
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = os.path.join(os.environ.get("FINROBOT_CACHE_DIR", "."), "vector_index")
+DEFAULT_DIM = 256
+DEFAULT_NPROBE = 8
+# Below this many rows a brute-force scan is as fast as IVF
+IVF_MIN_ROWS = 20000
+# Retrain once rows added since training exceed this fraction of the trained rows
+IVF_RETRAIN_FRACTION = 0.5
+KMEANS_SAMPLE = 100000
+KMEANS_ITERATIONS = 10
+SCAN_BLOCK_ROWS = 65536
+
+IVF_FILES = ("centroids", "order", "offsets")
+
+META_DTYPE = np.dtype([("symbol", "<i4"), ("date", "<i4"), ("source", "<i4"), ("list", "<i4")])
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9.%$-]*[a-z0-9%]|[a-z0-9]")
+
+
+@lru_cache(maxsize=1 << 20)
+def _feature_hash(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class HashingEmbedder:
+    """
+    Signed feature hashing of unigrams and bigrams with log term frequency.
+
+    Deterministic across processes and machines, so vectors written by one
+    run can be queried by another. Any object with a name, a dim and an
+    embed(texts) -> float32 array of L2-normalized rows can replace it.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim=DEFAULT_DIM):
+        self.dim = dim
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            tokens = [token for token in _TOKEN_RE.findall(text.lower()) if len(token) > 1]
+            features = Counter(tokens)
+            features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+            row = vectors[i]
+            for feature, count in features.items():
+                h = _feature_hash(feature)
+                row[h % self.dim] += (1.0 + math.log(count)) * (1.0 if h >> 63 else -1.0)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+def date_key(value):
+    """Encode a date (YYYY-MM-DD, datetime or None) as an int YYYYMMDD; 0 when unknown."""
+    if not value:
+        return 0
+    if hasattr(value, "strftime"):
+        value = value.strftime("%Y-%m-%d")
+    digits = str(value)[:10].replace("-", "")
+    return int(digits) if digits.isdigit() and len(digits) == 8 else 0
+
+
+def spherical_kmeans(vectors, n_clusters, iterations=KMEANS_ITERATIONS, seed=0):
+    """Cluster L2-normalized rows by cosine similarity; returns normalized centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = ~sums.any(axis=1)
+        # Re-seed empty clusters from random rows so every list stays in use
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+    return centroids.astype(np.float32)
+
+
+class VectorIndex:
+    """Memory-mapped vector store with an IVF index and metadata filters."""
+
+    def __init__(self, directory=None, embedder=None):
+        self.directory = directory or os.environ.get("FINROBOT_VECTOR_INDEX", DEFAULT_INDEX_DIR)
+        os.makedirs(self.directory, exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        manifest = self._read_manifest()
+        self.embedder = embedder or HashingEmbedder(manifest.get("dim", DEFAULT_DIM))
+        if manifest.get("count") and (manifest["dim"], manifest["embedder"]) != (self.embedder.dim, self.embedder.name):
+            raise ValueError(
+                f"Index in {self.directory} was built with {manifest['embedder']} (dim {manifest['dim']}), "
+                f"not {self.embedder.name} (dim {self.embedder.dim})"
+            )
+        self._loaded_count = -1
+        self._loaded_trained = -1
+        self.refresh()
+
+    # -- files -----------------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_manifest(self):
+        try:
+            with open(self._path("manifest.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _ivf_path(self, manifest, name):
+        """Path of one IVF array of the version the manifest points to."""
+        version = manifest.get("ivf_version")
+        return self._path(f"ivf_{name}.{version}.npy" if version else f"ivf_{name}.npy")
+
+    def _save_array(self, path, array):
+        with atomic_write(path) as f:
+            np.save(f, array)
+
+    def _write_manifest(self, manifest):
+        with atomic_write(self._path("manifest.json"), "w") as f:
+            json.dump(manifest, f)
+
+    def _db(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path("docs.db"), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS docs (id INTEGER PRIMARY KEY, doc_id TEXT, source TEXT, "
+                "symbol TEXT, date TEXT, text TEXT NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _writer(self):
+        """Serialize writers across threads and processes (re-entrant within a thread)."""
+        if getattr(self._local, "writing", False):
+            yield
+            return
+        with self._write_lock, open(self._path("write.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._local.writing = True
+            try:
+                yield
+            finally:
+                self._local.writing = False
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def write_lock(self):
+        """
+        Context manager holding the index's writer lock across several calls.
+
+        Callers that check what is stored and then append (e.g. ingestion
+        deduplication) hold it so another process cannot append the same
+        rows in between; add() and add_vectors() inside it do not block.
+        """
+        return self._writer()
+
+    def refresh(self):
+        """Re-map the files if another process (or this one) appended rows or retrained."""
+        manifest = self._read_manifest()
+        count = manifest.get("count", 0)
+        trained = (manifest.get("trained_rows", 0), manifest.get("ivf_version"))
+        if count == self._loaded_count and trained == self._loaded_trained:
+            return
+        self.manifest = manifest
+        self.count = count
+        self.symbols = manifest.get("symbols", [])
+        self.sources = manifest.get("sources", [])
+        self._symbol_codes = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._source_codes = {source: i for i, source in enumerate(self.sources)}
+        if count:
+            self.vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r", shape=(count, self.embedder.dim))
+            self.meta = np.memmap(self._path("meta.bin"), dtype=META_DTYPE, mode="r", shape=(count,))
+        else:
+            self.vectors = np.zeros((0, self.embedder.dim), dtype=np.float32)
+            self.meta = np.zeros(0, dtype=META_DTYPE)
+        if trained[0]:
+            self.centroids = np.load(self._ivf_path(manifest, "centroids"))
+            self.list_order = np.load(self._ivf_path(manifest, "order"), mmap_mode="r")
+            self.list_offsets = np.load(self._ivf_path(manifest, "offsets"))
+        else:
+            self.centroids = self.list_order = self.list_offsets = None
+        self.trained_rows = trained[0]
+        self._loaded_count = count
+        self._loaded_trained = trained
+
+    # -- writes ----------------------------------------------------------
+
+    def add(self, texts, metadatas=None):
+        """
+        Embed and append chunks.
+
+        Parameters:
+        texts (list): Chunk texts
+        metadatas (list): Per-chunk dicts with optional symbol, date
+            (YYYY-MM-DD), source (e.g. "filing", "news", "transcript") and doc_id
+
+        Returns:
+        list: Row ids of the added chunks
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.add_vectors(self.embedder.embed(texts), texts, metadatas)
+
+    def add_vectors(self, vectors, texts, metadatas=None):
+        """Append pre-computed embeddings (rows L2-normalized) with their texts and metadata."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        if not (len(vectors) == len(texts) == len(metadatas)):
+            raise ValueError("vectors, texts and metadatas must have the same length")
+        if vectors.shape[1] != self.embedder.dim:
+            raise ValueError(f"Expected {self.embedder.dim}-dimensional vectors, got {vectors.shape[1]}")
+
+        with self._writer():
+            manifest = self._read_manifest()
+            count = manifest.get("count", 0)
+            symbols = manifest.get("symbols", [])
+            sources = manifest.get("sources", [])
+            symbol_codes = {symbol: i for i, symbol in enumerate(symbols)}
+            source_codes = {source: i for i, source in enumerate(sources)}
+
+            meta = np.zeros(len(vectors), dtype=META_DTYPE)
+            for i, metadata in enumerate(metadatas):
+                symbol = (metadata.get("symbol") or "").upper()
+                source = metadata.get("source") or ""
+                if symbol not in symbol_codes:
+                    symbol_codes[symbol] = len(symbols)
+                    symbols.append(symbol)
+                if source not in source_codes:
+                    source_codes[source] = len(sources)
+                    sources.append(source)
+                meta[i] = (symbol_codes[symbol], date_key(metadata.get("date")), source_codes[source], -1)
+            if manifest.get("trained_rows"):
+                centroids = np.load(self._ivf_path(manifest, "centroids"))
+                meta["list"] = np.argmax(vectors @ centroids.T, axis=1)
+
+            # Drop bytes a crashed writer appended past the recorded count
+            for name, row_bytes, data in (("vectors.f32", vectors.shape[1] * 4, vectors), ("meta.bin", META_DTYPE.itemsize, meta)):
+                with open(self._path(name), "ab") as f:
+                    f.truncate(count * row_bytes)
+                    f.write(data.tobytes())
+
+            ids = list(range(count, count + len(vectors)))
+            conn = self._db()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO docs (id, doc_id, source, symbol, date, text) VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (row_id, m.get("doc_id"), m.get("source"), (m.get("symbol") or "").upper() or None, m.get("date"), text)
+                        for row_id, m, text in zip(ids, metadatas, texts)
+                    ],
+                )
+            manifest.update(
+                count=count + len(vectors), dim=self.embedder.dim, embedder=self.embedder.name,
+                symbols=symbols, sources=sources,
+            )
+            self._write_manifest(manifest)
+
+            trained = manifest.get("trained_rows", 0)
+            total = manifest["count"]
+            if total >= IVF_MIN_ROWS and (not trained or total - trained > IVF_RETRAIN_FRACTION * trained):
+                self._train(manifest)
+        self.refresh()
+        return ids
+
+    def build_ivf(self, n_lists=None):
+        """(Re)train the IVF index over all rows."""
+        with self._writer():
+            self._train(self._read_manifest(), n_lists)
+        self.refresh()
+
+    def _train(self, manifest, n_lists=None):
+        count = manifest.get("count", 0)
+        if not count:
+            return
+        vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r", shape=(count, self.embedder.dim))
+        n_lists = n_lists or int(min(max(1, 4 * math.sqrt(count)), 65536, count))
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(count, min(count, max(KMEANS_SAMPLE, 40 * n_lists)), replace=False))
+        centroids = spherical_kmeans(np.asarray(vectors[sample_rows]), n_lists)
+
+        meta = np.memmap(self._path("meta.bin"), dtype=META_DTYPE, mode="r+", shape=(count,))
+        for start in range(0, count, SCAN_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SCAN_BLOCK_ROWS])
+            meta["list"][start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        meta.flush()
+        lists = np.asarray(meta["list"])
+        order = np.argsort(lists, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=n_lists))]).astype(np.int64)
+
+        # Readers may have the current version mapped: write a new one and switch the manifest to it
+        previous = manifest.get("ivf_version") or 0
+        manifest["ivf_version"] = previous + 1
+        for name, array in zip(IVF_FILES, (centroids, order, offsets)):
+            self._save_array(self._ivf_path(manifest, name), array)
+        manifest["trained_rows"] = count
+        self._write_manifest(manifest)
+        # Keep the previous version for readers that read the old manifest but have not opened it yet
+        for version in range(previous - 1, -1, -1):
+            stale = [self._ivf_path({"ivf_version": version}, name) for name in IVF_FILES]
+            if not any(os.path.exists(path) for path in stale):
+                break
+            for path in stale:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        logger.info(f"Trained IVF index with {n_lists} lists over {count} rows")
+
+    # -- reads -----------------------------------------------------------
+
+    def _filter_mask(self, meta, symbol, source, start_date, end_date):
+        mask = np.ones(len(meta), dtype=bool)
+        if symbol:
+            code = self._symbol_codes.get(symbol.upper())
+            if code is None:
+                return np.zeros(len(meta), dtype=bool)
+            mask &= meta["symbol"] == code
+        if source:
+            code = self._source_codes.get(source)
+            if code is None:
+                return np.zeros(len(meta), dtype=bool)
+            mask &= meta["source"] == code
+        if start_date:
+            mask &= meta["date"] >= date_key(start_date)
+        if end_date:
+            mask &= meta["date"] <= date_key(end_date)
+        return mask
+
+    def _candidates(self, query_vector, nprobe):
+        """Row ids in the nprobe lists nearest to the query, including untrained tail rows."""
+        list_scores = self.centroids @ query_vector
+        nprobe = min(nprobe, len(list_scores))
+        probe = np.argpartition(-list_scores, nprobe - 1)[:nprobe]
+        rows = [self.list_order[self.list_offsets[l]:self.list_offsets[l + 1]] for l in probe]
+        if self.count > self.trained_rows:
+            tail = np.asarray(self.meta["list"][self.trained_rows:])
+            rows.append(self.trained_rows + np.flatnonzero(np.isin(tail, probe)))
+        return np.sort(np.concatenate(rows))
+
+    def _score_rows(self, query_vector, rows, k):
+        if not len(rows):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        scores = np.asarray(self.vectors[rows]) @ query_vector
+        top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return rows[top], scores[top]
+
+    def _scan(self, query_vector, k, filters):
+        """Exact search over all rows passing the filters, block by block."""
+        best_rows, best_scores = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        for start in range(0, self.count, SCAN_BLOCK_ROWS):
+            meta = self.meta[start:start + SCAN_BLOCK_ROWS]
+            rows = start + np.flatnonzero(self._filter_mask(meta, *filters))
+            block_rows, block_scores = self._score_rows(query_vector, rows, k)
+            best_rows = np.concatenate([best_rows, block_rows])
+            best_scores = np.concatenate([best_scores, block_scores])
+        order = np.argsort(-best_scores)[:k]
+        return best_rows[order], best_scores[order]
+
+    def search(self, query, k=5, symbol=None, source=None, start_date=None, end_date=None, nprobe=DEFAULT_NPROBE):
+        """
+        Return the k chunks most similar to query.
+
+        Parameters:
+        query (str): Query text
+        k (int): Number of results
+        symbol (str): Only chunks for this ticker
+        source (str): Only chunks from this source (e.g. "news")
+        start_date, end_date (str): Inclusive YYYY-MM-DD date bounds
+        nprobe (int): IVF lists searched; higher is slower and more exact
+
+        Returns:
+        list: Dicts with id, score, text, symbol, date, source and doc_id
+        """
+        self.refresh()
+        if not self.count:
+            return []
+        query_vector = self.embedder.embed([query])[0]
+        filters = (symbol, source, start_date, end_date)
+
+        rows = scores = None
+        if self.centroids is not None:
+            candidates = self._candidates(query_vector, nprobe)
+            candidates = candidates[self._filter_mask(self.meta[candidates], *filters)]
+            rows, scores = self._score_rows(query_vector, candidates, k)
+        if rows is None or (len(rows) < k and any(filters)):
+            # Selective filters can leave the probed lists short of k matches
+            rows, scores = self._scan(query_vector, k, filters)
+        return self._fetch(rows, scores)
+
+    def _fetch(self, rows, scores):
+        if not len(rows):
+            return []
+        ids = [int(row) for row in rows]
+        placeholders = ", ".join("?" * len(ids))
+        docs = {
+            row[0]: row
+            for row in self._db().execute(
+                f"SELECT id, doc_id, source, symbol, date, text FROM docs WHERE id IN ({placeholders})", ids
+            )
+        }
+        results = []
+        for row_id, score in zip(ids, scores):
+            if row_id not in docs:
+                continue
+            _, doc_id, source, symbol, date, text = docs[row_id]
+            results.append({
+                "id": row_id, "score": float(score), "text": text, "symbol": symbol,
+                "date": date, "source": source, "doc_id": doc_id,
+            })
+        return results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Return the process-wide index in FINROBOT_VECTOR_INDEX (or FINROBOT_CACHE_DIR/vector_index)."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = VectorIndex()
+        return _index
+
+
+def format_hits(hits, max_chars=600):
+    """Render search results as a compact prompt block."""
+    lines = []
+    for hit in hits:
+        label = " ".join(part for part in (hit["symbol"], hit["source"], hit["date"]) if part)
+        text = hit["text"] if len(hit["text"]) <= max_chars else hit["text"][:max_chars].rstrip() + " ..."
+        lines.append(f"[{label} | score {hit['score']:.2f}] {text}")
+    return "\n\n".join(lines)